@@ -5,6 +5,11 @@ from tabs.video_ui import create_video_tab
 from tabs.tracking_ui import create_tracking_tab
 from tabs.results_ui import create_results_tab
 from tabs.management_ui import create_management_tab
+from logic.tracker import preload_tracker
+from logic.job_queue import job_queue
+from logic.catalog import catalog
+from logic.run_metrics import start_metrics_server
+from config import PRELOAD_MODEL, METRICS_PORT
 
 def get_wsl_ip():
     """Helper to get the WSL2 IP address"""
@@ -49,6 +54,19 @@ def main():
         create_results_tab(username_state, project_dir_state)
         create_management_tab(username_state)
         
+    # Index the projects already on disk the first time (see the Project Management tab to rebuild)
+    if catalog.is_empty():
+        catalog.rebuild()
+    
+    # Warm up SAM2 in the background; the UI is usable while it loads
+    if PRELOAD_MODEL:
+        preload_tracker()
+    # Tracking jobs run in background workers (queued jobs resume after a restart)
+    job_queue.start()
+    # Per-stage timings and peak memory for scraping (see logic/run_metrics.py)
+    if METRICS_PORT:
+        start_metrics_server()
+    
     # Launch the application
     ip = get_wsl_ip()
     # print(f"[INFO] Launching Gradio app at http://{ip}:7860")
@@ -0,0 +1,193 @@
+# batch.py
+"""
+Headless batch run of the full pipeline (cut frames, propagate, trajectory and video)
+over the videos listed in a JSON manifest:
+
+    python batch.py manifest.json [--user batch] [--workers 4] [--force] [--report report.json]
+
+The manifest is a list of entries such as
+    {"video": "demo_table_tennis.mp4", "object": "Ball", "fps": 10, "start_time": "00:00:01",
+     "end_time": "00:00:05", "points": [{"x": 640, "y": 360, "type": "positive", "obj_id": 1}]}
+with "video" relative to videos/ (or a path), "points" in the metadata.json format and
+optional "user", "quality" and "memory_profile". Projects already tracked with the same
+parameters and points are skipped unless --force is given.
+
+Frame extraction and post-processing run on a process pool; propagation runs in this
+process on JOB_WORKERS threads, so the model is loaded once.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import (VIDEO_UPLOAD_DIR, RESULTS_ROOT, DEFAULT_FPS, DEFAULT_QUALITY, MEMORY_PROFILE, JOB_WORKERS,
+                    BATCH_WORKERS, STREAM_ENCODE)
+from logic.video_processor import run_ffmpeg_cutting
+from logic.visualizer import generate_video_and_trajectory
+from logic.catalog import catalog
+
+def load_manifest(path, default_user):
+    """Manifest entries with their defaults filled in and the video resolved to a path."""
+    with open(path, "r") as f:
+        entries = json.load(f)
+    manifest = []
+    for i, entry in enumerate(entries):
+        for field in ["video", "object", "points"]:
+            if not entry.get(field):
+                raise ValueError(f"Manifest entry {i}: missing '{field}'")
+        video = entry["video"]
+        video_path = video if os.path.isfile(video) else os.path.join(VIDEO_UPLOAD_DIR, video)
+        points = [{"x": p["x"], "y": p["y"], "type": p.get("type", "positive"), "obj_id": p.get("obj_id", 1)}
+                  for p in entry["points"]]
+        manifest.append({
+            "user": entry.get("user", default_user),
+            "video_path": video_path,
+            "object": entry["object"],
+            "fps": entry.get("fps", DEFAULT_FPS),
+            "quality": entry.get("quality", DEFAULT_QUALITY),
+            "start_time": entry.get("start_time"),
+            "end_time": entry.get("end_time"),
+            "memory_profile": entry.get("memory_profile", MEMORY_PROFILE),
+            "points": points,
+        })
+    return manifest
+
+def project_dir_of(entry):
+    """Same naming as create_project_folder."""
+    video_name = os.path.splitext(os.path.basename(entry["video_path"]))[0]
+    safe_obj_name = "".join([c if c.isalnum() else "_" for c in entry["object"]])
+    return os.path.join(RESULTS_ROOT, entry["user"], f"{video_name}_{safe_obj_name}_Tracking")
+
+def is_complete(entry):
+    """True if the project was already tracked with the entry's cutting parameters and points."""
+    project_dir = project_dir_of(entry)
+    outputs = [os.path.join(project_dir, "trajectories", "trajectory.csv"),
+               os.path.join(project_dir, "videos", "output_tracked.mp4")]
+    if not all(os.path.exists(p) for p in outputs):
+        return False
+    try:
+        with open(os.path.join(project_dir, "metadata", "metadata.json"), "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    # peak_memory is recorded at the end of a successful run
+    project = catalog.get(project_dir)
+    if "peak_memory" not in meta or (project and project["status"] in ["failed", "cancelled"]):
+        return False
+    return (meta.get("original_video") == os.path.basename(entry["video_path"])
+            and all(meta.get(k) == entry[k] for k in ["fps", "quality", "start_time", "end_time", "points"]))
+
+def cut_project(entry):
+    """
+    Frame extraction (process pool). Returns the project folder.
+    Always as JPEGs: frames decoded into this pool process's memory could not reach the
+    tracker in the main process, which reads the JPEGs instead (see track_project).
+    """
+    frames, frames_dir, project_dir = run_ffmpeg_cutting(
+        entry["user"], entry["video_path"], entry["object"], fps=entry["fps"],
+        start_time=entry["start_time"], end_time=entry["end_time"], quality=entry["quality"],
+        frame_source="jpeg"
+    )
+    return project_dir
+
+def post_process(project_dir, trajectories, fps):
+    """Trajectory CSVs, plots and (unless streamed during propagation) the video (process pool)."""
+    generate_video_and_trajectory(project_dir, trajectories, fps=fps, compile_video=not STREAM_ENCODE)
+
+def track_project(entry, project_dir):
+    """Propagation in this process (on the model). Returns (trajectories, fps, peak memory)."""
+    # Imported here so pool processes never load torch / SAM2
+    from logic.job_queue import propagate_project
+    from logic.session_manager import tracking_sessions
+
+    points = [[p["x"], p["y"]] for p in entry["points"]]
+    labels = [1 if p["type"] == "positive" else 0 for p in entry["points"]]
+    obj_ids = [p["obj_id"] for p in entry["points"]]
+    catalog.set_status(project_dir, "tracking")
+    try:
+        return propagate_project(entry["user"], project_dir, points, labels, obj_ids, entry["memory_profile"],
+                                 from_jpegs=True)
+    finally:
+        # Free the session right away; the next clip needs the memory
+        tracking_sessions.close_project(project_dir)
+
+def run_batch(manifest, workers=BATCH_WORKERS, force=False):
+    """
+    Runs the manifest as a pipeline: cut (pool) -> propagate (threads) -> post-process (pool).
+    Returns one result dict per entry.
+    """
+    from logic.job_queue import record_run, describe_error
+
+    results = [{"project_dir": project_dir_of(e), "status": "pending", "message": ""} for e in manifest]
+    todo = []
+    for i, entry in enumerate(manifest):
+        if not force and is_complete(entry):
+            results[i]["status"] = "skipped"
+            results[i]["message"] = "Already tracked with these parameters."
+        else:
+            todo.append(i)
+    print(f"[INFO] Batch: {len(todo)} to process, {len(manifest) - len(todo)} already complete")
+
+    def fail(i, stage, e):
+        traceback.print_exc()
+        results[i]["status"] = "failed"
+        results[i]["message"] = f"{stage}: {describe_error(e) if stage == 'track' else e}"
+        catalog.refresh_project(results[i]["project_dir"], status="failed")
+        print(f"[WARN] {os.path.basename(results[i]['project_dir'])}: {stage} failed")
+
+    # spawn: pool processes must not inherit the model or CUDA state of this process
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool, \
+         ThreadPoolExecutor(max_workers=max(1, JOB_WORKERS), thread_name_prefix="batch-tracking") as trackers:
+        pending = {}  # future -> (stage, entry index, extra)
+        for i in todo:
+            results[i]["started"] = time.time()
+            pending[pool.submit(cut_project, manifest[i])] = ("cut", i, None)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, i, extra = pending.pop(future)
+                entry = manifest[i]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    fail(i, stage, e)
+                    continue
+                if stage == "cut":
+                    results[i]["project_dir"] = result
+                    pending[trackers.submit(track_project, entry, result)] = ("track", i, None)
+                elif stage == "track":
+                    trajectories, fps, peak = result
+                    pending[pool.submit(post_process, results[i]["project_dir"], trajectories, fps)] = ("post", i, peak)
+                else:
+                    record_run(results[i]["project_dir"], entry["memory_profile"], extra)
+                    catalog.refresh_project(results[i]["project_dir"])
+                    results[i]["status"] = "done"
+                    results[i]["message"] = f"{time.time() - results[i]['started']:.1f}s"
+                print(f"[INFO] {os.path.basename(results[i]['project_dir'])}: {stage} done")
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run cutting, tracking and post-processing for a manifest of videos.")
+    parser.add_argument("manifest", help="JSON list of {video, object, points, ...} entries")
+    parser.add_argument("--user", default="batch", help="Results subfolder for entries without a 'user'")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Processes for cutting and post-processing")
+    parser.add_argument("--force", action="store_true", help="Re-run projects that are already complete")
+    parser.add_argument("--report", help="Write the per-project results to this JSON file")
+    args = parser.parse_args(argv)
+
+    manifest = load_manifest(args.manifest, args.user)
+    results = run_batch(manifest, workers=max(1, args.workers), force=args.force)
+
+    for result in results:
+        print(f"{result['status']:>8}  {result['project_dir']}  {result['message']}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=4)
+    return 1 if any(r["status"] == "failed" for r in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+# benchmarks/fake_predictor.py
+import math
+from types import SimpleNamespace
+import torch
+import torch.nn.functional as F
+import sam2.sam2_video_predictor as sam2_video_predictor
+
+class FakeVideoPredictor:
+    """
+    Deterministic stand-in for SAM2VideoPredictor (same init_state / add_new_points_or_box /
+    remove_object / propagate_in_video interface and inference state keys used by
+    SAM2Tracker), so the pipeline runs without the SAM2 checkpoint.
+
+    Each object is a disk of `radius` (fraction of the frame height) around the mean of its
+    positive points, moving on a circle of `orbit` (fraction of the height) once every
+    `period` frames. Every `miss_every`-th frame (0 = never) the objects are lost, which
+    exercises the gap filling. The masks are full-resolution logits like SAM2's outputs;
+    no model runs, so timings measure the pipeline around the model.
+
+    Frames still go through a cheap stand-in image encoder (forward_image /
+    _get_image_feature) with the FPN shapes of SAM2.1 (strides 4, 8 and 16, 32, 64 and
+    256 channels), so install_feature_cache hooks in and its writes and reads are timed.
+    """
+    def __init__(self, image_size=1024, device="cpu", radius=0.08, orbit=0.2, period=90, miss_every=0):
+        self.image_size = image_size
+        self.device = torch.device(device)
+        self.radius = radius
+        self.orbit = orbit
+        self.period = period
+        self.miss_every = miss_every
+        # Memory extent read by SAM2Tracker._prune_memory (SAM2.1 defaults)
+        self.num_maskmem = 7
+        self.memory_temporal_stride_for_eval = 1
+        self.max_obj_ptrs_in_encoder = 16
+        # Fixed 1x1 projections of the pooled RGB image, one per FPN level
+        generator = torch.Generator().manual_seed(0)
+        self.fpn_levels = [(4, 32), (8, 64), (16, 256)]  # (stride, channels)
+        self.fpn_weights = [torch.randn(channels, 3, generator=generator).to(self.device)
+                            for _, channels in self.fpn_levels]
+        self._position_cache = {}
+        # Read by install_feature_cache on a cache hit
+        self.image_encoder = SimpleNamespace(neck=SimpleNamespace(position_encoding=self._position_encoding))
+
+    def init_state(self, video_path, offload_video_to_cpu=False, offload_state_to_cpu=False, async_loading_frames=False):
+        # Looked up on the module, as SAM2 does, so SAM2Tracker's InMemoryVideo inputs are understood
+        images, video_height, video_width = sam2_video_predictor.load_video_frames(
+            video_path=video_path, image_size=self.image_size, offload_video_to_cpu=offload_video_to_cpu,
+            async_loading_frames=async_loading_frames, compute_device=self.device
+        )
+        state = {
+            "images": images,
+            "num_frames": len(images),
+            "video_height": video_height,
+            "video_width": video_width,
+            "offload_video_to_cpu": offload_video_to_cpu,
+            "offload_state_to_cpu": offload_state_to_cpu,
+            "device": self.device,
+            "cached_features": {},
+            "centers": {},
+            "output_dict_per_obj": {},
+        }
+        # SAM2 encodes frame 0 here
+        self._get_image_feature(state, frame_idx=0, batch_size=1)
+        return state
+
+    def _position_encoding(self, level, num_feats=128):
+        """Sine positional encoding of a (B, C, H, W) feature map (2 * num_feats channels), cached per size like SAM2.1."""
+        b, _, h, w = level.shape
+        key = (h, w, level.device)
+        if key not in self._position_cache:
+            self._position_cache[key] = self._sine_encoding(h, w, level.device, num_feats)
+        return self._position_cache[key].expand(b, -1, -1, -1)
+
+    @staticmethod
+    def _sine_encoding(h, w, device, num_feats):
+        ys = torch.arange(1, h + 1, device=device, dtype=torch.float32) / h * 2 * math.pi
+        xs = torch.arange(1, w + 1, device=device, dtype=torch.float32) / w * 2 * math.pi
+        dim_t = 10000 ** (2 * (torch.arange(num_feats, device=device) // 2) / num_feats)
+        pos_y = (ys[:, None] / dim_t).view(h, 1, num_feats).expand(h, w, num_feats)
+        pos_x = (xs[:, None] / dim_t).view(1, w, num_feats).expand(h, w, num_feats)
+        pos = torch.cat([pos_y, pos_x], dim=-1)
+        pos[..., 0::2] = pos[..., 0::2].sin()
+        pos[..., 1::2] = pos[..., 1::2].cos()
+        return pos.permute(2, 0, 1).unsqueeze(0).contiguous()
+
+    def forward_image(self, image):
+        """Stand-in image encoder: pools the (1, 3, S, S) frame to each FPN level and projects it."""
+        fpn = []
+        for (stride, _), weight in zip(self.fpn_levels, self.fpn_weights):
+            pooled = F.avg_pool2d(image, stride)
+            fpn.append(torch.einsum("oc,bchw->bohw", weight, pooled))
+        pos = [self._position_encoding(level) for level in fpn]
+        return {"vision_features": fpn[-1], "vision_pos_enc": pos, "backbone_fpn": fpn}
+
+    def _get_image_feature(self, inference_state, frame_idx, batch_size):
+        # Same single-entry in-memory cache as SAM2 (install_feature_cache wraps this method)
+        image, backbone_out = inference_state["cached_features"].get(frame_idx, (None, None))
+        if backbone_out is None:
+            image = inference_state["images"][frame_idx].to(self.device).float().unsqueeze(0)
+            backbone_out = self.forward_image(image)
+            inference_state["cached_features"] = {frame_idx: (image, backbone_out)}
+        return image, backbone_out
+
+    def reset_state(self, inference_state):
+        inference_state["centers"].clear()
+        inference_state["output_dict_per_obj"].clear()
+
+    def _mask_logits(self, inference_state, frame_idx):
+        obj_ids = sorted(inference_state["centers"])
+        h, w = inference_state["video_height"], inference_state["video_width"]
+        ys = torch.arange(h, device=self.device, dtype=torch.float32).view(-1, 1)
+        xs = torch.arange(w, device=self.device, dtype=torch.float32).view(1, -1)
+        logits = torch.full((len(obj_ids), 1, h, w), -10.0, device=self.device)
+        if self.miss_every and frame_idx % self.miss_every == self.miss_every - 1:
+            return obj_ids, logits
+        angle = 2 * math.pi * frame_idx / self.period
+        for i, obj_id in enumerate(obj_ids):
+            cx, cy = inference_state["centers"][obj_id]
+            cx += self.orbit * h * (math.cos(angle) - 1)
+            cy += self.orbit * h * math.sin(angle)
+            dist = torch.sqrt((xs - cx) ** 2 + (ys - cy) ** 2)
+            logits[i, 0] = self.radius * h - dist
+        return obj_ids, logits
+
+    def add_new_points_or_box(self, inference_state, frame_idx, obj_id, points=None, labels=None,
+                              clear_old_points=True, normalize_coords=True, box=None):
+        positive = [p for p, l in zip(points, labels) if l == 1] or list(points)
+        inference_state["centers"][obj_id] = (
+            sum(float(p[0]) for p in positive) / len(positive),
+            sum(float(p[1]) for p in positive) / len(positive),
+        )
+        inference_state["output_dict_per_obj"].setdefault(obj_id, {"cond_frame_outputs": {}, "non_cond_frame_outputs": {}})
+        self._get_image_feature(inference_state, frame_idx, batch_size=1)
+        obj_ids, logits = self._mask_logits(inference_state, frame_idx)
+        return frame_idx, obj_ids, logits
+
+    def remove_object(self, inference_state, obj_id, strict=False, need_output=True):
+        inference_state["centers"].pop(obj_id, None)
+        inference_state["output_dict_per_obj"].pop(obj_id, None)
+        obj_ids = sorted(inference_state["centers"])
+        if not need_output or not obj_ids:
+            return obj_ids, []
+        return obj_ids, [(0, self._mask_logits(inference_state, 0)[1])]
+
+    def propagate_in_video(self, inference_state, start_frame_idx=None, max_frame_num_to_track=None, reverse=False):
+        num_frames = inference_state["num_frames"]
+        start = start_frame_idx or 0
+        end = num_frames if max_frame_num_to_track is None else min(num_frames, start + max_frame_num_to_track + 1)
+        for frame_idx in range(start, end):
+            # Encoding the preprocessed frame drives FrameWindow loading as the real model does
+            self._get_image_feature(inference_state, frame_idx, batch_size=1)
+            obj_ids, logits = self._mask_logits(inference_state, frame_idx)
+            for obj_output_dict in inference_state["output_dict_per_obj"].values():
+                obj_output_dict["non_cond_frame_outputs"][frame_idx] = {"frame_idx": frame_idx}
+            yield frame_idx, obj_ids, logits
@@ -0,0 +1,317 @@
+# benchmarks/run_benchmarks.py
+"""
+Pipeline benchmarks with a deterministic fake SAM2 predictor (see fake_predictor.py), so
+they run anywhere without the checkpoint and measure everything around the model:
+
+    python -m benchmarks.run_benchmarks [--sizes 640x360,1280x720] [--frames 60,240] [--repeat 3]
+                                        [--output results.json] [--compare baseline.json]
+
+Synthetic videos (FFmpeg testsrc2) are generated for every size x frame count and each
+stage is timed (best of --repeat) with its peak memory (PeakMemoryMonitor):
+    cut_pipe / cut_jpeg      run_ffmpeg_cutting in both frame sources, JPEG writes included
+    session_init             SAM2Tracker.init_session on the "pipe" cut (in-memory frames,
+                             or the video decoded window by window)
+    propagate_loop           propagation loop alone (statistics only, no rendering); clips
+                             over PROPAGATION_WINDOW are windowed, so their frame
+                             preprocessing moves from session_init into this stage
+    propagate_full           propagation with mask JPEGs, mask store and streamed video
+    feature_cache_miss       propagate_loop with an empty feature cache (every frame encoded and written)
+    feature_cache_hit        propagate_loop again, every frame's features read back from the cache
+    save_tracking_frame      one overlay JPEG per frame
+    replace_zero_coordinates gap filling of a trajectory with lost frames
+    create_trajectory_plot   one plot variant
+    encode_video             StreamingVideoEncoder over the decoded frames
+    compile_video            FFmpeg compile of masks/*.jpg (the non-streaming path)
+
+Everything is written to a temporary folder (the repo's results/ is never touched).
+Results are saved as JSON (benchmarks/results/<time>_<commit>.json by default);
+--compare prints the time ratio of every stage against an earlier results file.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+from PIL import Image
+import config
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+DEFAULT_SIZES = "640x360,1280x720,1920x1080"
+DEFAULT_FRAMES = "60,240"
+VIDEO_FPS = 30
+REGRESSION_RATIO = 1.2  # --compare flags stages this much slower than the baseline
+
+def use_work_dir(work_dir):
+    """Points every output location of the pipeline at work_dir (before logic/ is imported)."""
+    config.RESULTS_ROOT = os.path.join(work_dir, "results")
+    config.VIDEO_UPLOAD_DIR = os.path.join(work_dir, "videos")
+    config.JOBS_DIR = os.path.join(work_dir, "jobs")
+    config.CATALOG_PATH = os.path.join(work_dir, "catalog.sqlite3")
+    config.FRAME_CACHE_DIR = os.path.join(work_dir, "frame_cache")
+    # Every repeat must really extract
+    config.FRAME_CACHE = False
+    for path in [config.RESULTS_ROOT, config.VIDEO_UPLOAD_DIR, config.JOBS_DIR]:
+        os.makedirs(path, exist_ok=True)
+
+def make_video(videos_dir, width, height, num_frames, fps=VIDEO_FPS):
+    """Synthetic H.264 clip (testsrc2: moving patterns and a frame counter)."""
+    path = os.path.join(videos_dir, f"synthetic_{width}x{height}_{num_frames}.mp4")
+    if not os.path.exists(path):
+        subprocess.run([
+            "ffmpeg", "-y", "-v", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}",
+            "-frames:v", str(num_frames),
+            "-c:v", "libx264", "-pix_fmt", "yuv420p",
+            path
+        ], check=True)
+    return path
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=config.BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def environment():
+    import torch
+    return {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "cuda": torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+    }
+
+class Bench:
+    """Times stages (best of `repeat`) and records their peak memory."""
+    def __init__(self, device, repeat=1):
+        self.device = device
+        self.repeat = repeat
+
+    def run(self, stages, name, fn, setup=None, frames=None):
+        """
+        Runs fn() `repeat` times (setup() before each, untimed) and stores
+        {time_s, per_frame_ms, peak_rss_mb, peak_cuda_mb} under stages[name].
+        Returns the result of the last call.
+        """
+        from logic.memory_monitor import PeakMemoryMonitor
+
+        best, peak_rss, peak_cuda, result = None, 0.0, None, None
+        for _ in range(self.repeat):
+            if setup is not None:
+                setup()
+            monitor = PeakMemoryMonitor(self.device).start()
+            start = time.perf_counter()
+            try:
+                result = fn()
+            finally:
+                elapsed = time.perf_counter() - start
+                peak = monitor.stop()
+            best = elapsed if best is None else min(best, elapsed)
+            peak_rss = max(peak_rss, peak["peak_rss_mb"])
+            if peak["peak_cuda_mb"] is not None:
+                peak_cuda = max(peak_cuda or 0.0, peak["peak_cuda_mb"])
+        stages[name] = {
+            "time_s": round(best, 4),
+            "per_frame_ms": round(1000 * best / frames, 3) if frames else None,
+            "peak_rss_mb": peak_rss,
+            "peak_cuda_mb": peak_cuda,
+        }
+        print(f"[INFO]   {name:<26} {best:8.3f}s  peak RSS {peak_rss:.0f} MB")
+        return result
+
+def bench_case(bench, predictor, video_path, width, height, num_frames):
+    """All stages for one synthetic video. Returns {stage: measurements}."""
+    from logic.video_processor import run_ffmpeg_cutting, create_project_folder
+    from logic.frame_source import wait_for_frames, get_cached_frames
+    from logic.tracker import SAM2Tracker
+    from logic.visualizer import (save_tracking_frame, replace_zero_coordinates,
+                                  create_trajectory_plot, generate_video_and_trajectory, StreamingVideoEncoder)
+
+    stages = {}
+    project_dir, _ = create_project_folder("bench", video_path, "Target")
+    frames_dir = os.path.join(project_dir, "frames")
+    masks_dir = os.path.join(project_dir, "masks")
+    videos_dir = os.path.join(project_dir, "videos")
+
+    def fresh_project():
+        shutil.rmtree(project_dir, ignore_errors=True)
+        create_project_folder("bench", video_path, "Target")
+
+    def cut(frame_source):
+        frames, frames_dir, _ = run_ffmpeg_cutting("bench", video_path, "Target", fps=VIDEO_FPS,
+                                                   quality=config.DEFAULT_QUALITY, frame_source=frame_source)
+        wait_for_frames(frames_dir)
+        return frames
+
+    bench.run(stages, "cut_jpeg", lambda: cut("jpeg"), setup=fresh_project, frames=num_frames)
+    # Clips longer than one propagation window are not held in memory in "pipe" mode (see fits_in_memory)
+    bench.run(stages, "cut_pipe", lambda: cut("pipe"), setup=fresh_project, frames=num_frames)
+    frames = session_frames = get_cached_frames(frames_dir)
+
+    tracker = SAM2Tracker(predictor=predictor)
+    bench.run(stages, "session_init", lambda: tracker.init_session(frames_dir, frames=session_frames, decode=True),
+              frames=num_frames)
+    if frames is None:
+        frames = [np.asarray(Image.open(path).convert("RGB")) for path in sorted(glob.glob(os.path.join(frames_dir, "*.jpg")))]
+    points, labels = [[width * 0.5, height * 0.5]], [1]
+
+    def clear_outputs():
+        for path in [masks_dir, videos_dir, os.path.join(project_dir, "mask_store")]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    bench.run(stages, "propagate_loop", lambda: tracker.propagate(frames_dir, masks_dir, points, labels, write_jpegs=False),
+              setup=clear_outputs, frames=num_frames)
+    video_path_out = os.path.join(videos_dir, "output_tracked.mp4")
+    trajectory = bench.run(stages, "propagate_full", lambda: tracker.propagate(
+        frames_dir, masks_dir, points, labels, video_path=video_path_out, fps=VIDEO_FPS, write_jpegs=True,
+        mask_store_dir=os.path.join(project_dir, "mask_store")
+    ), setup=clear_outputs, frames=num_frames)
+
+    # Feature cache: the first pass encodes and writes every frame, the second reads them back
+    # (own masks folder: compile_video below reads the mask JPEGs of propagate_full)
+    feature_cache_dir = os.path.join(project_dir, "feature_cache")
+    cache_masks_dir = os.path.join(project_dir, "feature_cache_masks")
+
+    def cached_session(cold):
+        shutil.rmtree(cache_masks_dir, ignore_errors=True)
+        if cold:
+            shutil.rmtree(feature_cache_dir, ignore_errors=True)
+        tracker.init_session(frames_dir, frames=session_frames, decode=True, feature_cache_dir=feature_cache_dir)
+
+    propagate_loop = lambda: tracker.propagate(frames_dir, cache_masks_dir, points, labels, write_jpegs=False)
+    bench.run(stages, "feature_cache_miss", propagate_loop, setup=lambda: cached_session(cold=True), frames=num_frames)
+    bench.run(stages, "feature_cache_hit", propagate_loop, setup=lambda: cached_session(cold=False), frames=num_frames)
+    tracker.close()
+
+    # Masks matching the fake predictor's output, rendered outside the writer pool
+    _, logits = predictor._mask_logits({"centers": {1: tuple(points[0])}, "video_height": height, "video_width": width}, 0)
+    mask = (logits[0] > 0).cpu().numpy()
+    overlay_dir = os.path.join(project_dir, "overlays")
+    os.makedirs(overlay_dir, exist_ok=True)
+    bench.run(stages, "save_tracking_frame", lambda: [
+        save_tracking_frame(frame, mask, os.path.join(overlay_dir, f"{i:05d}.jpg")) for i, frame in enumerate(frames)
+    ], frames=num_frames)
+
+    # Legacy (0, 0) sentinel trajectory: every 7th frame lost, plus a long gap
+    xy = np.array([[t["x"], t["y"]] for t in trajectory], dtype=float)
+    xy[::7] = 0.0
+    xy[num_frames // 3:num_frames // 2] = 0.0
+    bench.run(stages, "replace_zero_coordinates", lambda: replace_zero_coordinates(pd.DataFrame(xy, columns=["x", "y"])),
+              frames=num_frames)
+
+    # Trajectory CSVs (and the plots of TRAJECTORY_PLOTS) without the video
+    generate_video_and_trajectory(project_dir, trajectory, fps=VIDEO_FPS, compile_video=False, plot_variants=[])
+    trajectories_dir = os.path.join(project_dir, "trajectories")
+    bench.run(stages, "create_trajectory_plot", lambda: create_trajectory_plot(
+        project_dir, os.path.join(trajectories_dir, "trajectory.csv"), os.path.join(trajectories_dir, "bench_plot.png"),
+        smoothing=True
+    ), frames=num_frames)
+
+    # Raw frames stand in for the blended ones (holding every blended frame would skew the memory peak)
+    def encode():
+        encoder = StreamingVideoEncoder(os.path.join(videos_dir, "bench_stream.mp4"), width, height, fps=VIDEO_FPS)
+        for i, frame in enumerate(frames):
+            encoder.write(i, frame)
+        encoder.close()
+    bench.run(stages, "encode_video", encode, frames=num_frames)
+    bench.run(stages, "compile_video", lambda: generate_video_and_trajectory(
+        project_dir, trajectory, fps=VIDEO_FPS, compile_video=True, plot_variants=[]
+    ), frames=num_frames)
+
+    shutil.rmtree(project_dir, ignore_errors=True)
+    return stages
+
+def run_benchmarks(sizes, frame_counts, repeat=1, device="cpu"):
+    """Benchmarks every size x frame count. Returns the results document."""
+    from benchmarks.fake_predictor import FakeVideoPredictor
+    from logic.feature_cache import install_feature_cache
+
+    predictor = FakeVideoPredictor(device=device, miss_every=25)
+    install_feature_cache(predictor)
+    bench = Bench(predictor.device, repeat=repeat)
+    runs = []
+    for width, height in sizes:
+        for num_frames in frame_counts:
+            print(f"[INFO] {width}x{height}, {num_frames} frames")
+            video_path = make_video(config.VIDEO_UPLOAD_DIR, width, height, num_frames)
+            stages = bench_case(bench, predictor, video_path, width, height, num_frames)
+            runs.append({"width": width, "height": height, "frames": num_frames, "stages": stages})
+    return {"environment": environment(), "repeat": repeat, "device": str(predictor.device), "runs": runs}
+
+def _run_key(run):
+    return f"{run['width']}x{run['height']}/{run['frames']}"
+
+def compare(results, baseline, threshold=REGRESSION_RATIO):
+    """Prints the time ratio (current / baseline) of every stage present in both. Returns the regressions."""
+    base_runs = {_run_key(run): run for run in baseline["runs"]}
+    print(f"\nCompared with {baseline['environment'].get('commit')} ({baseline['environment'].get('created')}):")
+    regressions = []
+    for run in results["runs"]:
+        base = base_runs.get(_run_key(run))
+        if base is None:
+            continue
+        for name, measured in run["stages"].items():
+            if name not in base["stages"] or not base["stages"][name]["time_s"]:
+                continue
+            ratio = measured["time_s"] / base["stages"][name]["time_s"]
+            flag = ""
+            if ratio > threshold:
+                flag = "  <-- slower"
+                regressions.append((_run_key(run), name, ratio))
+            print(f"  {_run_key(run):<18} {name:<26} {base['stages'][name]['time_s']:8.3f}s -> "
+                  f"{measured['time_s']:8.3f}s  x{ratio:.2f}{flag}")
+    return regressions
+
+def parse_sizes(value):
+    return [tuple(int(v) for v in size.lower().split("x")) for size in value.split(",") if size]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage with a fake SAM2 predictor.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated WIDTHxHEIGHT list")
+    parser.add_argument("--frames", default=DEFAULT_FRAMES, help="Comma-separated frame counts")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage (the fastest is kept)")
+    parser.add_argument("--device", default="cpu", help="Device of the fake predictor's masks (cpu or cuda)")
+    parser.add_argument("--output", help="Results JSON path (default: benchmarks/results/<time>_<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary work folder")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="sam2_bench_")
+    use_work_dir(work_dir)
+    try:
+        results = run_benchmarks(parse_sizes(args.sizes), [int(n) for n in args.frames.split(",") if n],
+                                 repeat=max(1, args.repeat), device=args.device)
+    finally:
+        if args.keep:
+            print(f"[INFO] Work folder kept: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(
+        DEFAULT_RESULTS_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}_{results['environment']['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"[INFO] Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            regressions = compare(results, json.load(f))
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
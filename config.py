@@ -9,12 +9,92 @@ VIDEO_UPLOAD_DIR = os.path.join(BASE_DIR, "videos")
 # SAM2 Model paths (Modify these paths based on your actual environment)
 SAM2_CHECKPOINT = "/home/ipd/CV_Models/sam2/checkpoints/sam2.1_hiera_large.pt"
 SAM2_CONFIG = "configs/sam2.1/sam2.1_hiera_l.yaml"
+PRELOAD_MODEL = True  # Load SAM2 in a background thread at startup (False = on first use in the Tracking tab)
 
 # Default parameters
 DEFAULT_FPS = 30
 DEFAULT_QUALITY = 2  # FFmpeg -q:v parameter (lower is better quality)
-MAX_INFERENCE_FRAMES = 120
+PROPAGATION_WINDOW = 120  # Longer clips are preprocessed/held this many frames at a time during propagation (None = all at once)
+MAX_TRACKED_OBJECTS = 8  # Objects that can be prompted and tracked in one propagation pass
+
+# SAM2 memory profile (can be overridden per run in the Tracking tab)
+# "resident": frames and state on the compute device (fastest)
+# "offload_video": frames in CPU memory, moved to the device one at a time
+# "offload_state": frames and tracking state in CPU memory (lowest device memory, slower)
+# "async": frames preprocessed lazily in the background while tracking
+MEMORY_PROFILE = "resident"
+
+# Tracking sessions (one SAM2 inference state per user and project, sharing the model weights)
+MAX_SESSIONS = 4  # Idle sessions beyond this are evicted, least recently used first
+SESSION_MEMORY_BUDGET_MB = 8192  # Evict idle sessions while all sessions together hold more than this (None = no limit)
+
+# Image-encoder feature cache (float16, per project under feature_cache/), so re-tracking skips the encoder.
+# Costs one disk write per frame on the first pass (about 6 MB per frame with the large model)
+FEATURE_CACHE = False
+FEATURE_CACHE_MAX_MB = 4096  # Per project; clips whose features would exceed this are not cached (None = no limit)
+
+# Extracted frame sets shared by all projects with the same video and cutting parameters
+# (projects hardlink the JPEGs; a set is deleted when its last project releases it)
+FRAME_CACHE = True
+FRAME_CACHE_DIR = os.path.join(BASE_DIR, "frame_cache")
+
+# Project catalog (SQLite index of all projects, rebuilt from results/ when empty)
+CATALOG_PATH = os.path.join(BASE_DIR, "catalog.sqlite3")
+
+# Background tracking jobs
+JOBS_DIR = os.path.join(BASE_DIR, "jobs")  # One JSON file per job; queued jobs survive restarts
+JOB_WORKERS = 1  # Tracking jobs run concurrently (each holds a SAM2 session on the GPU/CPU)
+
+# Batch CLI (batch.py): processes running frame extraction and post-processing;
+# propagation runs in the main process on JOB_WORKERS threads
+BATCH_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# Frame source
+# "pipe": the tracker works from decoded frames: FFmpeg decodes raw RGB into memory when the clip fits
+#         one propagation window (PROPAGATION_WINDOW) and FRAME_MEMORY_BUDGET_MB, longer clips are
+#         decoded window by window during propagation. The frames/ JPEGs are only for the gallery
+# "jpeg": FFmpeg writes the frames/ JPEGs and the tracker reads them back (window by window on long clips)
+FRAME_SOURCE = "pipe"
+FRAME_MEMORY_BUDGET_MB = 2048  # Decoded frame sets held in memory ("pipe"), all projects together
+WRITE_FRAME_JPEGS = True  # "pipe": write frames/%05d.jpg for the gallery (in the background for clips held in memory)
+EXTRACT_SEGMENTS = os.cpu_count() or 1  # Parallel FFmpeg processes splitting one time range (1 = single process)
+EXTRACT_MIN_SEGMENT_SECONDS = 30  # Shorter ranges use fewer segments (seeking costs more than it saves)
+
+# Writer pool for overlay rendering / JPEG writes during propagation
+WRITER_WORKERS = 4  # Worker threads (or processes) for background JPEG writes
+WRITER_QUEUE_DEPTH = 16  # Max frames in flight; bounds memory held by pending masks
+WRITER_USE_PROCESSES = False  # Use a process pool instead of threads
+
+# Output video
+STREAM_ENCODE = True  # Pipe blended frames into FFmpeg during propagation instead of re-reading masks/
+WRITE_MASK_JPEGS = True  # Write masks/%05d.jpg (needed by the Results/Management galleries)
+MASK_STORE = True  # Archive the raw binary masks (bit-packed, zlib-compressed chunks) in mask_store/masks.bin
+RERENDER_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # Processes used by "Re-render" in the Results tab
+
+# Extra per-frame mask statistics written to trajectory.csv
+MASK_MOMENTS = False  # Also record central second moments (mu20, mu02, mu11)
+
+# Trajectory gap filling (frames where the object is lost)
+GAP_FILL_MODE = "linear"  # "linear", "nearest" or "hold"
+GAP_FILL_MAX_GAP = None  # Longest gap (in frames) to fill; longer gaps stay empty. None = no limit
+
+# Trajectory plots
+TRAJECTORY_PLOTS = ["white_bg", "transparent_bg", "white_bg_smoothed", "transparent_bg_smoothed"]  # Rendered after tracking; others on first view
+PLOT_WORKERS = min(4, max(1, (os.cpu_count() or 2) - 1))  # Processes rendering plot variants in parallel (1 = in-process)
+
+# Run instrumentation: every pipeline stage (cutting, session init, propagation, CSVs, plots, encoding)
+# appends its wall time, frames/sec and peak memory to <project>/metadata/runs.jsonl.
+# The app serves the totals of its own runs for scraping (Prometheus text format) at
+# http://METRICS_HOST:METRICS_PORT/metrics (None = no endpoint)
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9464
+
+# Galleries (thumbnails are written next to the frames, e.g. masks/thumbs/00000.webp)
+THUMBNAIL_SIZE = 320  # Longest side in pixels
+THUMBNAIL_FORMAT = "webp"
+GALLERY_PAGE_SIZE = 48  # Thumbnails per gallery page; full resolution is loaded on click
 
 # Ensure base directories exist
 os.makedirs(RESULTS_ROOT, exist_ok=True)
-os.makedirs(VIDEO_UPLOAD_DIR, exist_ok=True)
\ No newline at end of file
+os.makedirs(VIDEO_UPLOAD_DIR, exist_ok=True)
+os.makedirs(JOBS_DIR, exist_ok=True)
\ No newline at end of file
@@ -0,0 +1,182 @@
+# logic/artifact_cache.py
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# Content digests of input files, reused while a file's size and mtime are unchanged
+_digests = {}  # path -> (size, mtime_ns, digest)
+_digests_lock = threading.Lock()
+
+# Serializes read-modify-write of the manifests (background builds and UI callbacks)
+_manifest_lock = threading.Lock()
+
+# Temporary files not modified for this long (seconds) are left over from interrupted builds;
+# younger ones may still be written by a running build (see ArtifactCache.cleanup)
+TEMP_FILE_MAX_AGE = 3600
+
+def file_digest(path):
+    """blake2b of a file's content (cached per size/mtime)."""
+    stat = os.stat(path)
+    with _digests_lock:
+        cached = _digests.get(path)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _digests_lock:
+        _digests[path] = (stat.st_size, stat.st_mtime_ns, digest)
+    return digest
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+class ArtifactCache:
+    """
+    Manifest of the derived files of a project (plots, thumbnails, re-rendered video)
+    in metadata/artifacts.json.
+
+    An artifact's key hashes the content of its input files, its render parameters
+    and the version of the code producing it. An artifact is fresh while its recorded
+    key matches and its file has not been replaced since (so an output overwritten by
+    something else, e.g. a new tracking run, is rebuilt).
+    """
+    def __init__(self, project_dir):
+        self.project_dir = project_dir
+        self.manifest_path = os.path.join(project_dir, "metadata", "artifacts.json")
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, manifest):
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(tmp_path, self.manifest_path)
+
+    def key(self, inputs, params, version):
+        """Key of an artifact built from the `inputs` files (missing ones are skipped) with `params`."""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(json.dumps({"params": params, "version": version}, sort_keys=True).encode())
+        for path in sorted(inputs):
+            if os.path.exists(path):
+                h.update(os.path.relpath(path, self.project_dir).encode())
+                h.update(file_digest(path).encode())
+        return h.hexdigest()
+
+    def is_fresh(self, name, key):
+        entry = self._load().get(name)
+        if entry is None or entry["key"] != key:
+            return False
+        path = os.path.join(self.project_dir, entry["path"])
+        return os.path.exists(path) and _file_stamp(path) == entry["stamp"]
+
+    def record(self, name, path, key, inputs=()):
+        """Marks `path` as the artifact `name` built for `key`."""
+        with _manifest_lock:
+            manifest = self._load()
+            manifest[name] = {
+                "key": key,
+                "path": os.path.relpath(path, self.project_dir),
+                "stamp": _file_stamp(path),
+                "inputs": sorted(os.path.relpath(p, self.project_dir) for p in inputs),
+                "built": time.time(),
+            }
+            self._save(manifest)
+
+    def cleanup(self):
+        """
+        Deletes artifacts whose inputs no longer exist (e.g. per-object plots of
+        objects dropped in a later run), forgets entries whose file is gone, and
+        removes temporary files left by interrupted builds (those not modified for
+        TEMP_FILE_MAX_AGE seconds; builds still running keep writing theirs).
+        """
+        with _manifest_lock:
+            manifest = self._load()
+            artifact_dirs = set()
+            for name, entry in list(manifest.items()):
+                path = os.path.join(self.project_dir, entry["path"])
+                artifact_dirs.add(os.path.dirname(path))
+                inputs = [os.path.join(self.project_dir, p) for p in entry.get("inputs", [])]
+                if inputs and not any(os.path.exists(p) for p in inputs):
+                    if os.path.exists(path):
+                        os.remove(path)
+                    del manifest[name]
+                elif not os.path.exists(path):
+                    del manifest[name]
+            cutoff = time.time() - TEMP_FILE_MAX_AGE
+            for artifact_dir in artifact_dirs:
+                if os.path.isdir(artifact_dir):
+                    for f in os.listdir(artifact_dir):
+                        temp_path = os.path.join(artifact_dir, f)
+                        try:
+                            if f.startswith(".tmp_") and os.path.getmtime(temp_path) < cutoff:
+                                os.remove(temp_path)
+                        except OSError:
+                            pass  # Replaced or removed by its build meanwhile
+            self._save(manifest)
+
+def temp_artifact_path(path):
+    """
+    New empty file to build an artifact in before it replaces `path` (readers never see
+    a partial file). Unique per call, so concurrent builds of the same artifact (e.g. the
+    background builder and a UI callback) never write to the same file; it keeps the
+    extension of `path` for tools that pick the format from it.
+    """
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp_", suffix="_" + os.path.basename(path), dir=os.path.dirname(path))
+    os.close(fd)
+    return temp_path
+
+class ArtifactBuilder:
+    """
+    Background thread that rebuilds stale artifacts, so UI callbacks can return
+    the files that already exist right away. A request is dropped while one with
+    the same tag (e.g. (project_dir, "plots")) is still queued.
+    """
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact-builder")
+        self.queued = {}  # tag -> future
+        self.running = set()
+        self.lock = threading.Lock()
+
+    def _run(self, tag, fn, args):
+        with self.lock:
+            self.queued.pop(tag, None)
+            self.running.add(tag)
+        try:
+            fn(*args)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            with self.lock:
+                self.running.discard(tag)
+
+    def submit(self, tag, fn, *args):
+        with self.lock:
+            future = self.queued.get(tag)
+            if future is None:
+                future = self.executor.submit(self._run, tag, fn, args)
+                self.queued[tag] = future
+            return future
+
+    def is_pending(self, tag):
+        with self.lock:
+            return tag in self.queued or tag in self.running
+
+# Shared by the Results tab
+artifact_builder = ArtifactBuilder()
@@ -0,0 +1,230 @@
+# logic/catalog.py
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from config import CATALOG_PATH, RESULTS_ROOT
+
+# Project lifecycle: created -> extracted -> tracked (or failed / cancelled, then tracked again)
+SORT_COLUMNS = {
+    "updated": "updated DESC",
+    "created": "created DESC",
+    "name": "name COLLATE NOCASE",
+    "user": "user COLLATE NOCASE, name COLLATE NOCASE",
+    "disk usage": "disk_bytes DESC",
+    "frames": "num_frames DESC",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    project_dir TEXT PRIMARY KEY,
+    user TEXT NOT NULL,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    original_video TEXT,
+    tracking_object TEXT,
+    fps REAL,
+    num_frames INTEGER NOT NULL DEFAULT 0,
+    num_masks INTEGER NOT NULL DEFAULT 0,
+    trajectory_plot TEXT,
+    result_video TEXT,
+    trajectory_csv TEXT,
+    disk_bytes INTEGER NOT NULL DEFAULT 0,
+    metadata TEXT NOT NULL DEFAULT '{}',
+    created REAL,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS projects_user ON projects (user, name);
+CREATE INDEX IF NOT EXISTS projects_updated ON projects (updated);
+"""
+
+# disk_bytes of a project whose size has not been measured since it last changed (see measure_disk_usage)
+DISK_USAGE_UNKNOWN = -1
+
+def _count_jpegs(folder):
+    if not os.path.isdir(folder):
+        return 0
+    with os.scandir(folder) as it:
+        return sum(1 for entry in it if entry.name.endswith(".jpg"))
+
+def _disk_usage(folder):
+    total = 0
+    for root, _, files in os.walk(folder):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+def _existing(path):
+    return path if os.path.exists(path) else None
+
+def scan_project(project_dir):
+    """
+    Reads one project's catalog record from disk (metadata.json, frame counts, artifacts).
+    Its size is left unknown: walking the whole folder on every cut or tracking run costs
+    more than the run's other bookkeeping, so it is measured when listed (see measure_disk_usage).
+    """
+    metadata = {}
+    metadata_path = os.path.join(project_dir, "metadata", "metadata.json")
+    if os.path.exists(metadata_path):
+        try:
+            with open(metadata_path, "r") as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            pass
+    trajectories_dir = os.path.join(project_dir, "trajectories")
+    trajectory_plot = _existing(os.path.join(trajectories_dir, "trajectory_white_bg.png")) or \
+        _existing(os.path.join(trajectories_dir, "trajectory.png"))
+    result_video = _existing(os.path.join(project_dir, "videos", "output_tracked.mp4"))
+    # JPEGs may be skipped or still being written, so the count recorded at extraction comes first
+    num_frames = metadata.get("num_frames") or _count_jpegs(os.path.join(project_dir, "frames"))
+    if trajectory_plot or result_video:
+        status = "tracked"
+    elif num_frames:
+        status = "extracted"
+    else:
+        status = "created"
+    return {
+        "project_dir": project_dir,
+        "user": os.path.basename(os.path.dirname(project_dir)),
+        "name": os.path.basename(project_dir),
+        "status": status,
+        "original_video": metadata.get("original_video"),
+        "tracking_object": metadata.get("tracking_object"),
+        "fps": metadata.get("fps"),
+        "num_frames": num_frames,
+        "num_masks": _count_jpegs(os.path.join(project_dir, "masks")),
+        "trajectory_plot": trajectory_plot,
+        "result_video": result_video,
+        "trajectory_csv": _existing(os.path.join(trajectories_dir, "trajectory.csv")),
+        "disk_bytes": DISK_USAGE_UNKNOWN,
+        "metadata": json.dumps(metadata),
+        "created": os.path.getctime(project_dir),
+        "updated": time.time(),
+    }
+
+class ProjectCatalog:
+    """
+    SQLite index of all projects (one row per project folder), so the tabs list and
+    open projects without scanning RESULTS_ROOT and re-parsing metadata.json.
+
+    Rows are refreshed by the functions that change a project (cutting, tracking,
+    re-rendering, deleting); rebuild() re-scans everything from disk. Refreshing a
+    row marks its size unknown until measure_disk_usage() runs for it.
+    """
+    def __init__(self, db_path=CATALOG_PATH, results_root=RESULTS_ROOT):
+        self.db_path = db_path
+        self.results_root = results_root
+        self.lock = threading.Lock()  # one writer at a time within the process
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Connection for one transaction (committed on success, always closed)."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _row_to_dict(self, row):
+        project = dict(row)
+        project["metadata"] = json.loads(project["metadata"])
+        return project
+
+    def refresh_project(self, project_dir, status=None):
+        """Re-scans one project from disk and stores it; `status` overrides the status derived from its files."""
+        if not os.path.isdir(project_dir):
+            self.remove_project(project_dir)
+            return None
+        record = scan_project(project_dir)
+        if status is not None:
+            record["status"] = status
+        columns = ", ".join(record)
+        placeholders = ", ".join(f":{c}" for c in record)
+        # The creation time of an existing row is kept (a folder's ctime changes with its content)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in record if c not in ["project_dir", "created"])
+        with self.lock, self._connect() as conn:
+            conn.execute(f"INSERT INTO projects ({columns}) VALUES ({placeholders}) "
+                         f"ON CONFLICT(project_dir) DO UPDATE SET {updates}", record)
+        record["metadata"] = json.loads(record["metadata"])
+        return record
+
+    def measure_disk_usage(self, project_dirs):
+        """Measures the size of those of `project_dirs` whose size is unknown. Returns how many were measured."""
+        project_dirs = set(project_dirs)
+        with self._connect() as conn:
+            stale = [(row["project_dir"], row["updated"]) for row in conn.execute(
+                "SELECT project_dir, updated FROM projects WHERE disk_bytes = ?", (DISK_USAGE_UNKNOWN,))
+                if row["project_dir"] in project_dirs]
+        sizes = [(_disk_usage(project_dir), project_dir, updated) for project_dir, updated in stale
+                 if os.path.isdir(project_dir)]
+        with self.lock, self._connect() as conn:
+            # A row refreshed during the walk stays unknown (the folder may have changed after it was counted)
+            conn.executemany("UPDATE projects SET disk_bytes = ? WHERE project_dir = ? AND updated = ?", sizes)
+        return len(sizes)
+
+    def set_status(self, project_dir, status):
+        with self.lock, self._connect() as conn:
+            conn.execute("UPDATE projects SET status = ?, updated = ? WHERE project_dir = ?", (status, time.time(), project_dir))
+
+    def remove_project(self, project_dir):
+        with self.lock, self._connect() as conn:
+            conn.execute("DELETE FROM projects WHERE project_dir = ?", (project_dir,))
+
+    def rebuild(self):
+        """Re-scans every project under results_root and drops rows of deleted folders. Returns the project count."""
+        found = []
+        if os.path.isdir(self.results_root):
+            for user in sorted(os.listdir(self.results_root)):
+                user_dir = os.path.join(self.results_root, user)
+                if not os.path.isdir(user_dir):
+                    continue
+                for name in sorted(os.listdir(user_dir)):
+                    if os.path.isdir(os.path.join(user_dir, name)):
+                        found.append(os.path.join(user_dir, name))
+        # Keep statuses that cannot be derived from the files (e.g. failed)
+        previous = {p["project_dir"]: p["status"] for p in self.list_projects()}
+        for project_dir in found:
+            status = previous.get(project_dir)
+            self.refresh_project(project_dir, status=status if status in ["failed", "cancelled"] else None)
+        with self.lock, self._connect() as conn:
+            for project_dir in set(previous) - set(found):
+                conn.execute("DELETE FROM projects WHERE project_dir = ?", (project_dir,))
+        print(f"[INFO] Project catalog rebuilt: {len(found)} projects")
+        return len(found)
+
+    def is_empty(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM projects").fetchone()[0] == 0
+
+    def get(self, project_dir):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM projects WHERE project_dir = ?", (project_dir,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def list_projects(self, user=None, status=None, search=None, sort="name"):
+        """Projects (as dicts) filtered by user / status / name substring, sorted by a SORT_COLUMNS key."""
+        query, params = "SELECT * FROM projects WHERE 1 = 1", []
+        if user:
+            query += " AND user = ?"
+            params.append(user)
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        if search:
+            query += " AND name LIKE ?"
+            params.append(f"%{search}%")
+        query += f" ORDER BY {SORT_COLUMNS.get(sort, SORT_COLUMNS['name'])}"
+        with self._connect() as conn:
+            return [self._row_to_dict(row) for row in conn.execute(query, params)]
+
+# Shared by the processing functions and the tabs; rebuilt from disk in app.py when empty
+catalog = ProjectCatalog()
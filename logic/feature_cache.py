@@ -0,0 +1,160 @@
+# logic/feature_cache.py
+import os
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+import numpy as np
+import torch
+
+# Bump when the on-disk layout changes
+FEATURE_CACHE_VERSION = 2
+
+# metadata.json fields that determine a project's frames (see run_ffmpeg_cutting)
+FRAME_PARAMS = ["video_digest", "fps", "start_time", "end_time", "quality", "frame_source", "frame_grid"]
+
+# Thread-local cache used while SAM2's init_state encodes frame 0 (the state does not exist yet)
+_init_cache = threading.local()
+
+def project_frames_key(project_dir, source):
+    """
+    Identifies the frames a session on the project encodes: the cutting parameters in its
+    metadata.json and the `source` they are read from ("memory", "jpeg" or "decoder", whose
+    pixels differ by the JPEG compression). None if the project has no metadata.json.
+    """
+    try:
+        with open(os.path.join(project_dir, "metadata", "metadata.json"), "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    params = {name: meta.get(name) for name in FRAME_PARAMS}
+    params["source"] = source
+    return hashlib.blake2b(json.dumps(params, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+class FeatureCache:
+    """
+    On-disk cache of SAM2 image-encoder outputs, one file per frame.
+
+    Entries are keyed by frame index; the cache belongs to one model (`model_key`) and one
+    cut of the project (`frames_key`, see project_frames_key) and is cleared when either
+    changes, so a re-cut video or a different checkpoint never hits stale features. Each
+    entry is a flat float16 .npy holding the backbone FPN levels (the positional encodings
+    only depend on the shape and are recomputed), read back through a memory map.
+    Re-tracking reads the frames in the same order as the first pass, so a cache smaller
+    than the clip would evict every entry before its reuse: clips whose features exceed
+    `max_bytes` are not cached at all.
+    """
+    def __init__(self, cache_dir, model_key, frames_key, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.model_key = model_key
+        self.frames_key = frames_key
+        self.max_bytes = max_bytes
+        self.skipped = False  # Set once the clip turned out too large for max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Level shapes are fixed per model; a different model or cut invalidates the whole cache
+        self.layout_path = os.path.join(cache_dir, "layout.json")
+        self.layout = None
+        if os.path.exists(self.layout_path):
+            with open(self.layout_path, "r") as f:
+                layout = json.load(f)
+            if (layout.get("version") == FEATURE_CACHE_VERSION and layout.get("model_key") == model_key
+                    and layout.get("frames_key") == frames_key):
+                self.layout = layout
+        if self.layout is None:
+            self.clear()
+
+    def _entry_path(self, frame_idx):
+        return os.path.join(self.cache_dir, f"{frame_idx:05d}.npy")
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npy") or name == "layout.json":
+                os.remove(os.path.join(self.cache_dir, name))
+        self.layout = None
+
+    def get(self, frame_idx, device):
+        """Returns the FPN feature maps of a frame as float32 tensors, or None on a miss."""
+        if self.layout is None:
+            return None
+        try:
+            flat = np.load(self._entry_path(frame_idx), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        levels, offset = [], 0
+        for shape in self.layout["shapes"]:
+            n = int(np.prod(shape))
+            level = torch.from_numpy(np.array(flat[offset:offset + n])).reshape(shape)
+            levels.append(level.to(device).float())
+            offset += n
+        return levels
+
+    def put(self, frame_idx, levels, num_frames):
+        """
+        Stores the FPN feature maps (list of (1, C, H, W) tensors) of a frame, unless the
+        features of all `num_frames` frames of the clip would exceed max_bytes.
+        """
+        if self.skipped:
+            return
+        entry_bytes = sum(lvl.numel() for lvl in levels) * 2  # float16
+        if self.max_bytes and entry_bytes * num_frames > self.max_bytes:
+            self.skipped = True
+            print(f"[INFO] Feature cache skipped: {num_frames} frames need {entry_bytes * num_frames / 2**20:.0f} MB, "
+                  f"more than FEATURE_CACHE_MAX_MB ({self.max_bytes / 2**20:.0f} MB)")
+            return
+        flat = np.concatenate([lvl.detach().to(torch.float16).cpu().numpy().ravel() for lvl in levels])
+        with self.lock:
+            if self.layout is None:
+                self.layout = {
+                    "version": FEATURE_CACHE_VERSION,
+                    "model_key": self.model_key,
+                    "frames_key": self.frames_key,
+                    "shapes": [list(lvl.shape) for lvl in levels],
+                }
+                with open(self.layout_path, "w") as f:
+                    json.dump(self.layout, f)
+            # Write-then-rename so readers never map a partial file
+            path = self._entry_path(frame_idx)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, flat)
+            os.replace(tmp_path, path)
+
+def install_feature_cache(predictor):
+    """
+    Routes the predictor's per-frame image features through the FeatureCache of the
+    inference state (inference_state["feature_cache"]). States without one, and frames
+    already in SAM2's in-memory cache, behave exactly as before.
+    """
+    original = predictor._get_image_feature
+
+    def get_image_feature(inference_state, frame_idx, batch_size):
+        cache = inference_state.get("feature_cache") or getattr(_init_cache, "cache", None)
+        if cache is None or frame_idx in inference_state["cached_features"]:
+            return original(inference_state, frame_idx, batch_size)
+
+        device = inference_state["device"]
+        image = inference_state["images"][frame_idx].to(device).float().unsqueeze(0)
+        fpn = cache.get(frame_idx, device)
+        if fpn is None:
+            backbone_out = predictor.forward_image(image)
+            cache.put(frame_idx, backbone_out["backbone_fpn"], inference_state["num_frames"])
+        else:
+            position_encoding = predictor.image_encoder.neck.position_encoding
+            pos = [position_encoding(level).to(level.dtype) for level in fpn]
+            backbone_out = {"vision_features": fpn[-1], "vision_pos_enc": pos, "backbone_fpn": fpn}
+        # Hand it to SAM2 as an in-memory cache hit (same single-entry policy)
+        inference_state["cached_features"] = {frame_idx: (image, backbone_out)}
+        return original(inference_state, frame_idx, batch_size)
+
+    predictor._get_image_feature = get_image_feature
+
+@contextmanager
+def init_with_cache(cache):
+    """Lets init_state's frame-0 warm-up use `cache` before the inference state holds it."""
+    _init_cache.cache = cache
+    try:
+        yield cache
+    finally:
+        _init_cache.cache = None
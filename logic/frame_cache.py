@@ -0,0 +1,172 @@
+# logic/frame_cache.py
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+from config import FRAME_CACHE_DIR
+from logic.artifact_cache import file_digest
+from logic.frame_source import parse_timestamp, FRAME_GRID_VERSION
+from logic.thumbnails import THUMBNAIL_DIRNAME
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Different filesystem (or no hardlink support): fall back to a copy
+        shutil.copy2(src, dst)
+
+def _link_tree(src_dir, dst_dir):
+    """Hardlinks the frame JPEGs of src_dir and their thumbnails into dst_dir. Returns the frame count."""
+    count = 0
+    for sub in ["", THUMBNAIL_DIRNAME]:
+        src, dst = os.path.join(src_dir, sub), os.path.join(dst_dir, sub)
+        if not os.path.isdir(src):
+            continue
+        os.makedirs(dst, exist_ok=True)
+        for name in sorted(os.listdir(src)):
+            if name.startswith(".") or not os.path.isfile(os.path.join(src, name)):
+                continue
+            target = os.path.join(dst, name)
+            if os.path.lexists(target):
+                os.remove(target)
+            _link_or_copy(os.path.join(src, name), target)
+            if not sub:
+                count += 1
+    return count
+
+class FrameSetCache:
+    """
+    Extracted frame sets stored once, keyed by (video content, fps, start, end, quality, frame source).
+
+    Each set lives in <cache_dir>/<key>/frames/ with an entry.json listing the projects using
+    it. Projects get hardlinks to the JPEGs, so deleting a project folder never touches the
+    cached files; the set itself is deleted when the last project releases it.
+    Updates of a set are serialized across threads and processes (batch.py cuts in
+    worker processes) by <cache_dir>/<key>.lock.
+    """
+    def __init__(self, cache_dir=FRAME_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()  # Serializes reference updates within the process
+
+    @contextmanager
+    def _locked(self, key):
+        """Holds the in-process lock and the set's file lock."""
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(os.path.join(self.cache_dir, key + ".lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def key(self, video_path, fps, start_time=None, end_time=None, quality=2, frame_source="pipe"):
+        params = {
+            "video": file_digest(video_path),
+            "fps": float(fps),
+            "start": parse_timestamp(start_time) or 0.0,
+            "end": parse_timestamp(end_time),
+            "quality": int(quality),
+            "frame_source": frame_source,
+            "frame_grid": FRAME_GRID_VERSION,
+        }
+        return hashlib.blake2b(json.dumps(params, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _entry_path(self, key):
+        return os.path.join(self._entry_dir(key), "entry.json")
+
+    def _load_entry(self, key):
+        try:
+            with open(self._entry_path(key), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_entry(self, key, entry):
+        path = self._entry_path(key)
+        with open(path + ".tmp", "w") as f:
+            json.dump(entry, f, indent=4)
+        os.replace(path + ".tmp", path)
+
+    def lookup(self, key):
+        """The cached set's entry (with "num_frames"), or None if the set is not cached."""
+        return self._load_entry(key)
+
+    def link_into(self, key, frames_dir, project_dir):
+        """Hardlinks a cached set into a project's frames_dir and records the reference. Returns the frame count."""
+        with self._locked(key):
+            entry = self._load_entry(key)
+            if entry is None:
+                raise KeyError(key)
+            count = _link_tree(os.path.join(self._entry_dir(key), "frames"), frames_dir)
+            if project_dir not in entry["refs"]:
+                entry["refs"].append(project_dir)
+            self._save_entry(key, entry)
+        print(f"[INFO] Reused {count} cached frames ({key})")
+        return count
+
+    def adopt(self, key, frames_dir, project_dir, params=None):
+        """
+        Adds a project's freshly extracted frames_dir to the cache (hardlinks, no copy)
+        and records the project as its first reference.
+        """
+        with self._locked(key):
+            entry = self._load_entry(key)
+            if entry is None:
+                # Built in a temporary folder so a half-written set is never found by lookup()
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_dir = tempfile.mkdtemp(prefix=f".{key}.tmp_", dir=self.cache_dir)
+                try:
+                    count = _link_tree(frames_dir, os.path.join(tmp_dir, "frames"))
+                    shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+                    os.replace(tmp_dir, self._entry_dir(key))
+                except BaseException:
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                    raise
+                entry = {"params": params or {}, "num_frames": count, "refs": []}
+            if project_dir not in entry["refs"]:
+                entry["refs"].append(project_dir)
+            self._save_entry(key, entry)
+
+    def release(self, project_dir, key):
+        """Drops a project's reference; the set is deleted once no project (that still exists) uses it."""
+        with self._locked(key):
+            entry = self._load_entry(key)
+            if entry is None:
+                return
+            entry["refs"] = [p for p in entry["refs"] if p != project_dir and os.path.isdir(p)]
+            if entry["refs"]:
+                self._save_entry(key, entry)
+            else:
+                shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+                print(f"[INFO] Deleted unused cached frame set {key}")
+
+    def project_key(self, project_dir):
+        """Key of the set a project uses (recorded in its metadata.json), or None."""
+        try:
+            with open(os.path.join(project_dir, "metadata", "metadata.json"), "r") as f:
+                return json.load(f).get("frame_cache_key")
+        except (OSError, ValueError):
+            return None
+
+    def release_project(self, project_dir):
+        """Releases the set a project uses (call before deleting the project folder)."""
+        key = self.project_key(project_dir)
+        if key:
+            self.release(project_dir, key)
+
+# Shared by video_processor (extraction) and the Management tab (deletion)
+frame_cache = FrameSetCache()
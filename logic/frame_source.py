@@ -0,0 +1,408 @@
+# logic/frame_source.py
+import os
+import json
+import math
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+import numpy as np
+from PIL import Image
+from config import (VIDEO_UPLOAD_DIR, WRITER_WORKERS, EXTRACT_SEGMENTS, EXTRACT_MIN_SEGMENT_SECONDS,
+                    PROPAGATION_WINDOW, FRAME_MEMORY_BUDGET_MB)
+from logic.thumbnails import save_thumbnail
+
+# Decoded frame sets kept in memory, keyed by the project's frames directory.
+# Least recently used sets are dropped while together they exceed FRAME_MEMORY_BUDGET_MB.
+_frame_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# Background JPEG writes still in flight, keyed by frames directory
+_pending_writes = {}
+
+# Version of the frame sampling below, stored in metadata.json and the frame cache keys,
+# so frames cut by an earlier version are never mixed with (or reused as) new ones
+FRAME_GRID_VERSION = 2
+
+# Seconds decoded (and dropped) before the first frame of a segment, so the source frames
+# around it are all seen however far back its keyframe is
+SEGMENT_SEEK_MARGIN = 1.0
+
+# Source frames starting less than this fraction of an output frame after an output time
+# still count as on screen at that time (absorbs the rounding of the timestamp arithmetic)
+GRID_TOLERANCE = Fraction(1, 1000)
+
+def probe_video_size(video_path):
+    """
+    Returns the (width, height) of the first video stream as FFmpeg will decode it.
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=width,height:stream_tags=rotate:stream_side_data=rotation",
+        "-of", "json",
+        video_path
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    stream = json.loads(result.stdout)["streams"][0]
+    width, height = int(stream["width"]), int(stream["height"])
+
+    # FFmpeg auto-rotates on decode, so portrait phone videos come out transposed
+    rotation = stream.get("tags", {}).get("rotate")
+    for side_data in stream.get("side_data_list", []):
+        rotation = side_data.get("rotation", rotation)
+    if rotation is not None and abs(int(float(rotation))) % 180 == 90:
+        width, height = height, width
+    return width, height
+
+def parse_timestamp(value):
+    """
+    Seconds of a start/end time given as seconds or [HH:]MM:SS[.ms] (as typed in the Video tab).
+    Returns None for an empty value.
+    """
+    if value is None or str(value).strip() == "":
+        return None
+    seconds = 0.0
+    for part in str(value).strip().split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+def probe_video_duration(video_path):
+    """Duration of the video in seconds."""
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "json", video_path]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return float(json.loads(result.stdout)["format"]["duration"])
+
+def exact_timestamp(value):
+    """parse_timestamp() as an exact Fraction, so frame grids can be compared without rounding."""
+    if value is None or str(value).strip() == "":
+        return None
+    seconds = Fraction(0)
+    for part in str(value).strip().split(":"):
+        seconds = seconds * 60 + Fraction(part.strip())
+    return seconds
+
+def frame_count(fps, start_time=None, end_time=None):
+    """Number of frames cut from [start_time, end_time) (end_time is required)."""
+    rate = Fraction(str(fps))
+    return max(math.ceil((exact_timestamp(end_time) - (exact_timestamp(start_time) or 0)) * rate), 0)
+
+def segment_args(fps, start_time, end_time, first, count=None):
+    """
+    (input_args, output_args, skip) extracting frames [first, first + count) of the range
+    [start_time, end_time) (count=None runs to end_time, or to the end of the video).
+
+    Frame i is the source frame on screen at start_time + i / fps. The frame-rate conversion
+    works on timestamps counted from the start of the file (-copyts -start_at_zero), which are
+    moved onto the output grid (setpts: shifted by the grid's phase, plus just under half a frame
+    so rounding picks the latest source frame at or before each output time) and converted to an
+    exact 1/fps timebase (settb) before the fps filter fills the slots. Each source frame thus
+    lands in the same slot whatever point decoding started from, so segments cut by separate
+    processes concatenate to exactly the frames of a single pass.
+
+    Decoding starts SEGMENT_SEEK_MARGIN seconds before the segment; its first `skip` output
+    frame (also filled from the seek point) is dropped and -frames:v caps the segment.
+    """
+    rate = Fraction(str(fps))
+    start = exact_timestamp(start_time) or Fraction(0)
+    if count is None and end_time is not None:
+        count = max(frame_count(fps, start_time, end_time) - first, 0)
+    skip = 1
+    first_slot = math.floor(start * rate)
+    phase = start - first_slot / rate
+    slot = first_slot + first - skip
+    seek = phase + slot / rate - Fraction(SEGMENT_SEEK_MARGIN)
+
+    input_args = ["-copyts", "-start_at_zero"]
+    if seek > 0:
+        input_args += ["-ss", f"{float(seek):.6f}"]
+    offset = (Fraction(1, 2) - GRID_TOLERANCE) / rate - phase
+    filters = (f"setpts=PTS{float(offset):+.9f}/TB,"
+               f"settb={rate.denominator}/{rate.numerator},"
+               f"fps=fps={rate.numerator}/{rate.denominator}:start_time={float(slot / rate):.9f}")
+    output_args = ["-vf", filters, "-fps_mode", "passthrough"]
+    if count is not None:
+        output_args += ["-frames:v", str(count + skip)]
+    return input_args, output_args, skip
+
+def plan_segments(video_path, fps, start_time=None, end_time=None, segments=EXTRACT_SEGMENTS,
+                  min_segment_seconds=EXTRACT_MIN_SEGMENT_SECONDS):
+    """
+    Splits [start_time, end_time) into segments extracted by parallel FFmpeg processes.
+    Returns a list of (input_args, output_args, skip) with `skip` leading frames to drop;
+    concatenating the segments' remaining frames gives the sequential frame numbering.
+
+    Segment k covers frames [k*n, (k+1)*n) and the last one runs to end_time
+    (see segment_args for why the boundaries are frame-accurate at any fps).
+    """
+    if segments > 1:
+        start = parse_timestamp(start_time) or 0.0
+        end = parse_timestamp(end_time)
+        if end is None:
+            end = probe_video_duration(video_path)
+        total = frame_count(fps, start_time, end)
+        segments = min(segments, int((end - start) // min_segment_seconds), total // 2)
+    if segments <= 1:
+        return [segment_args(fps, start_time, end_time, 0)]
+
+    per_segment = total // segments
+    return [segment_args(fps, start_time, end_time, k * per_segment, per_segment if k < segments - 1 else None)
+            for k in range(segments)]
+
+def plan_incremental(previous, fps, start_time=None, end_time=None):
+    """
+    Frames of a previous extraction (described by its metadata) that a re-cut with new
+    parameters can keep, as (keep_from, keep_to, shift): new frame i in [keep_from, keep_to)
+    is the previous frame i + shift, and only [0, keep_from) and [keep_to, end) are extracted.
+    Returns None when nothing can be kept.
+
+    A frame only depends on its time on the grid (see segment_args), so frames are kept when
+    both cuts use the same grid: same fps and sampling version, and a start moved by a whole
+    number of frames (checked exactly). The overlap of both ranges is then kept as is.
+    """
+    if previous.get("frame_grid") != FRAME_GRID_VERSION or not previous.get("num_frames"):
+        return None
+    rate = Fraction(str(fps))
+    if Fraction(str(previous.get("fps") or 0)) != rate:
+        return None
+    steps = ((exact_timestamp(start_time) or 0) - (exact_timestamp(previous.get("start_time")) or 0)) * rate
+    if steps.denominator != 1:
+        return None
+
+    shift = int(steps)
+    keep_from = max(0, -shift)
+    keep_to = previous["num_frames"] - shift
+    if end_time is not None:
+        keep_to = min(keep_to, frame_count(fps, start_time, end_time))
+    if keep_to <= keep_from:
+        return None
+    return keep_from, keep_to, shift
+
+def _pipe_frames(video_path, size, input_args, output_args):
+    """Yields the (H, W, 3) uint8 RGB frames of one FFmpeg rawvideo pipe."""
+    width, height = size
+    frame_bytes = width * height * 3
+
+    cmd = ["ffmpeg", "-v", "error"] + input_args + ["-i", video_path] + output_args
+    cmd.extend([
+        "-f", "rawvideo",
+        "-pix_fmt", "rgb24",
+        "pipe:1"
+    ])
+
+    print(f"[INFO] Running FFmpeg command: {' '.join(cmd)}")
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=frame_bytes)
+    try:
+        while True:
+            frame = np.empty((height, width, 3), dtype=np.uint8)
+            view = memoryview(frame).cast("B")
+            filled = 0
+            while filled < frame_bytes:
+                n = proc.stdout.readinto(view[filled:])
+                if not n:
+                    break
+                filled += n
+            if filled < frame_bytes:
+                break
+            yield frame
+    finally:
+        proc.stdout.close()
+        returncode = proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+def read_frames_ffmpeg(video_path, fps=1.0, start_time=None, end_time=None):
+    """
+    Decodes the clip through an FFmpeg rawvideo pipe.
+    Yields each frame as an (H, W, 3) uint8 RGB NumPy array, without touching the disk.
+    """
+    input_args, output_args, skip = segment_args(fps, start_time, end_time, 0)
+    for i, frame in enumerate(_pipe_frames(video_path, probe_video_size(video_path), input_args, output_args)):
+        if i >= skip:
+            yield frame
+
+def decode_segment(video_path, fps, segment, size=None):
+    """Frames of one (input_args, output_args, skip) segment (see segment_args)."""
+    input_args, output_args, skip = segment
+    return list(_pipe_frames(video_path, size or probe_video_size(video_path), input_args, output_args))[skip:]
+
+def decode_frames(video_path, fps=1.0, start_time=None, end_time=None, segments=EXTRACT_SEGMENTS):
+    """
+    Decodes the clip into a list of RGB arrays. Long ranges are split into segments
+    (see plan_segments) decoded by parallel FFmpeg processes.
+    """
+    plan = plan_segments(video_path, fps, start_time, end_time, segments)
+    if len(plan) == 1:
+        return list(read_frames_ffmpeg(video_path, fps, start_time, end_time))
+
+    size = probe_video_size(video_path)
+    with ThreadPoolExecutor(max_workers=len(plan)) as executor:
+        parts = list(executor.map(lambda segment: decode_segment(video_path, fps, segment, size), plan))
+    print(f"[INFO] Decoded {len(plan)} segments in parallel")
+    return [frame for part in parts for frame in part]
+
+def qscale_to_jpeg_quality(quality):
+    """Maps FFmpeg's -q:v scale (1=best, 31=worst) onto Pillow's JPEG quality (100=best)."""
+    quality = min(max(int(quality), 1), 31)
+    return int(round(100 - (quality - 1) * 95 / 30))
+
+def save_frame_jpeg(frame, save_path, quality=2):
+    """Writes a single RGB frame to disk as JPEG, plus its gallery thumbnail."""
+    image = Image.fromarray(frame)
+    image.save(save_path, quality=qscale_to_jpeg_quality(quality))
+    save_thumbnail(image, save_path)
+
+def write_frames_async(frames, frames_dir, quality=2, on_complete=None):
+    """
+    Writes frames as %05d.jpg in background threads (only needed for the gallery).
+    Frame 0 is written synchronously since the Tracking tab needs it for point selection.
+    `on_complete` is called (in the background) once every frame has been written.
+    """
+    os.makedirs(frames_dir, exist_ok=True)
+    paths = [os.path.join(frames_dir, f"{i:05d}.jpg") for i in range(len(frames))]
+    if not frames:
+        return paths
+    save_frame_jpeg(frames[0], paths[0], quality)
+
+    executor = ThreadPoolExecutor(max_workers=WRITER_WORKERS)
+    futures = [executor.submit(save_frame_jpeg, f, p, quality) for f, p in zip(frames[1:], paths[1:])]
+    if on_complete is not None:
+        writes = list(futures)
+        def finish():
+            for future in writes:
+                future.result()
+            on_complete()
+        # Queued after the writes, so wait_for_frames() also waits for the callback
+        futures.append(executor.submit(finish))
+    executor.shutdown(wait=False)
+    _pending_writes[frames_dir] = futures
+    return paths
+
+def write_first_frame(frames, frames_dir, quality=2):
+    """
+    Writes frame 0 of an iterable of frames as 00000.jpg (for point selection) and counts
+    the rest without holding them. Returns the frame count.
+    """
+    os.makedirs(frames_dir, exist_ok=True)
+    count = 0
+    for frame in frames:
+        if count == 0:
+            save_frame_jpeg(frame, os.path.join(frames_dir, "00000.jpg"), quality)
+        count += 1
+    return count
+
+def wait_for_frames(frames_dir, count=None):
+    """
+    Blocks until the background JPEG writes for frames_dir have finished:
+    all of them, or only those of the first `count` frames.
+    """
+    if count is not None:
+        # Frame 0 was written synchronously, futures[i] writes frame i + 1
+        for future in _pending_writes.get(frames_dir, [])[:max(count - 1, 0)]:
+            future.result()
+        return
+    futures = _pending_writes.pop(frames_dir, [])
+    for future in futures:
+        future.result()
+
+def fits_in_memory(num_frames, size):
+    """
+    Whether a decoded set of num_frames frames of size (width, height) is held in memory:
+    it has to fit one propagation window (the tracker decodes longer clips window by
+    window) and FRAME_MEMORY_BUDGET_MB.
+    """
+    if PROPAGATION_WINDOW and num_frames > max(PROPAGATION_WINDOW, 1):
+        return False
+    return num_frames * size[0] * size[1] * 3 <= FRAME_MEMORY_BUDGET_MB * 2**20
+
+def clip_fits_in_memory(video_path, fps, start_time=None, end_time=None):
+    """fits_in_memory() for the frames cut from [start_time, end_time) of a video."""
+    end = parse_timestamp(end_time)
+    num_frames = frame_count(fps, start_time, end if end is not None else probe_video_duration(video_path))
+    return fits_in_memory(num_frames, probe_video_size(video_path))
+
+def cache_frames(frames_dir, frames):
+    """Keeps a decoded frame set in memory so the tracker can start from it directly."""
+    with _cache_lock:
+        _frame_cache[frames_dir] = frames
+        _frame_cache.move_to_end(frames_dir)
+        total = sum(frame.nbytes for cached in _frame_cache.values() for frame in cached)
+        # The set just added is always kept
+        while total > FRAME_MEMORY_BUDGET_MB * 2**20 and len(_frame_cache) > 1:
+            _, dropped = _frame_cache.popitem(last=False)
+            total -= sum(frame.nbytes for frame in dropped)
+
+def drop_cached_frames(frames_dir):
+    """Forgets the decoded frames of frames_dir (e.g. after its frames were replaced)."""
+    with _cache_lock:
+        _frame_cache.pop(frames_dir, None)
+
+def get_cached_frames(frames_dir):
+    with _cache_lock:
+        frames = _frame_cache.get(frames_dir)
+        if frames is not None:
+            _frame_cache.move_to_end(frames_dir)
+        return frames
+
+def project_metadata(project_dir):
+    """The project's metadata.json contents ({} if it is missing)."""
+    try:
+        with open(os.path.join(project_dir, "metadata", "metadata.json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _project_source(project_dir):
+    """(original video path, metadata.json contents) of a project, or None if either is missing."""
+    meta = project_metadata(project_dir)
+    if not meta:
+        return None
+    video_path = os.path.join(VIDEO_UPLOAD_DIR, meta.get("original_video", ""))
+    if not os.path.isfile(video_path):
+        return None
+    return video_path, meta
+
+def project_frame_decoder(project_dir):
+    """
+    Returns load_frames(start, end), which decodes frames [start, end) of the project's clip
+    from the original video (only that range, see segment_args), or None if the video or
+    metadata.json is missing. Used by the tracker's FrameWindow for "pipe" projects and when
+    the JPEGs are not on disk.
+    """
+    source = _project_source(project_dir)
+    if source is None:
+        return None
+    video_path, meta = source
+    fps, start_time, end_time = meta.get("fps", 1.0), meta.get("start_time"), meta.get("end_time")
+    size = probe_video_size(video_path)
+
+    def load_frames(start, end):
+        return decode_segment(video_path, fps, segment_args(fps, start_time, end_time, start, end - start), size)
+    return load_frames
+
+def load_project_frames(project_dir):
+    """
+    Returns the project's frames as a list of RGB arrays.
+    Uses the in-memory cache if available, otherwise re-decodes the original video
+    through the FFmpeg pipe using the parameters stored in metadata.json.
+    Returns None if neither is possible or the clip does not fit in memory (see fits_in_memory);
+    callers then fall back to the frames/ JPEGs.
+    """
+    frames_dir = os.path.join(project_dir, "frames")
+    frames = get_cached_frames(frames_dir)
+    if frames is not None:
+        return frames
+
+    source = _project_source(project_dir)
+    if source is None:
+        return None
+    video_path, meta = source
+    if not meta.get("num_frames") or not fits_in_memory(meta["num_frames"], probe_video_size(video_path)):
+        return None
+
+    frames = decode_frames(video_path, meta.get("fps", 1.0), meta.get("start_time"), meta.get("end_time"))
+    if not frames:
+        return None
+    cache_frames(frames_dir, frames)
+    return frames
@@ -0,0 +1,310 @@
+# logic/job_queue.py
+import os
+import json
+import time
+import uuid
+import threading
+import traceback
+from config import JOBS_DIR, JOB_WORKERS, STREAM_ENCODE, MASK_STORE
+from logic.tracker import PropagationCancelled
+from logic.session_manager import tracking_sessions, prepare_session
+from logic.visualizer import generate_video_and_trajectory
+from logic.catalog import catalog
+
+# Job lifecycle: queued -> running -> done / failed / cancelled
+FINISHED_STATES = ["done", "failed", "cancelled"]
+
+def _metadata_path(proj_dir):
+    return os.path.join(proj_dir, "metadata", "metadata.json")
+
+def save_points_metadata(proj_dir, points, labels, obj_ids):
+    """
+    Stores the prompt points in the project's metadata.json and returns the project FPS.
+    """
+    metadata_path = _metadata_path(proj_dir)
+    fps = 30
+    if os.path.exists(metadata_path):
+        try:
+            with open(metadata_path, "r") as f:
+                meta = json.load(f)
+                fps = meta.get("fps", 30)
+
+            # Save structured points for better readability
+            # e.g. [{"x": 100, "y": 200, "type": "positive", "obj_id": 1}, ...]
+            structured_points = []
+            for p, l, o in zip(points, labels, obj_ids):
+                structured_points.append({
+                    "x": p[0],
+                    "y": p[1],
+                    "type": "positive" if l == 1 else "negative",
+                    "obj_id": o
+                })
+            meta["points"] = structured_points
+
+            # Remove legacy fields if they exist
+            if "labels" in meta:
+                del meta["labels"]
+            if "points_details" in meta:
+                del meta["points_details"]
+
+            with open(metadata_path, "w") as f:
+                json.dump(meta, f, indent=4)
+        except Exception as e:
+            print(f"Error updating metadata: {e}")
+    return fps
+
+def load_saved_points(proj_dir):
+    """Returns the (points, labels, obj_ids) saved in metadata.json by a previous run."""
+    metadata_path = _metadata_path(proj_dir)
+    points, labels, obj_ids = [], [], []
+    if os.path.exists(metadata_path):
+        with open(metadata_path, "r") as f:
+            raw_points = json.load(f).get("points", [])
+        for p in raw_points:
+            if isinstance(p, dict):
+                points.append([p["x"], p["y"]])
+                labels.append(1 if p.get("type") == "positive" else 0)
+                obj_ids.append(p.get("obj_id", 1))
+    return points, labels, obj_ids
+
+def propagate_project(user, proj_dir, points, labels, obj_ids, memory_profile, progress=None, cancel_event=None,
+                      from_jpegs=False):
+    """
+    Propagation step of a tracking run (in the user's session; from_jpegs: see prepare_session).
+    Returns (trajectories, fps, peak memory) for generate_video_and_trajectory / record_run.
+    """
+    fps = save_points_metadata(proj_dir, points, labels, obj_ids)
+    frames_dir = os.path.join(proj_dir, "frames")
+    masks_dir = os.path.join(proj_dir, "masks")
+    video_path = os.path.join(proj_dir, "videos", "output_tracked.mp4") if STREAM_ENCODE else None
+    store_dir = os.path.join(proj_dir, "mask_store") if MASK_STORE else None
+
+    # Re-initializes the session if it was evicted or the profile changed for this run
+    with tracking_sessions.session(user, proj_dir) as tracker:
+        prepare_session(tracker, proj_dir, memory_profile, from_jpegs=from_jpegs)
+        # Whole clip: windowed sessions hold one window of frames however long it is
+        trajectories = tracker.propagate(frames_dir, masks_dir, points, labels,
+                                         video_path=video_path, fps=fps, mask_store_dir=store_dir, obj_ids=obj_ids,
+                                         progress=progress, cancel_event=cancel_event)
+        peak = tracker.last_peak_memory
+    return trajectories, fps, peak
+
+def record_run(proj_dir, memory_profile, peak):
+    """Records the memory profile and peak memory of a finished run in metadata.json."""
+    metadata_path = _metadata_path(proj_dir)
+    if os.path.exists(metadata_path):
+        with open(metadata_path, "r") as f:
+            meta = json.load(f)
+        meta["memory_profile"] = memory_profile
+        meta["peak_memory"] = peak
+        with open(metadata_path, "w") as f:
+            json.dump(meta, f, indent=4)
+
+def run_tracking(user, proj_dir, points, labels, obj_ids, memory_profile, progress=None, cancel_event=None):
+    """
+    Full tracking run of one project: propagation (in the user's session), trajectory
+    CSVs/plots and the output video. Returns the peak memory of the propagation.
+    """
+    trajectories, fps, peak = propagate_project(user, proj_dir, points, labels, obj_ids, memory_profile,
+                                                progress=progress, cancel_event=cancel_event)
+    generate_video_and_trajectory(proj_dir, trajectories, fps=fps, compile_video=not STREAM_ENCODE)
+    record_run(proj_dir, memory_profile, peak)
+    return peak
+
+def format_peak_memory(peak):
+    text = f"{peak['peak_rss_mb']} MB RAM"
+    if peak["peak_cuda_mb"] is not None:
+        text += f", {peak['peak_cuda_mb']} MB GPU"
+    return text
+
+def describe_error(e):
+    """User-facing message for a failed run."""
+    err_msg = str(e)
+    if isinstance(e, RuntimeError) and "out of memory" in err_msg.lower():
+        return (
+            f"❌ CUDA Out of Memory Error!\n\n"
+            f"Details: {err_msg}\n\n"
+            f"Suggestion: The video resolution or frame count might be too high for your GPU.\n"
+            f"Please go back to the 'Video Processing' tab and try:\n"
+            f"1. Reducing the FPS (e.g., to 0.5 or lower).\n"
+            f"2. Reducing the Quality (e.g., to 5 or higher q-scale).\n"
+            f"3. Re-process the video to generate fewer/smaller frames.\n"
+            f"4. Select the 'offload_state' Memory Profile (slower, keeps frames and state in CPU memory)."
+        )
+    if isinstance(e, RuntimeError):
+        return f"Runtime Error: {err_msg}"
+    return f"Inference Failed: {err_msg}"
+
+class JobQueue:
+    """
+    Persistent queue of tracking runs.
+
+    Every job is a JSON file in `jobs_dir`, so queued jobs and their progress
+    survive a browser refresh or an app restart (jobs interrupted by a restart are
+    queued again). `num_workers` threads run the jobs in submission order; each
+    run goes through the user's tracking session, so the number of workers is
+    also the number of concurrent propagations on the GPU/CPU.
+    """
+    def __init__(self, jobs_dir=JOBS_DIR, num_workers=JOB_WORKERS):
+        self.jobs_dir = jobs_dir
+        self.num_workers = max(1, num_workers)
+        self.jobs = {}
+        self.cancel_events = {}
+        self.saved_at = {}  # job id -> time its progress was last persisted
+        self.cond = threading.Condition()
+        self.workers = []
+        self.loaded = False
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def _job_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _load(self):
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.jobs_dir, name), "r") as f:
+                    job = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Skipping unreadable job file {name}: {e}")
+                continue
+            if job["status"] == "running":
+                job["status"] = "queued"
+                job["message"] = "Re-queued after restart."
+                self._save(job)
+            self.jobs[job["id"]] = job
+
+    def _save(self, job):
+        # Write-then-rename so a crash never leaves a truncated job file
+        tmp_path = self._job_path(job["id"]) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(job, f, indent=4)
+        os.replace(tmp_path, self._job_path(job["id"]))
+
+    def start(self):
+        """
+        Loads the persisted jobs and starts the worker threads (idempotent).
+        Loading waits until here so that importing this module (e.g. from batch.py)
+        never re-queues the jobs of a running app.
+        """
+        with self.cond:
+            if not self.loaded:
+                self._load()
+                self.loaded = True
+            while len(self.workers) < self.num_workers:
+                worker = threading.Thread(target=self._worker, name=f"tracking-job-{len(self.workers)}", daemon=True)
+                worker.start()
+                self.workers.append(worker)
+
+    def submit(self, user, project_dir, points, labels, obj_ids, memory_profile):
+        """Queues a tracking run and returns its job id."""
+        job = {
+            "id": uuid.uuid4().hex[:8],
+            "user": user,
+            "project_dir": project_dir,
+            "project": os.path.basename(project_dir),
+            "points": points,
+            "labels": labels,
+            "obj_ids": obj_ids,
+            "memory_profile": memory_profile,
+            "status": "queued",
+            "message": "",
+            "progress": {"done": 0, "total": None, "fps": None, "eta": None},
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+        }
+        with self.cond:
+            self.jobs[job["id"]] = job
+            self._save(job)
+            self.cond.notify()
+        return job["id"]
+
+    def cancel(self, job_id):
+        """Cancels a queued job, or asks a running one to stop. Returns False if it already finished."""
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if job is None or job["status"] in FINISHED_STATES:
+                return False
+            if job["status"] == "queued":
+                self._finish(job, "cancelled", "Cancelled before start.")
+            else:
+                self.cancel_events[job_id].set()
+                job["message"] = "Cancelling..."
+            return True
+
+    def list_jobs(self, user=None):
+        """Jobs of a user (all users if None), newest first."""
+        with self.cond:
+            jobs = [dict(job) for job in self.jobs.values() if user is None or job["user"] == user]
+        return sorted(jobs, key=lambda job: job["created"], reverse=True)
+
+    def queue_position(self, job_id):
+        """1-based position among the queued jobs (0 if not queued)."""
+        with self.cond:
+            queued = sorted((j for j in self.jobs.values() if j["status"] == "queued"), key=lambda j: j["created"])
+            return next((i + 1 for i, j in enumerate(queued) if j["id"] == job_id), 0)
+
+    def _finish(self, job, status, message):
+        # Called with self.cond held
+        job["status"] = status
+        job["message"] = message
+        job["finished"] = time.time()
+        self.cancel_events.pop(job["id"], None)
+        self.saved_at.pop(job["id"], None)
+        self._save(job)
+
+    def _on_progress(self, job, done, total):
+        elapsed = time.time() - job["started"]
+        fps = done / elapsed if elapsed > 0 else None
+        with self.cond:
+            job["progress"] = {
+                "done": done,
+                "total": total,
+                "fps": round(fps, 2) if fps else None,
+                "eta": round((total - done) / fps, 1) if fps else None,
+            }
+            # Progress is persisted at most once per second
+            if done == total or time.time() - self.saved_at.get(job["id"], 0) >= 1.0:
+                self.saved_at[job["id"]] = time.time()
+                self._save(job)
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                job = None
+                while job is None:
+                    queued = [j for j in self.jobs.values() if j["status"] == "queued"]
+                    if queued:
+                        job = min(queued, key=lambda j: j["created"])
+                    else:
+                        self.cond.wait()
+                job["status"] = "running"
+                job["message"] = "Tracking..."
+                job["started"] = time.time()
+                cancel_event = threading.Event()
+                self.cancel_events[job["id"]] = cancel_event
+                self._save(job)
+            catalog.set_status(job["project_dir"], "tracking")
+
+            print(f"[INFO] Job {job['id']}: tracking {job['project_dir']}")
+            try:
+                peak = run_tracking(
+                    job["user"], job["project_dir"], job["points"], job["labels"], job["obj_ids"],
+                    job["memory_profile"], progress=lambda done, total: self._on_progress(job, done, total),
+                    cancel_event=cancel_event
+                )
+                status, message = "done", f"Complete. Peak memory ({job['memory_profile']}): {format_peak_memory(peak)}"
+            except PropagationCancelled:
+                status, message = "cancelled", "Cancelled by user."
+            except Exception as e:
+                traceback.print_exc()
+                status, message = "failed", describe_error(e)
+            with self.cond:
+                self._finish(job, status, message)
+            catalog.refresh_project(job["project_dir"], status=None if status == "done" else status)
+            print(f"[INFO] Job {job['id']}: {status}")
+
+# Shared by the UI; workers are started in app.py
+job_queue = JobQueue()
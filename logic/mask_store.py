@@ -0,0 +1,235 @@
+# logic/mask_store.py
+import os
+import glob
+import json
+import zlib
+import numpy as np
+
+# Bump when the on-disk layout changes
+MASK_STORE_VERSION = 2
+
+# Frames per compressed chunk: the unit of a read, and of the masks held in memory while writing
+MASK_CHUNK_FRAMES = 16
+MASK_COMPRESS_LEVEL = 6  # zlib level of the chunks
+
+DATA_FILENAME = "masks.bin"
+INDEX_FILENAME = "masks.json"
+
+def pack_mask(mask):
+    """Bit-packs a boolean (H, W) mask into (H, ceil(W/8)) uint8, 1 bit per pixel."""
+    return np.packbits(np.asarray(mask, dtype=bool), axis=-1)
+
+def unpack_mask(packed, width):
+    """Inverse of pack_mask."""
+    return np.unpackbits(packed, axis=-1, count=width).astype(bool)
+
+def open_mask_store(store_dir):
+    """
+    Opens the mask store of a project's mask_store/ folder for reading: a MaskStore, or
+    a LegacyMaskStore for projects tracked before version 2. None if there is none.
+    """
+    if MaskStore.exists(store_dir):
+        return MaskStore(store_dir)
+    if LegacyMaskStore.exists(store_dir):
+        return LegacyMaskStore(store_dir)
+    return None
+
+class MaskStore:
+    """
+    Lossless binary mask archive of a project: the masks of all objects in one file,
+    mask_store/masks.bin, plus a JSON index (mask_store/masks.json).
+
+    Masks are bit-packed (see pack_mask) and each object's frames are grouped in chunks of
+    MASK_CHUNK_FRAMES, each compressed with zlib and appended to masks.bin. Tracking masks
+    are mostly long runs of identical bits, so a chunk shrinks to a small fraction of
+    its packed size; reading a frame decompresses its chunk (kept until the next chunk is
+    needed, so frames read in order cost one decompression per chunk).
+
+    Unlike the blended JPEGs in masks/ it allows re-rendering and analytics without SAM2.
+    """
+    def __init__(self, store_dir, mode="r"):
+        """Opens an existing store. mode: "r" (read) or "w" (write, see create)."""
+        self.store_dir = store_dir
+        self.data_path = os.path.join(store_dir, DATA_FILENAME)
+        self.index_path = os.path.join(store_dir, INDEX_FILENAME)
+        self.files = [self.data_path, self.index_path]
+        with open(self.index_path, "r") as f:
+            self.meta = json.load(f)
+        self.height = self.meta["height"]
+        self.width = self.meta["width"]
+        self.num_frames = self.meta["num_frames"]
+        self.chunk_frames = self.meta["chunk_frames"]
+        self.shape = (self.height, (self.width + 7) // 8)
+        self.obj_ids = sorted(int(obj_id) for obj_id in self.meta["objects"])
+        self.chunks = {}  # obj_id -> {chunk: (offset, length)}
+        self.written = {}  # obj_id -> per-frame flags
+        for obj_id in self.obj_ids:
+            entry = self.meta["objects"][str(obj_id)]
+            self.chunks[obj_id] = {int(c): tuple(span) for c, span in entry["chunks"].items()}
+            self.written[obj_id] = np.zeros(self.num_frames, dtype=bool)
+            self.written[obj_id][entry["frames"]] = True
+        self.cached = {}  # obj_id -> (chunk, packed masks) last read or being written
+        self.mode = mode
+        self.file = open(self.data_path, "ab+" if mode == "w" else "rb")
+
+    @classmethod
+    def create(cls, store_dir, obj_ids, num_frames, height, width, chunk_frames=MASK_CHUNK_FRAMES):
+        """Creates an empty store for `obj_ids` (all frames unset), replacing any previous store in store_dir."""
+        os.makedirs(store_dir, exist_ok=True)
+        # Stores of a previous run (and objects it tracked) would otherwise be re-rendered
+        for old_file in LegacyMaskStore.files_in(store_dir) + [os.path.join(store_dir, DATA_FILENAME)]:
+            if os.path.exists(old_file):
+                os.remove(old_file)
+        meta = {
+            "version": MASK_STORE_VERSION,
+            "format": "packbits-zlib",
+            "num_frames": num_frames,
+            "height": height,
+            "width": width,
+            "chunk_frames": chunk_frames,
+            "objects": {str(obj_id): {"frames": [], "chunks": {}} for obj_id in obj_ids},
+        }
+        cls._write_index(os.path.join(store_dir, INDEX_FILENAME), meta)
+        return cls(store_dir, mode="w")
+
+    @staticmethod
+    def exists(store_dir):
+        return (os.path.exists(os.path.join(store_dir, DATA_FILENAME))
+                and os.path.exists(os.path.join(store_dir, INDEX_FILENAME)))
+
+    @staticmethod
+    def _write_index(index_path, meta):
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, index_path)
+
+    def __len__(self):
+        return self.num_frames
+
+    def has_frame(self, obj_id, frame_idx):
+        return bool(self.written[obj_id][frame_idx])
+
+    def frame_indices(self, obj_id=None):
+        """Indices of the frames that hold a mask (of `obj_id`, or of any object)."""
+        if obj_id is not None:
+            return np.flatnonzero(self.written[obj_id]).tolist()
+        return np.flatnonzero(np.any([self.written[i] for i in self.obj_ids], axis=0)).tolist() if self.obj_ids else []
+
+    def _load_chunk(self, obj_id, chunk):
+        """Packed masks (chunk_frames, H, ceil(W/8)) of one chunk; zeros if it was never written."""
+        cached = self.cached.get(obj_id)
+        if cached is not None and cached[0] == chunk:
+            return cached[1]
+        if self.mode == "w" and cached is not None:
+            self._flush(obj_id)
+        span = self.chunks[obj_id].get(chunk)
+        if span is None:
+            packed = np.zeros((self.chunk_frames, *self.shape), dtype=np.uint8)
+        else:
+            self.file.seek(span[0])
+            data = zlib.decompress(self.file.read(span[1]))
+            packed = np.frombuffer(data, dtype=np.uint8).reshape(-1, *self.shape)
+            if self.mode == "w":
+                packed = np.concatenate([packed, np.zeros((self.chunk_frames - len(packed), *self.shape), np.uint8)])
+        self.cached[obj_id] = (chunk, packed)
+        return packed
+
+    def _flush(self, obj_id):
+        """Compresses the chunk being written for obj_id and appends it to masks.bin."""
+        chunk, packed = self.cached.pop(obj_id)
+        frames = min(self.chunk_frames, self.num_frames - chunk * self.chunk_frames)
+        data = zlib.compress(np.ascontiguousarray(packed[:frames]).tobytes(), MASK_COMPRESS_LEVEL)
+        self.file.seek(0, os.SEEK_END)
+        self.chunks[obj_id][chunk] = (self.file.tell(), len(data))
+        self.file.write(data)
+
+    def write(self, obj_id, frame_idx, mask):
+        """Stores a boolean (H, W) mask."""
+        self.write_packed(obj_id, frame_idx, pack_mask(mask))
+
+    def write_packed(self, obj_id, frame_idx, packed):
+        """
+        Stores an already bit-packed mask (see pack_mask). Chunks are written out once a
+        frame of another chunk arrives, so frames are best written in order (a chunk that
+        is written again is appended anew).
+        """
+        chunk, offset = divmod(frame_idx, self.chunk_frames)
+        self._load_chunk(obj_id, chunk)[offset] = packed
+        self.written[obj_id][frame_idx] = True
+
+    def read_packed(self, obj_id, frame_idx):
+        chunk, offset = divmod(frame_idx, self.chunk_frames)
+        return self._load_chunk(obj_id, chunk)[offset]
+
+    def read(self, obj_id, frame_idx):
+        """Returns the boolean (H, W) mask of a frame."""
+        if not self.written[obj_id][frame_idx]:
+            raise KeyError(f"No mask stored for object {obj_id} on frame {frame_idx}")
+        return unpack_mask(self.read_packed(obj_id, frame_idx), self.width)
+
+    def close(self):
+        """Writes out the pending chunks and records the written frames."""
+        if self.file is None:
+            return
+        if self.mode == "w":
+            for obj_id in list(self.cached):
+                self._flush(obj_id)
+            self.file.flush()
+            for obj_id in self.obj_ids:
+                self.meta["objects"][str(obj_id)] = {
+                    "frames": self.frame_indices(obj_id),
+                    "chunks": {str(c): list(span) for c, span in sorted(self.chunks[obj_id].items())},
+                }
+            self._write_index(self.index_path, self.meta)
+        self.file.close()
+        self.file = None
+        self.cached = {}
+
+class LegacyMaskStore:
+    """
+    Read-only access to the stores of version 1: one bit-packed (num_frames, H, ceil(W/8))
+    obj_<id>.npy per object (memory-mapped) with a JSON sidecar. Same reading interface
+    as MaskStore.
+    """
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.files = self.files_in(store_dir)
+        self.packed = {}
+        self.written = {}
+        for path in sorted(glob.glob(os.path.join(store_dir, "obj_*.json"))):
+            name = os.path.splitext(os.path.basename(path))[0]
+            if not name[4:].isdigit() or not os.path.exists(os.path.join(store_dir, name + ".npy")):
+                continue
+            with open(path, "r") as f:
+                meta = json.load(f)
+            obj_id = int(name[4:])
+            self.height, self.width = meta["height"], meta["width"]
+            self.written[obj_id] = np.zeros(meta["num_frames"], dtype=bool)
+            self.written[obj_id][meta["frames"]] = True
+            self.packed[obj_id] = np.load(os.path.join(store_dir, name + ".npy"), mmap_mode="r")
+        self.obj_ids = sorted(self.packed)
+
+    @staticmethod
+    def files_in(store_dir):
+        return sorted(glob.glob(os.path.join(store_dir, "obj_*.npy")) + glob.glob(os.path.join(store_dir, "obj_*.json")))
+
+    @classmethod
+    def exists(cls, store_dir):
+        return any(path.endswith(".npy") for path in cls.files_in(store_dir))
+
+    def has_frame(self, obj_id, frame_idx):
+        return bool(self.written[obj_id][frame_idx])
+
+    def frame_indices(self, obj_id=None):
+        if obj_id is not None:
+            return np.flatnonzero(self.written[obj_id]).tolist()
+        return sorted(set().union(*[np.flatnonzero(w).tolist() for w in self.written.values()]))
+
+    def read(self, obj_id, frame_idx):
+        if not self.written[obj_id][frame_idx]:
+            raise KeyError(f"No mask stored for object {obj_id} on frame {frame_idx}")
+        return unpack_mask(np.asarray(self.packed[obj_id][frame_idx]), self.width)
+
+    def close(self):
+        self.packed = {}
@@ -0,0 +1,82 @@
+# logic/memory_monitor.py
+import os
+import sys
+import resource
+import threading
+
+def current_rss_bytes():
+    """
+    Returns the resident memory of this process in bytes.
+    Reads /proc on Linux; elsewhere falls back to the peak reported by getrusage.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS, kilobytes on Linux
+        return peak if sys.platform == "darwin" else peak * 1024
+
+class PeakMemoryMonitor:
+    """
+    Records the peak memory of a block of work: process RSS and, on CUDA, the memory
+    allocated on the device (torch.cuda.memory_allocated) are sampled every `interval`
+    seconds in a background thread, and the monitor keeps its own maximum of each.
+    The process-wide CUDA peak counters are never reset, so monitors of concurrent
+    stages (e.g. jobs on several threads) do not disturb each other; spikes shorter
+    than the interval can be missed.
+
+        with PeakMemoryMonitor(device) as monitor:
+            ...
+        monitor.summary()  # {"peak_rss_mb": ..., "peak_cuda_mb": ...}
+    """
+    def __init__(self, device=None, interval=0.05):
+        self.device = device
+        # torch is only imported for CUDA devices, so CPU-only processes (e.g. batch.py's pool) stay light
+        self.cuda = device is not None and getattr(device, "type", str(device).split(":")[0]) == "cuda"
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_cuda = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _take_sample(self):
+        self.peak_rss = max(self.peak_rss, current_rss_bytes())
+        if self.cuda:
+            import torch
+            self.peak_cuda = max(self.peak_cuda or 0, torch.cuda.memory_allocated(self.device))
+
+    def _sample(self):
+        while True:
+            self._take_sample()
+            if self._stop.wait(self.interval):
+                break
+
+    def start(self):
+        self.peak_rss = 0
+        self.peak_cuda = None
+        self._take_sample()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._take_sample()
+        return self.summary()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def summary(self):
+        """Peak memory in MB (peak_cuda_mb is None on CPU)."""
+        return {
+            "peak_rss_mb": round(self.peak_rss / 2**20, 1),
+            "peak_cuda_mb": round(self.peak_cuda / 2**20, 1) if self.peak_cuda is not None else None,
+        }
@@ -0,0 +1,217 @@
+# logic/run_metrics.py
+import os
+import json
+import time
+import statistics
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from config import METRICS_HOST, METRICS_PORT
+from logic.memory_monitor import PeakMemoryMonitor
+
+RUNS_FILENAME = "runs.jsonl"
+# Pipeline order of the instrumented stages (summaries list unknown stages after these)
+STAGES = ["cut", "session_init", "propagate", "trajectory_csv", "plots", "encode", "rerender"]
+
+def runs_path(project_dir):
+    return os.path.join(project_dir, "metadata", RUNS_FILENAME)
+
+def append_run(project_dir, record):
+    """Appends one stage record to the project's metadata/runs.jsonl (skipped for folders that are not projects)."""
+    if not os.path.isdir(os.path.join(project_dir, "metadata")):
+        return
+    # One write per record, so lines appended by several processes do not interleave
+    with open(runs_path(project_dir), "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+def load_runs(project_dir):
+    """The stage records of a project, oldest first."""
+    records = []
+    try:
+        with open(runs_path(project_dir), "r") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue  # Line cut short by a crash
+    except OSError:
+        pass
+    return records
+
+def summarize_runs(records):
+    """
+    Per-stage aggregate of stage records, in pipeline order:
+    runs, failures, cancellations and, over the successful runs, wall time (median / mean / max),
+    median frames/sec and the highest peak RSS / accelerator memory.
+    """
+    by_stage = {}
+    for record in records:
+        by_stage.setdefault(record.get("stage", "?"), []).append(record)
+    order = [s for s in STAGES if s in by_stage] + sorted(s for s in by_stage if s not in STAGES)
+
+    summary = []
+    for stage in order:
+        ok = [r for r in by_stage[stage] if r.get("status") == "ok"]
+        times = [r["wall_s"] for r in ok]
+        fps = [r["fps"] for r in ok if r.get("fps")]
+        rss = [r["peak_rss_mb"] for r in ok if r.get("peak_rss_mb") is not None]
+        cuda = [r["peak_cuda_mb"] for r in ok if r.get("peak_cuda_mb") is not None]
+        summary.append({
+            "stage": stage,
+            "runs": len(by_stage[stage]),
+            "failed": sum(1 for r in by_stage[stage] if r.get("status") == "failed"),
+            "cancelled": sum(1 for r in by_stage[stage] if r.get("status") == "cancelled"),
+            "median_s": round(statistics.median(times), 3) if times else None,
+            "mean_s": round(statistics.mean(times), 3) if times else None,
+            "max_s": round(max(times), 3) if times else None,
+            "median_fps": round(statistics.median(fps), 2) if fps else None,
+            "max_rss_mb": max(rss) if rss else None,
+            "max_cuda_mb": max(cuda) if cuda else None,
+        })
+    return summary
+
+class MetricsRegistry:
+    """Per-stage totals of the stage records of this process, rendered in the Prometheus text format."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    def observe(self, record):
+        with self.lock:
+            totals = self.stages.setdefault(record["stage"], {
+                "runs": {}, "seconds": 0.0, "frames": 0, "last_seconds": 0.0, "last_fps": 0.0,
+                "peak_rss_mb": 0.0, "peak_cuda_mb": None,
+            })
+            totals["runs"][record["status"]] = totals["runs"].get(record["status"], 0) + 1
+            totals["seconds"] += record["wall_s"]
+            totals["frames"] += record.get("frames") or 0
+            if record["status"] == "ok":
+                totals["last_seconds"] = record["wall_s"]
+                totals["last_fps"] = record.get("fps") or 0.0
+            totals["peak_rss_mb"] = max(totals["peak_rss_mb"], record.get("peak_rss_mb") or 0.0)
+            if record.get("peak_cuda_mb") is not None:
+                totals["peak_cuda_mb"] = max(totals["peak_cuda_mb"] or 0.0, record["peak_cuda_mb"])
+
+    def render(self):
+        metrics = [
+            ("sam2vis_stage_runs_total", "counter", "Finished pipeline stages by status"),
+            ("sam2vis_stage_seconds_total", "counter", "Wall time spent in the stage"),
+            ("sam2vis_stage_frames_total", "counter", "Frames processed by the stage"),
+            ("sam2vis_stage_last_seconds", "gauge", "Wall time of the latest successful run of the stage"),
+            ("sam2vis_stage_last_fps", "gauge", "Frames per second of the latest successful run of the stage"),
+            ("sam2vis_stage_peak_rss_bytes", "gauge", "Highest process RSS seen during the stage"),
+            ("sam2vis_stage_peak_accelerator_bytes", "gauge", "Highest accelerator memory allocated during the stage"),
+        ]
+        with self.lock:
+            samples = {name: [] for name, _, _ in metrics}
+            for stage, totals in sorted(self.stages.items()):
+                for status, count in sorted(totals["runs"].items()):
+                    samples["sam2vis_stage_runs_total"].append((f'stage="{stage}",status="{status}"', count))
+                label = f'stage="{stage}"'
+                samples["sam2vis_stage_seconds_total"].append((label, round(totals["seconds"], 3)))
+                samples["sam2vis_stage_frames_total"].append((label, totals["frames"]))
+                samples["sam2vis_stage_last_seconds"].append((label, totals["last_seconds"]))
+                samples["sam2vis_stage_last_fps"].append((label, totals["last_fps"]))
+                samples["sam2vis_stage_peak_rss_bytes"].append((label, int(totals["peak_rss_mb"] * 2**20)))
+                if totals["peak_cuda_mb"] is not None:
+                    samples["sam2vis_stage_peak_accelerator_bytes"].append((label, int(totals["peak_cuda_mb"] * 2**20)))
+        lines = []
+        for name, kind, help_text in metrics:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{{{labels}}} {value}" for labels, value in samples[name]]
+        return "\n".join(lines) + "\n"
+
+# Shared by all stages of the process and served by start_metrics_server
+metrics = MetricsRegistry()
+
+class StageTimer:
+    """
+    Instruments one pipeline stage of a project: wall time, frames/sec and peak memory
+    (see PeakMemoryMonitor). When it stops, the record is appended to the project's
+    metadata/runs.jsonl and added to the process metrics.
+
+        with StageTimer(project_dir, "plots", variants=4) as stage:
+            ...
+            stage.frames = num_frames  # known at the end
+
+    start() / stop() can be used instead when the stage does not fit a with block;
+    set `error` before stop() for a stage that raised. Exceptions of the `cancelled`
+    types are recorded with status "cancelled", others with "failed".
+    Extra keyword arguments (and `extra`) are stored in the record as is.
+    """
+    def __init__(self, project_dir, stage, device=None, frames=None, cancelled=(), **extra):
+        self.project_dir = os.path.normpath(project_dir)
+        self.stage = stage
+        self.device = device
+        self.frames = frames
+        self.cancelled = cancelled
+        self.extra = extra
+        self.error = None
+        self.peak = None
+
+    def start(self):
+        self.monitor = PeakMemoryMonitor(self.device).start()
+        self.started = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def stop(self):
+        """Records the stage. Returns its peak memory (as PeakMemoryMonitor.stop)."""
+        wall = time.perf_counter() - self._start
+        self.peak = self.monitor.stop()
+        if self.error is None:
+            status = "ok"
+        else:
+            status = "cancelled" if isinstance(self.error, self.cancelled) else "failed"
+        record = {
+            "time": round(self.started, 3),
+            "stage": self.stage,
+            "status": status,
+            "wall_s": round(wall, 3),
+            "frames": self.frames,
+            "fps": round(self.frames / wall, 2) if self.frames and wall > 0 else None,
+            **self.peak,
+            "pid": os.getpid(),
+            **self.extra,
+        }
+        if self.error is not None:
+            record["error"] = f"{type(self.error).__name__}: {self.error}"[:200]
+        try:
+            append_run(self.project_dir, record)
+        except OSError as e:
+            print(f"[WARN] Could not record the {self.stage} stage: {e}")
+        metrics.observe(record)
+        return self.peak
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.error = exc
+        self.stop()
+        return False
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ["/", "/metrics"]:
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # No access log line per scrape
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Serves the process metrics at http://host:port/metrics in a background thread. Returns the server (None if the port is taken)."""
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"[WARN] Metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    print(f"[INFO] Metrics at http://{host}:{port}/metrics")
+    return server
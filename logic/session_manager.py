@@ -0,0 +1,147 @@
+# logic/session_manager.py
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+import torch
+from config import MAX_SESSIONS, SESSION_MEMORY_BUDGET_MB, MEMORY_PROFILE, FEATURE_CACHE
+from logic.tracker import SAM2Tracker, FrameWindow, get_tracker
+from logic.frame_source import load_project_frames, project_metadata
+
+def _nbytes(obj):
+    """Bytes held by the tensors/arrays in a (nested) dict, list or tuple."""
+    if torch.is_tensor(obj):
+        return obj.numel() * obj.element_size()
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, FrameWindow):
+        return _nbytes(obj.first) + _nbytes(obj.images)
+    if isinstance(obj, dict):
+        return sum(_nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(_nbytes(v) for v in obj)
+    return 0
+
+def session_nbytes(tracker):
+    """Approximate memory held by one tracking session (frames + inference state)."""
+    state = tracker.inference_state
+    if state is None:
+        return 0
+    total = _nbytes(tracker.frames)
+    for key in ["images", "cached_features", "output_dict_per_obj", "temp_output_dict_per_obj", "constants"]:
+        total += _nbytes(state.get(key))
+    if 0 not in state["cached_features"]:
+        total += _nbytes(tracker.frame0_features)
+    return total
+
+def frames_version(proj_dir):
+    """
+    Identifies the current cut of a project: metadata.json is rewritten by every cut
+    (see run_ffmpeg_cutting), so its mtime and size change when the frames are re-cut.
+    """
+    try:
+        stat = os.stat(os.path.join(proj_dir, "metadata", "metadata.json"))
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def prepare_session(tracker, proj_dir, memory_profile=MEMORY_PROFILE, from_jpegs=False):
+    """
+    Initializes a user's tracker session on a project, unless it already holds the
+    project's current cut with the same memory profile.
+    Projects cut with frame_source="pipe" are tracked from decoded frames, never from
+    their (gallery) JPEGs: from memory when the clip fits (see load_project_frames),
+    else decoded from the video window by window.
+    from_jpegs always reads the frames/ JPEGs, e.g. when the frames were cut by another
+    process and decoding the video again here would only duplicate that work.
+    Returns True if the session was (re-)initialized.
+    """
+    version = frames_version(proj_dir)
+    if (tracker.inference_state is not None and tracker.memory_profile == memory_profile
+            and tracker.frames_version == version):
+        return False
+    meta = project_metadata(proj_dir)
+    decode = meta.get("frame_source") == "pipe" and not from_jpegs
+    frames = load_project_frames(proj_dir) if decode else None
+    feature_cache_dir = os.path.join(proj_dir, "feature_cache") if FEATURE_CACHE else None
+    tracker.init_session(os.path.join(proj_dir, "frames"), frames=frames, memory_profile=memory_profile,
+                         feature_cache_dir=feature_cache_dir, num_frames=meta.get("num_frames"), decode=decode)
+    tracker.frames_version = version
+    return True
+
+class SessionManager:
+    """
+    Keeps one SAM2Tracker per (user, project), all sharing the weights of the
+    shared model (see get_tracker), so concurrent users never overwrite each other's
+    inference state and switching back to a recent project skips re-loading its frames.
+
+    Sessions are used through session(), which holds the session's lock; idle
+    sessions are evicted least-recently-used first once there are more than
+    `max_sessions` or together they exceed `max_mb`.
+    """
+    def __init__(self, max_sessions=MAX_SESSIONS, max_mb=SESSION_MEMORY_BUDGET_MB):
+        self.max_sessions = max(1, max_sessions)
+        self.max_bytes = max_mb * 2**20 if max_mb else None
+        self.sessions = OrderedDict()  # (user, project_dir) -> SAM2Tracker
+        self.users = {}  # (user, project_dir) -> callers currently inside session()
+        self.sizes = {}  # (user, project_dir) -> bytes, measured while the session was idle
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def session(self, user, project_dir):
+        """
+        Yields the user's tracker for project_dir with its lock held, creating an
+        empty one if needed (check `inference_state is None` and call init_session).
+        """
+        key = (user, project_dir)
+        # Loading the shared weights may take a while, so not under the manager lock
+        predictor = get_tracker().predictor
+        with self.lock:
+            tracker = self.sessions.get(key)
+            if tracker is None:
+                tracker = SAM2Tracker(predictor=predictor)
+                self.sessions[key] = tracker
+            self.sessions.move_to_end(key)
+            self.users[key] = self.users.get(key, 0) + 1
+        try:
+            with tracker.lock:
+                yield tracker
+        finally:
+            with self.lock:
+                self.users[key] -= 1
+                if not self.users[key]:
+                    del self.users[key]
+            self.evict()
+
+    def evict(self):
+        """Drops idle sessions (oldest first) until the count and byte budgets are met."""
+        with self.lock:
+            # Sessions in use are being mutated, so they keep their last measured size
+            for key, tracker in self.sessions.items():
+                if not self.users.get(key):
+                    self.sizes[key] = session_nbytes(tracker)
+            total = sum(self.sizes.get(key, 0) for key in self.sessions)
+            # The most recently used session is always kept
+            for key in list(self.sessions)[:-1]:
+                if len(self.sessions) <= self.max_sessions and (not self.max_bytes or total <= self.max_bytes):
+                    break
+                if self.users.get(key):
+                    continue
+                size = self.sizes.pop(key, 0)
+                self.sessions.pop(key).close()
+                total -= size
+                print(f"[INFO] Evicted tracking session {key} ({size / 2**20:.0f} MB)")
+
+    def close_project(self, project_dir):
+        """
+        Drops every idle user's session on a project (e.g. when it is deleted). Sessions
+        in use are left to prepare_session, which re-initializes them after a re-cut.
+        """
+        with self.lock:
+            for key in [k for k in self.sessions if k[1] == project_dir and not self.users.get(k)]:
+                self.sessions.pop(key).close()
+                self.sizes.pop(key, None)
+
+# Shared by the Tracking and Management tabs
+tracking_sessions = SessionManager()
@@ -0,0 +1,61 @@
+# logic/thumbnails.py
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from config import THUMBNAIL_SIZE, THUMBNAIL_FORMAT, WRITER_WORKERS
+
+# Thumbnails live in a subfolder next to the originals, e.g. masks/thumbs/00012.webp
+THUMBNAIL_DIRNAME = "thumbs"
+
+def thumbnail_path(image_path):
+    folder, name = os.path.split(image_path)
+    return os.path.join(folder, THUMBNAIL_DIRNAME, f"{os.path.splitext(name)[0]}.{THUMBNAIL_FORMAT}")
+
+def save_thumbnail(image, image_path, size=THUMBNAIL_SIZE):
+    """
+    Writes the thumbnail of `image_path` from an image that is already in memory
+    (PIL image or RGB array), so frame writers do not decode their output again.
+    """
+    if not isinstance(image, Image.Image):
+        image = Image.fromarray(image)
+    thumb = image.copy()
+    thumb.thumbnail((size, size))
+    path = thumbnail_path(image_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Replaced rather than overwritten in place: the file may be hardlinked from the shared frame cache.
+    # The temporary file is unique per call, since two writers (e.g. gallery paging and post-processing)
+    # may build the same thumbnail at once
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix="_" + os.path.basename(path), dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            thumb.save(f, format=THUMBNAIL_FORMAT, quality=80)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+def _is_current(image_path, thumb_path):
+    return os.path.exists(thumb_path) and os.path.getmtime(thumb_path) >= os.path.getmtime(image_path)
+
+def make_thumbnail(image_path, size=THUMBNAIL_SIZE):
+    """Returns the thumbnail of an image file, (re)building it if missing or older than the image."""
+    path = thumbnail_path(image_path)
+    if _is_current(image_path, path):
+        return path
+    with Image.open(image_path) as img:
+        # JPEG draft mode decodes at a reduced scale directly (much faster than a full decode)
+        img.draft("RGB", (size, size))
+        return save_thumbnail(img.convert("RGB"), image_path, size)
+
+def ensure_thumbnails(image_paths, size=THUMBNAIL_SIZE, workers=WRITER_WORKERS):
+    """Thumbnails of several images (e.g. one gallery page), missing ones built in parallel."""
+    missing = [p for p in image_paths if not _is_current(p, thumbnail_path(p))]
+    if len(missing) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda p: make_thumbnail(p, size), missing))
+    elif missing:
+        make_thumbnail(missing[0], size)
+    return [thumbnail_path(p) for p in image_paths]
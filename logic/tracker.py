@@ -1,101 +1,693 @@
 # logic/tracker.py
 import os
+import time
+import threading
 import torch
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+import sam2.sam2_video_predictor as sam2_video_predictor
 from sam2.build_sam import build_sam2_video_predictor
-from config import SAM2_CHECKPOINT, SAM2_CONFIG
-from logic.visualizer import save_tracking_frame
+from config import SAM2_CHECKPOINT, SAM2_CONFIG, PROPAGATION_WINDOW, MEMORY_PROFILE, WRITER_WORKERS, WRITER_QUEUE_DEPTH, WRITER_USE_PROCESSES, WRITE_MASK_JPEGS, MASK_MOMENTS, FEATURE_CACHE_MAX_MB
+from logic.visualizer import blend_tracking_frame, object_color, StreamingVideoEncoder
+from logic.writer_pool import WriterPool
+from logic.mask_store import MaskStore, unpack_mask
+from logic.run_metrics import StageTimer
+from logic.thumbnails import save_thumbnail
+from logic.feature_cache import FeatureCache, install_feature_cache, init_with_cache, project_frames_key
+from logic.frame_source import project_frame_decoder
 from contextlib import nullcontext
 
+# Same normalization as sam2.utils.misc.load_video_frames
+IMG_MEAN = (0.485, 0.456, 0.406)
+IMG_STD = (0.229, 0.224, 0.225)
+
+class PropagationCancelled(Exception):
+    """Raised by SAM2Tracker.propagate when its cancel event is set."""
+
+# init_state options of each memory profile (MEMORY_PROFILE in config.py)
+MEMORY_PROFILES = {
+    # Frames and tracking state on the compute device: fastest, most device memory
+    "resident": {"offload_video_to_cpu": False, "offload_state_to_cpu": False, "async_loading_frames": False},
+    # Preprocessed frames in CPU memory, moved to the device one at a time
+    "offload_video": {"offload_video_to_cpu": True, "offload_state_to_cpu": False, "async_loading_frames": False},
+    # Frames and per-frame tracking outputs in CPU memory: lowest device memory, slower
+    "offload_state": {"offload_video_to_cpu": True, "offload_state_to_cpu": True, "async_loading_frames": False},
+    # Frames preprocessed lazily in the background, ahead of propagation
+    "async": {"offload_video_to_cpu": True, "offload_state_to_cpu": False, "async_loading_frames": True},
+}
+
+# Shared tracker, loaded on first use or warmed up in the background (see get_tracker)
+_tracker = None
+_tracker_lock = threading.Lock()
+_tracker_error = None
+_warmup_thread = None
+
+class InMemoryVideo:
+    """
+    Preprocessed frames (tensor or FrameWindow) passed to init_state as its video_path.
+    SAM2's init_state only accepts a JPEG folder or an MP4 path, so its frame loader is
+    wrapped once (see _load_video_frames) to return these frames as they are. Each call
+    carries its own frames, so concurrent sessions cannot pick up each other's video.
+    """
+    def __init__(self, images, video_height, video_width):
+        self.images = images
+        self.video_height = video_height
+        self.video_width = video_width
+
+_sam2_load_video_frames = sam2_video_predictor.load_video_frames
+
+def _load_video_frames(video_path, image_size, offload_video_to_cpu, **kwargs):
+    """SAM2's load_video_frames, plus InMemoryVideo inputs."""
+    if not isinstance(video_path, InMemoryVideo):
+        return _sam2_load_video_frames(video_path=video_path, image_size=image_size,
+                                       offload_video_to_cpu=offload_video_to_cpu, **kwargs)
+    images = video_path.images
+    compute_device = kwargs.get("compute_device")
+    if not offload_video_to_cpu and torch.is_tensor(images) and compute_device is not None:
+        images = images.to(compute_device)
+    return images, video_path.video_height, video_path.video_width
+
+sam2_video_predictor.load_video_frames = _load_video_frames
+
+def _frame_to_tensor(frame, image_size):
+    """Resizes one RGB uint8 frame to the model input size, as SAM2's JPEG loader does."""
+    img_np = np.array(Image.fromarray(frame).resize((image_size, image_size)))
+    return torch.from_numpy(img_np).permute(2, 0, 1)
+
+def frames_to_tensor(frames, image_size):
+    """
+    Converts a list of (H, W, 3) uint8 RGB arrays into the normalized
+    (N, 3, image_size, image_size) float tensor expected by SAM2.
+    """
+    images = torch.zeros(len(frames), 3, image_size, image_size, dtype=torch.float32)
+    # PIL releases the GIL while resizing, so threads give a real speedup here
+    with ThreadPoolExecutor(max_workers=WRITER_WORKERS) as executor:
+        for n, img in enumerate(executor.map(lambda f: _frame_to_tensor(f, image_size), frames)):
+            images[n] = img
+    images /= 255.0
+    images -= torch.tensor(IMG_MEAN, dtype=torch.float32)[:, None, None]
+    images /= torch.tensor(IMG_STD, dtype=torch.float32)[:, None, None]
+    return images
+
+def list_frame_paths(frames_dir):
+    """Returns the frame JPEGs of frames_dir in frame order (same ordering as SAM2's loader)."""
+    names = [
+        p for p in os.listdir(frames_dir)
+        if os.path.splitext(p)[-1] in [".jpg", ".jpeg", ".JPG", ".JPEG"]
+    ]
+    names.sort(key=lambda p: int(os.path.splitext(p)[0]))
+    return [os.path.join(frames_dir, p) for p in names]
+
+def _read_rgb(path):
+    with Image.open(path) as img:
+        return np.array(img.convert("RGB"))
+
+def jpeg_frame_loader(frame_paths):
+    """load_frames(start, end) for FrameWindow, reading the frame JPEGs [start, end) from disk."""
+    return lambda start, end: [_read_rgb(path) for path in frame_paths[start:end]]
+
+class FrameWindow:
+    """
+    Stand-in for the (N, 3, S, S) image tensor of SAM2's inference state that only
+    holds one window of preprocessed frames at a time.
+    Frames are pulled per window through load_frames(start, end), which reads them from
+    disk (jpeg_frame_loader) or decodes that range of the video (project_frame_decoder),
+    so the clip is never materialized as a whole.
+    
+    SAM2 reads inference_state["images"] one frame at a time (its own async loader
+    relies on this too), so when propagation crosses into the next window the
+    previous one is released and the next `window_size` frames are preprocessed.
+    Frame 0 is kept aside since prompts are always added there.
+    Windows stay on the CPU; SAM2 moves each frame to the device when it is used.
+    With prefetch=True the next window is preprocessed in a background thread while
+    the current one is tracked (at most two windows in memory).
+    """
+    def __init__(self, load_frames, num_frames, image_size, window_size, prefetch=False):
+        self.load_frames = load_frames  # (start, end) -> (H, W, 3) uint8 RGB arrays of frames [start, end)
+        self.num_frames = num_frames
+        self.image_size = image_size
+        self.window_size = window_size
+        self.start = None
+        self.images = None
+        self.prefetcher = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        self.next_window = None  # (start, future)
+        first = load_frames(0, 1)[0]
+        self.video_height, self.video_width = first.shape[:2]
+        self.first = frames_to_tensor([first], image_size)[0]
+        if self.prefetcher is not None and num_frames > 1:
+            self._prefetch(0)
+
+    def _load_window(self, start):
+        end = min(start + self.window_size, self.num_frames)
+        frames = self.load_frames(start, end)
+        if len(frames) != end - start:
+            raise RuntimeError(f"Expected frames {start}-{end - 1}, got {len(frames)} frames")
+        return frames_to_tensor(frames, self.image_size)
+
+    def _prefetch(self, start):
+        if start < self.num_frames:
+            self.next_window = (start, self.prefetcher.submit(self._load_window, start))
+
+    def __len__(self):
+        return self.num_frames
+
+    def __getitem__(self, idx):
+        if idx == 0:
+            return self.first
+        start = idx - idx % self.window_size
+        if start != self.start:
+            # Drop the finished window before allocating the next one
+            self.images = None
+            if self.next_window is not None and self.next_window[0] == start:
+                self.images = self.next_window[1].result()
+            else:
+                self.images = self._load_window(start)
+            self.next_window = None
+            self.start = start
+            if self.prefetcher is not None:
+                self._prefetch(start + self.window_size)
+        return self.images[idx - start]
+
+# Per-frame trajectory columns produced by compute_mask_stats
+MASK_STAT_COLUMNS = ["x", "y", "area", "x_min", "y_min", "x_max", "y_max"]
+MASK_MOMENT_COLUMNS = ["mu20", "mu02", "mu11"]
+
+def compute_mask_stats(mask_logits, moments=False):
+    """
+    Computes per-object mask statistics with tensor reductions on the device the
+    logits live on, so only a few scalars per object are copied to the host.
+    
+    mask_logits: (K, 1, H, W) or (K, H, W) logits; pixels > 0 belong to the mask.
+    Returns a (K, C) float64 CPU tensor with the columns of MASK_STAT_COLUMNS
+    (centroid x/y, area, inclusive bounding box), plus the central second moments
+    MASK_MOMENT_COLUMNS if requested. Empty masks give area 0 and NaN elsewhere.
+    """
+    h, w = mask_logits.shape[-2:]
+    mask = (mask_logits > 0.0).reshape(-1, h, w).float()
+    device = mask.device
+    
+    # Row/column projections are exact in float32 (counts < 2^24); weighted sums in float64
+    col_counts = mask.sum(dim=1).double()  # (K, W)
+    row_counts = mask.sum(dim=2).double()  # (K, H)
+    xs = torch.arange(w, device=device, dtype=torch.float64)
+    ys = torch.arange(h, device=device, dtype=torch.float64)
+    
+    area = col_counts.sum(dim=-1)
+    safe_area = area.clamp(min=1)
+    cx = (col_counts * xs).sum(dim=-1) / safe_area
+    cy = (row_counts * ys).sum(dim=-1) / safe_area
+    
+    # First/last occupied column and row
+    has_col = col_counts > 0
+    has_row = row_counts > 0
+    x_min = has_col.double().argmax(dim=-1).double()
+    x_max = (w - 1) - has_col.flip(-1).double().argmax(dim=-1).double()
+    y_min = has_row.double().argmax(dim=-1).double()
+    y_max = (h - 1) - has_row.flip(-1).double().argmax(dim=-1).double()
+    
+    columns = [cx, cy, area, x_min, y_min, x_max, y_max]
+    if moments:
+        mu20 = (col_counts * xs * xs).sum(dim=-1) / safe_area - cx * cx
+        mu02 = (row_counts * ys * ys).sum(dim=-1) / safe_area - cy * cy
+        # sum_xy m*x*y = sum_y y * (m @ xs)
+        row_x_sums = torch.matmul(mask, xs.float()).double()  # (K, H)
+        mu11 = (row_x_sums * ys).sum(dim=-1) / safe_area - cx * cy
+        columns.extend([mu20, mu02, mu11])
+    
+    stats = torch.stack(columns, dim=-1)
+    stats[area == 0, :] = float("nan")
+    stats[area == 0, 2] = 0.0
+    return stats.cpu()
+
+def pack_mask_tensor(mask):
+    """
+    Bit-packs a boolean (..., H, W) mask on its device, matching np.packbits along the width.
+    Copying the packed mask to the host moves 8x fewer bytes than the bool mask.
+    """
+    w = mask.shape[-1]
+    mask = mask.to(torch.uint8)
+    pad = (-w) % 8
+    if pad:
+        mask = torch.nn.functional.pad(mask, (0, pad))
+    weights = torch.tensor([128, 64, 32, 16, 8, 4, 2, 1], device=mask.device, dtype=torch.uint8)
+    return (mask.reshape(*mask.shape[:-1], -1, 8) * weights).sum(dim=-1).to(torch.uint8)
+
+def _write_tracking_frame(frame_idx, image, packed_masks, width, colors, save_path=None, encoder=None):
+    """
+    Writer-pool task: unpacks the (K, H, W/8) object masks and renders one composited
+    frame, saving it as JPEG (save_path) and/or piping it into the video encoder.
+    """
+    masks = [unpack_mask(packed, width) for packed in packed_masks]
+    blended = blend_tracking_frame(image, masks, color=colors)
+    if save_path:
+        blended.save(save_path)
+        save_thumbnail(blended, save_path)
+    if encoder is not None:
+        encoder.write(frame_idx, blended)
+
+def load_sam2_predictor(config_file, ckpt_path, device):
+    """
+    Builds the SAM2 video predictor and loads the checkpoint through a memory map, so
+    the weights are paged in from the file instead of first being read into a
+    separate CPU copy. On CPU the parameters keep pointing at the mapped file.
+    """
+    predictor = build_sam2_video_predictor(config_file, None, device="cpu")
+    if ckpt_path is not None:
+        try:
+            checkpoint = torch.load(ckpt_path, map_location="cpu", weights_only=True, mmap=True)
+        except RuntimeError:
+            # Legacy (non-zip) checkpoints cannot be memory-mapped
+            checkpoint = torch.load(ckpt_path, map_location="cpu", weights_only=True)
+        missing_keys, unexpected_keys = predictor.load_state_dict(checkpoint["model"], assign=device.type == "cpu")
+        if missing_keys or unexpected_keys:
+            raise RuntimeError(f"Checkpoint mismatch. Missing: {missing_keys}, unexpected: {unexpected_keys}")
+    return predictor.to(device).eval()
+
+def feature_cache_key(predictor):
+    """Identifies the image encoder whose features are cached (config, checkpoint file and input size)."""
+    ckpt = "none"
+    if SAM2_CHECKPOINT is not None and os.path.exists(SAM2_CHECKPOINT):
+        stat = os.stat(SAM2_CHECKPOINT)
+        ckpt = f"{os.path.abspath(SAM2_CHECKPOINT)}:{stat.st_size}:{int(stat.st_mtime)}"
+    return f"{SAM2_CONFIG}|{ckpt}|{predictor.image_size}"
+
 class SAM2Tracker:
-    def __init__(self):
-        # Detect device
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        if self.device.type == "cuda":
-            # Enable bfloat16 and tf32 for faster inference on Ampere+ GPUs
-            if torch.cuda.get_device_properties(0).major >= 8:
-                torch.backends.cuda.matmul.allow_tf32 = True
-                torch.backends.cudnn.allow_tf32 = True
-        
-        print(f"[INFO] Loading SAM2 model on {self.device}...")
-        self.predictor = build_sam2_video_predictor(SAM2_CONFIG, SAM2_CHECKPOINT, device=self.device)
+    def __init__(self, predictor=None):
+        """
+        Loads the SAM2 model, or reuses the weights of an already loaded `predictor`
+        (SAM2 keeps all per-video data in the inference state, so one model can
+        serve several sessions).
+        """
+        if predictor is not None:
+            self.predictor = predictor
+            self.device = predictor.device
+        else:
+            # Detect device
+            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            if self.device.type == "cuda":
+                # Enable bfloat16 and tf32 for faster inference on Ampere+ GPUs
+                if torch.cuda.get_device_properties(0).major >= 8:
+                    torch.backends.cuda.matmul.allow_tf32 = True
+                    torch.backends.cudnn.allow_tf32 = True
+            
+            print(f"[INFO] Loading SAM2 model on {self.device}...")
+            start = time.time()
+            self.predictor = load_sam2_predictor(SAM2_CONFIG, SAM2_CHECKPOINT, self.device)
+            install_feature_cache(self.predictor)
+            print(f"[INFO] SAM2 model loaded in {time.time() - start:.1f}s")
+        # Serializes work on this session (see logic/session_manager.py)
+        self.lock = threading.RLock()
         self.inference_state = None
+        self.frames = None
+        self.windowed = False
+        self.memory_profile = None
+        # Cut of the project the session was initialized on (see session_manager.frames_version)
+        self.frames_version = None
+        self.last_peak_memory = None
+        # Frame-0 backbone features, computed once per session (see _restore_frame0_features)
+        self.frame0_features = None
+        # Prompts currently applied on frame 0, {obj_id: (points, labels)}; None after a reset/propagation
+        self.applied_prompts = None
+        self.frame0_output = None
+
+    def init_session(self, frames_dir, frames=None, window_size=PROPAGATION_WINDOW, memory_profile=MEMORY_PROFILE,
+                     feature_cache_dir=None, num_frames=None, decode=False):
+        """
+        Initializes the SAM2 inference state.
+        If `frames` (list of RGB arrays) is given, the state is built from memory
+        and the JPEGs in frames_dir are never decoded.
+        Clips longer than `window_size` frames are loaded window by window (see
+        FrameWindow) instead of all at once, from the JPEGs in frames_dir or, with
+        `decode` or when those are incomplete, by decoding each window from the
+        project's video; None disables windowing. `num_frames` is the clip length
+        when frames_dir only holds some of its JPEGs (default: the JPEG count).
+        `memory_profile` selects where frames and state live (see MEMORY_PROFILES).
+        With `feature_cache_dir`, image-encoder features are kept on disk there
+        (see FeatureCache), so re-tracking the same cut of the project skips the encoder.
+        Recorded as the "session_init" stage of the project (see StageTimer).
+        """
+        if memory_profile not in MEMORY_PROFILES:
+            raise ValueError(f"Unknown memory profile: {memory_profile}")
+        options = MEMORY_PROFILES[memory_profile]
+        project_dir = os.path.dirname(os.path.normpath(frames_dir))
+        from_memory = frames is not None and not (window_size and len(frames) > window_size)
+        load_frames, source = None, "memory" if from_memory else "jpeg"
+        if not from_memory:
+            if not os.path.exists(frames_dir):
+                raise FileNotFoundError(f"Frames directory not found: {frames_dir}")
+            frame_paths = list_frame_paths(frames_dir)
+            num_frames = len(frames) if frames is not None else num_frames or len(frame_paths)
+            # Anything but SAM2's own read of the complete JPEG folder goes through a FrameWindow
+            if decode or len(frame_paths) < num_frames or (window_size and num_frames > window_size):
+                load_frames, source = self._window_loader(frames_dir, frame_paths, num_frames, decode)
+        feature_cache = None
+        if feature_cache_dir is not None:
+            frames_key = project_frames_key(project_dir, source)
+            if frames_key is not None:
+                max_bytes = FEATURE_CACHE_MAX_MB * 2**20 if FEATURE_CACHE_MAX_MB else None
+                feature_cache = FeatureCache(feature_cache_dir, feature_cache_key(self.predictor), frames_key, max_bytes)
 
-    def init_session(self, frames_dir):
-        """Initializes the SAM2 inference state with the path to video frames."""
-        if not os.path.exists(frames_dir):
-            raise FileNotFoundError(f"Frames directory not found: {frames_dir}")
-        self.inference_state = self.predictor.init_state(video_path=frames_dir)
+        # init_state encodes frame 0, which already goes through the cache
+        stage = StageTimer(project_dir, "session_init", self.device,
+                           memory_profile=memory_profile, feature_cache=feature_cache is not None)
+        with init_with_cache(feature_cache), stage:
+            if from_memory:
+                self.inference_state = self._init_state_from_frames(frames, window_size, options)
+            elif load_frames is not None:
+                images = FrameWindow(load_frames, num_frames, self.predictor.image_size, window_size or num_frames,
+                                     prefetch=options["async_loading_frames"])
+                self.inference_state = self._init_state_from_images(images, images.video_height, images.video_width,
+                                                                    options)
+            else:
+                # SAM2's own loader handles the async option for JPEG folders
+                self.inference_state = self.predictor.init_state(video_path=frames_dir, **options)
+            stage.frames = self.inference_state["num_frames"]
+            # Windowed sessions preprocess their frames during propagation instead
+            stage.extra["windowed"] = isinstance(self.inference_state["images"], FrameWindow)
+        self.inference_state["feature_cache"] = feature_cache
+        self.frames = frames
+        self.memory_profile = memory_profile
+        self.windowed = isinstance(self.inference_state["images"], FrameWindow)
+        if self.windowed:
+            print(f"[INFO] Windowed propagation: {self.inference_state['num_frames']} frames, {window_size} per window")
+        print(f"[INFO] Memory profile: {memory_profile}")
         self.predictor.reset_state(self.inference_state)
+        # init_state has just run the image encoder on frame 0 (reset_state keeps the cache)
+        self.frame0_features = self.inference_state["cached_features"].get(0)
+        self.applied_prompts = None
+        self.frame0_output = None
+
+    def close(self):
+        """Releases the frames and inference state of this session (the model is kept)."""
+        self.inference_state = None
+        self.frames = None
+        self.windowed = False
+        self.memory_profile = None
+        self.frames_version = None
+        self.frame0_features = None
+        self.applied_prompts = None
+        self.frame0_output = None
 
-    def _add_points(self, points, labels):
+    def _window_loader(self, frames_dir, frame_paths, num_frames, decode=False):
         """
-        Internal helper: Resets state and adds points to Frame 0.
+        (load_frames(start, end), source) of a windowed session: the JPEGs in frames_dir when all
+        num_frames are there and `decode` is not set, else the project's video decoded window by window.
+        """
+        if not decode and len(frame_paths) >= num_frames:
+            return jpeg_frame_loader(frame_paths), "jpeg"
+        decoder = project_frame_decoder(os.path.dirname(os.path.normpath(frames_dir)))
+        if decoder is not None:
+            print("[INFO] Session decodes its frames from the original video")
+            return decoder, "decoder"
+        if len(frame_paths) >= num_frames:
+            print("[WARN] Original video missing, the session reads the frame JPEGs instead")
+            return jpeg_frame_loader(frame_paths), "jpeg"
+        raise FileNotFoundError(f"Only {len(frame_paths)} of {num_frames} frames in {frames_dir} "
+                                "and the original video is missing")
+
+    def _init_state_from_frames(self, frames, window_size=None, options=MEMORY_PROFILES["resident"]):
+        """
+        Builds the inference state from in-memory frames (a clip that fits one window,
+        see init_session). With async loading, they are preprocessed in the background.
+        """
+        if len(frames) == 0:
+            raise RuntimeError("No frames to initialize the session with.")
+        if options["async_loading_frames"]:
+            window_size = window_size or len(frames)
+            images = FrameWindow(lambda start, end: frames[start:end], len(frames), self.predictor.image_size,
+                                 window_size, prefetch=True)
+        else:
+            images = frames_to_tensor(frames, self.predictor.image_size)
+        video_height, video_width = frames[0].shape[:2]
+        return self._init_state_from_images(images, video_height, video_width, options)
+
+    def _init_state_from_images(self, images, video_height, video_width, options=MEMORY_PROFILES["resident"]):
+        """Builds the inference state from preprocessed images (tensor or FrameWindow), see InMemoryVideo."""
+        return self.predictor.init_state(video_path=InMemoryVideo(images, video_height, video_width), **options)
+
+    def _restore_frame0_features(self):
+        """
+        SAM2 only caches the features of the last frame it encoded, so after a propagation
+        frame 0 would go through the image encoder again. Put the session's copy back.
+        """
+        cached = self.inference_state["cached_features"]
+        if 0 in cached:
+            self.frame0_features = cached[0]
+        elif self.frame0_features is not None:
+            self.inference_state["cached_features"] = {0: self.frame0_features}
+
+    def _add_points(self, points, labels, obj_ids=None, incremental=False):
+        """
+        Internal helper: adds points to Frame 0.
         Called by both preview and propagation methods.
+        `obj_ids` gives the object of each point (default: all points belong to object 1).
+        By default the state is reset first. With incremental=True only the objects whose
+        points changed since the last call are re-prompted (and removed objects dropped),
+        so repeated previews only run the prompt encoder and mask decoder.
+        Returns the object ids and the frame-0 mask logits of all objects.
         """
-        self.predictor.reset_state(self.inference_state)
+        if obj_ids is None:
+            obj_ids = [1] * len(points)
+        prompts = {}
+        for p, l, o in zip(points, labels, obj_ids):
+            obj_points, obj_labels = prompts.setdefault(int(o), ([], []))
+            obj_points.append((float(p[0]), float(p[1])))
+            obj_labels.append(int(l))
+        prompts = {o: (tuple(p), tuple(l)) for o, (p, l) in prompts.items()}
+        
+        self._restore_frame0_features()
+        if not incremental or self.applied_prompts is None:
+            self.predictor.reset_state(self.inference_state)
+            self.applied_prompts = {}
+        
+        changed = [o for o in sorted(prompts) if self.applied_prompts.get(o) != prompts[o]]
+        removed = [o for o in self.applied_prompts if o not in prompts]
+        if not changed and not removed and self.frame0_output is not None:
+            return self.frame0_output
         
-        points_np = np.array(points, dtype=np.float32)
-        labels_np = np.array(labels, dtype=np.int32)
+        # SAM2 feeds an object's previous mask back into the decoder when it is re-prompted,
+        # so changed objects are removed and added again to match a prompt from scratch
+        out_obj_ids, out_mask_logits = [], None
+        for obj_id in removed + [o for o in changed if o in self.applied_prompts]:
+            out_obj_ids, updated_frames = self.predictor.remove_object(
+                self.inference_state, obj_id, need_output=not changed
+            )
+            if updated_frames:
+                out_mask_logits = updated_frames[0][1]
         
-        # Add new points (obj_id=1)
+        # Add the points of each object (all objects share frame 0 features)
         ctx = torch.autocast("cuda", dtype=torch.bfloat16) if self.device.type == "cuda" else nullcontext()
         with ctx:
-            _, out_obj_ids, out_mask_logits = self.predictor.add_new_points(
-                inference_state=self.inference_state,
-                frame_idx=0,
-                obj_id=1,
-                points=points_np,
-                labels=labels_np,
-            )
-        return out_mask_logits
+            for obj_id in changed:
+                obj_points, obj_labels = prompts[obj_id]
+                _, out_obj_ids, out_mask_logits = self.predictor.add_new_points_or_box(
+                    inference_state=self.inference_state,
+                    frame_idx=0,
+                    obj_id=obj_id,
+                    points=np.array(obj_points, dtype=np.float32),
+                    labels=np.array(obj_labels, dtype=np.int32),
+                    clear_old_points=True,
+                )
+        self.applied_prompts = prompts
+        self.frame0_output = (list(out_obj_ids), out_mask_logits)
+        return self.frame0_output
 
-    def get_first_frame_mask(self, points, labels):
+    def _prune_memory(self, frame_idx):
+        """
+        Drops the outputs of frames the model will no longer attend to: memory only
+        reaches back num_maskmem (strided) frames and object pointers
+        max_obj_ptrs_in_encoder frames, plus the conditioning frame 0 which is kept.
+        This keeps the inference state a constant size on long clips.
+        """
+        model = self.predictor
+        keep = max(model.num_maskmem * model.memory_temporal_stride_for_eval, model.max_obj_ptrs_in_encoder) + 1
+        oldest = frame_idx - keep
+        for obj_output_dict in self.inference_state["output_dict_per_obj"].values():
+            non_cond = obj_output_dict["non_cond_frame_outputs"]
+            for t in [t for t in non_cond if t < oldest]:
+                del non_cond[t]
+
+    def get_first_frame_mask(self, points, labels, obj_ids=None):
         """
         Runs inference ONLY on frame 0 based on user clicks.
-        Returns the binary mask for preview.
+        Returns the binary mask for preview, or a dict {obj_id: mask} when obj_ids is given.
         """
         if not self.inference_state:
             raise RuntimeError("Session not initialized.")
             
-        logits = self._add_points(points, labels)
+        out_obj_ids, logits = self._add_points(points, labels, obj_ids, incremental=True)
         # Convert logits to binary mask (True/False)
-        mask = (logits[0] > 0.0).cpu().numpy().squeeze()
-        return mask
+        masks = (logits > 0.0).cpu().numpy()
+        if obj_ids is None:
+            return masks[0].squeeze()
+        return {obj_id: masks[i].squeeze() for i, obj_id in enumerate(out_obj_ids)}
 
-    def propagate(self, frames_dir, output_mask_dir, points, labels, max_frames=120):
+    def propagate(self, frames_dir, output_mask_dir, points, labels, max_frames=None,
+                  queue_depth=WRITER_QUEUE_DEPTH,
+                  video_path=None, fps=30, write_jpegs=WRITE_MASK_JPEGS, moments=MASK_MOMENTS, mask_store_dir=None,
+                  obj_ids=None, progress=None, cancel_event=None):
         """
         Runs full video propagation and saves masked frames.
+        All objects (see obj_ids in _add_points) are tracked in the same pass, so the image
+        encoder runs once per frame regardless of the number of objects.
+        Mask statistics (centroid, area, bounding box, optional second moments) are reduced
+        on the device; the loop then hands masks off to a bounded writer pool, which does the
+        overlay rendering and JPEG writes, with at most `queue_depth` frames in flight.
+        If video_path is given, blended frames are streamed into FFmpeg as they are rendered
+        and the MP4 is complete when this returns. write_jpegs=False skips masks/*.jpg.
+        If mask_store_dir is given, the raw binary masks of all objects are archived
+        there in a MaskStore.
+        max_frames limits tracking to the first N frames (None = whole clip). In a windowed session (see init_session), outputs that fall out of the model's memory
+        are pruned as it goes, so memory stays flat however long the clip is.
+        The peak memory of the run is left in self.last_peak_memory; the run is also
+        recorded as the "propagate" stage of the project (see StageTimer).
+        progress(done, total) is called after every frame; setting cancel_event
+        (threading.Event) stops the run with PropagationCancelled.
+        
+        Returns one dict per frame keyed by MASK_STAT_COLUMNS (+ MASK_MOMENT_COLUMNS);
+        x/y are NaN when the object was not detected. With obj_ids, returns
+        {obj_id: trajectory} instead.
         """
-        # 1. Ensure points are added to the state
-        self._add_points(points, labels)
+        # 1. Ensure points are added to the state (fresh state, frame-0 features are reused)
+        tracked_ids, _ = self._add_points(points, labels, obj_ids)
+        tracked_ids = list(tracked_ids)
+        # Tracking results now live in the state, so the next preview starts from a reset
+        self.applied_prompts = None
+        self.frame0_output = None
+        colors = [object_color(obj_id) for obj_id in tracked_ids]
+        
+        total_frames = min(self.inference_state["num_frames"], max_frames or self.inference_state["num_frames"])
         
         os.makedirs(output_mask_dir, exist_ok=True)
-        trajectory = [] 
+        encoder = None
+        if video_path:
+            os.makedirs(os.path.dirname(video_path), exist_ok=True)
+            encoder = StreamingVideoEncoder(
+                video_path, self.inference_state["video_width"], self.inference_state["video_height"], fps=fps
+            )
+        store = None
+        if mask_store_dir:
+            store = MaskStore.create(mask_store_dir, tracked_ids, total_frames,
+                                     self.inference_state["video_height"], self.inference_state["video_width"])
+        render = write_jpegs or encoder is not None
+        # The encoder pipe lives in this process, so streaming requires worker threads
+        writer = WriterPool(queue_depth=queue_depth, use_processes=WRITER_USE_PROCESSES and encoder is None)
+        
+        columns = MASK_STAT_COLUMNS + (MASK_MOMENT_COLUMNS if moments else [])
+        trajectories = {obj_id: [] for obj_id in tracked_ids}
         
         # 2. Propagate through video
         ctx = torch.autocast("cuda", dtype=torch.bfloat16) if self.device.type == "cuda" else nullcontext()
-        with ctx:
-            for out_frame_idx, out_obj_ids, out_mask_logits in self.predictor.propagate_in_video(self.inference_state):
-                if out_frame_idx >= max_frames:
-                    break
+        # Recorded as the "propagate" stage; writer_wait_s is the time the loop spent blocked on
+        # overlay rendering, JPEG writes and streaming (a full writer queue and the final drain)
+        stage = StageTimer(os.path.dirname(os.path.normpath(output_mask_dir)), "propagate", self.device, frames=0,
+                           cancelled=(PropagationCancelled,), memory_profile=self.memory_profile,
+                           objects=len(tracked_ids), windowed=self.windowed, stream_encode=encoder is not None).start()
+        writer_wait = 0.0
+        try:
+            with ctx:
+                for out_frame_idx, out_obj_ids, out_mask_logits in self.predictor.propagate_in_video(
+                    self.inference_state, max_frame_num_to_track=max_frames - 1 if max_frames else None
+                ):
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise PropagationCancelled(f"Cancelled at frame {out_frame_idx}")
+                    if self.windowed:
+                        self._prune_memory(out_frame_idx)
+                    stage.frames += 1
+                    
+                    # Per-frame statistics of all objects: a handful of scalars cross to the host
+                    stats = compute_mask_stats(out_mask_logits, moments=moments).tolist()
+                    for obj_id, obj_stats in zip(out_obj_ids, stats):
+                        trajectories[obj_id].append(dict(zip(columns, obj_stats)))
+                    if progress is not None:
+                        progress(out_frame_idx + 1, total_frames)
+                    
+                    if not render and store is None:
+                        continue
                     
-                # Get binary mask
-                mask = (out_mask_logits[0] > 0.0).cpu().numpy().squeeze()
-                
-                # Calculate centroid (0,0 if no object detected)
-                y_indices, x_indices = np.where(mask)
-                if len(x_indices) > 0:
-                    centroid_x = np.mean(x_indices)
-                    centroid_y = np.mean(y_indices)
-                    trajectory.append((centroid_x, centroid_y))
-                else:
-                    trajectory.append((0, 0)) # Placeholder for interpolation later
-                
-                # Save the frame blended with mask
-                frame_path = os.path.join(frames_dir, f"{out_frame_idx:05d}.jpg")
-                save_path = os.path.join(output_mask_dir, f"{out_frame_idx:05d}.jpg")
-                
-                save_tracking_frame(frame_path, mask, save_path)
+                    # Bit-packed binary masks (only needed for the archive and the overlay)
+                    packed_masks = pack_mask_tensor(out_mask_logits[:, 0] > 0.0).cpu().numpy()
+                    if store is not None:
+                        for obj_id, packed in zip(out_obj_ids, packed_masks):
+                            store.write_packed(obj_id, out_frame_idx, packed)
+                    if not render:
+                        continue
+                    
+                    # Hand off the frame blended with mask (in-memory frame if available)
+                    if self.frames is not None:
+                        image = self.frames[out_frame_idx]
+                    else:
+                        image = os.path.join(frames_dir, f"{out_frame_idx:05d}.jpg")
+                    save_path = os.path.join(output_mask_dir, f"{out_frame_idx:05d}.jpg") if write_jpegs else None
+                    
+                    submitted = time.perf_counter()
+                    writer.submit(_write_tracking_frame, out_frame_idx, image, packed_masks,
+                                  out_mask_logits.shape[-1], colors, save_path, encoder)
+                    writer_wait += time.perf_counter() - submitted
             
-        return trajectory
\ No newline at end of file
+            # 3. Wait for pending writes
+            drained = time.perf_counter()
+            writer.close()
+            if encoder is not None:
+                encoder.close()
+            writer_wait += time.perf_counter() - drained
+        except BaseException as e:
+            stage.error = e
+            writer.cancel()
+            if encoder is not None:
+                encoder.abort()
+            raise
+        finally:
+            if store is not None:
+                store.close()
+            stage.extra["writer_wait_s"] = round(writer_wait, 3)
+            self.last_peak_memory = stage.stop()
+            print(f"[INFO] Peak memory ({self.memory_profile}): {self.last_peak_memory}")
+        
+        if obj_ids is None:
+            return trajectories[tracked_ids[0]]
+        return trajectories
+
+def get_tracker():
+    """
+    Returns the shared SAM2Tracker that owns the model weights, loading it on first use.
+    Per-user sessions reuse its predictor (see logic/session_manager.py).
+    If a background warm-up is running, waits for it instead of loading twice.
+    """
+    global _tracker, _tracker_error
+    if _tracker is not None:
+        return _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker_error = None
+            try:
+                _tracker = SAM2Tracker()
+            except Exception as e:
+                _tracker_error = e
+                raise
+    return _tracker
+
+def preload_tracker():
+    """Starts loading the model in a background thread (the UI keeps serving meanwhile)."""
+    global _warmup_thread
+
+    def warm_up():
+        try:
+            get_tracker()
+        except Exception as e:
+            print(f"[ERROR] SAM2 model failed to load: {e}")
+
+    if _tracker is None and _warmup_thread is None:
+        _warmup_thread = threading.Thread(target=warm_up, name="sam2-warmup", daemon=True)
+        _warmup_thread.start()
+
+def tracker_status():
+    """Model readiness: "ready", "loading", "not loaded" or "error: ..."."""
+    if _tracker is not None:
+        return "ready"
+    if _tracker_error is not None:
+        return f"error: {_tracker_error}"
+    if _tracker_lock.locked():
+        return "loading"
+    return "not loaded"
@@ -1,8 +1,18 @@
 # logic/video_processor.py
 import os
+import shutil
 import subprocess
 import glob
-from config import RESULTS_ROOT
+from concurrent.futures import ThreadPoolExecutor
+from config import RESULTS_ROOT, FRAME_SOURCE, WRITE_FRAME_JPEGS, EXTRACT_SEGMENTS, FRAME_CACHE, WRITER_WORKERS
+from logic.frame_source import (decode_frames, decode_segment, plan_segments, plan_incremental, segment_args, frame_count, FRAME_GRID_VERSION,
+                                probe_video_size, clip_fits_in_memory, save_frame_jpeg, write_frames_async, wait_for_frames,
+                                cache_frames, get_cached_frames, drop_cached_frames, read_frames_ffmpeg, write_first_frame)
+from logic.thumbnails import THUMBNAIL_DIRNAME, thumbnail_path
+from logic.artifact_cache import file_digest
+from logic.catalog import catalog
+from logic.frame_cache import frame_cache
+from logic.run_metrics import StageTimer
 
 import json
 
@@ -27,56 +37,251 @@ def create_project_folder(username, video_path, tracking_object):
     
     os.makedirs(frames_dir, exist_ok=True)
     os.makedirs(metadata_dir, exist_ok=True)
+    catalog.refresh_project(user_project_dir)
     
     return user_project_dir, project_name
 
-def run_ffmpeg_cutting(username, video_path, tracking_object, fps=1.0, start_time=None, end_time=None, quality=2):
+def _run_jpeg_command(video_path, out_dir, quality, input_args, output_args):
+    cmd = ["ffmpeg"] + input_args + ["-i", video_path] + output_args
+    cmd.extend([
+        "-q:v", str(quality),
+        "-start_number", "0",
+        os.path.join(out_dir, "%05d.jpg")
+    ])
+    print(f"[INFO] Running FFmpeg command: {' '.join(cmd)}")
+    return subprocess.Popen(cmd), cmd
+
+def extract_jpeg_segments(video_path, frames_dir, quality, plan):
+    """
+    Runs the (input_args, output_args, skip) segments of `plan` as parallel FFmpeg processes,
+    each writing to a temporary folder under frames_dir. Returns each segment's JPEGs (lead-in
+    frames removed); the caller renames them into place and then calls remove_segment_dirs().
+    """
+    jobs = []
+    for k, (input_args, output_args, skip) in enumerate(plan):
+        out_dir = os.path.join(frames_dir, f".segment_{k}")
+        shutil.rmtree(out_dir, ignore_errors=True)  # left over from an interrupted run
+        os.makedirs(out_dir)
+        proc, cmd = _run_jpeg_command(video_path, out_dir, quality, input_args, output_args)
+        jobs.append((proc, cmd, out_dir, skip))
+
+    failed = None
+    for proc, cmd, _, _ in jobs:
+        if proc.wait() != 0 and failed is None:
+            failed = subprocess.CalledProcessError(proc.returncode, cmd)
+    if failed is not None:
+        remove_segment_dirs(frames_dir)
+        raise failed
+    return [[os.path.join(out_dir, name) for name in sorted(os.listdir(out_dir))[skip:]]
+            for _, _, out_dir, skip in jobs]
+
+def remove_segment_dirs(frames_dir):
+    for path in glob.glob(os.path.join(frames_dir, ".segment_*")):
+        shutil.rmtree(path, ignore_errors=True)
+
+def extract_jpegs(video_path, frames_dir, fps, start_time=None, end_time=None, quality=2, segments=EXTRACT_SEGMENTS):
+    """
+    Extracts frames as frames_dir/%05d.jpg. Long ranges run as parallel FFmpeg processes
+    (one per segment, see plan_segments), whose frames are renamed into one contiguous numbering.
+    """
+    plan = plan_segments(video_path, fps, start_time, end_time, segments)
+    index = 0
+    for part in extract_jpeg_segments(video_path, frames_dir, quality, plan):
+        for path in part:
+            os.replace(path, os.path.join(frames_dir, f"{index:05d}.jpg"))
+            index += 1
+    remove_segment_dirs(frames_dir)
+    return sorted(glob.glob(os.path.join(frames_dir, "*.jpg")))
+
+def _load_metadata(project_dir):
+    try:
+        with open(os.path.join(project_dir, "metadata", "metadata.json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def remove_frames(frames_dir):
+    """Deletes the frame JPEGs of a previous run and their thumbnails."""
+    for f in glob.glob(os.path.join(frames_dir, "*.jpg")) + glob.glob(os.path.join(frames_dir, THUMBNAIL_DIRNAME, "*")):
+        os.remove(f)
+
+def _reuse_frames(frames_dir, keep_from, keep_to, shift):
+    """
+    Renumbers the previous frame i + shift (and its thumbnail) to i for i in [keep_from, keep_to)
+    and deletes every other frame. Goes through a staging folder since shifted names overlap.
+    """
+    staging = os.path.join(frames_dir, ".reuse")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(os.path.join(staging, THUMBNAIL_DIRNAME))
+    for i in range(keep_from, keep_to):
+        src = os.path.join(frames_dir, f"{i + shift:05d}.jpg")
+        dst = os.path.join(staging, f"{i:05d}.jpg")
+        os.replace(src, dst)
+        if os.path.exists(thumbnail_path(src)):
+            os.replace(thumbnail_path(src), thumbnail_path(dst))
+    remove_frames(frames_dir)
+    for sub in ["", THUMBNAIL_DIRNAME]:
+        os.makedirs(os.path.join(frames_dir, sub), exist_ok=True)
+        for name in os.listdir(os.path.join(staging, sub)):
+            if name.endswith(".jpg") or sub:
+                os.replace(os.path.join(staging, sub, name), os.path.join(frames_dir, sub, name))
+    shutil.rmtree(staging, ignore_errors=True)
+
+def reextract_incrementally(video_path, frames_dir, keep, fps, start_time=None, end_time=None, quality=2,
+                            frame_source=FRAME_SOURCE):
+    """
+    Re-cuts frames_dir for new parameters, keeping the previous frames given by `keep`
+    (see plan_incremental) and extracting only the frames before and after them.
+    Returns (frame paths, decoded frames or None).
+    """
+    keep_from, keep_to, shift = keep
+    # (first frame, segment) of the missing frames
+    plan = []
+    if keep_from:
+        plan.append((0, segment_args(fps, start_time, end_time, 0, keep_from)))
+    if end_time is None or keep_to < frame_count(fps, start_time, end_time):
+        plan.append((keep_to, segment_args(fps, start_time, end_time, keep_to)))
+    print(f"[INFO] Re-cutting incrementally: keeping {keep_to - keep_from} frames, extracting {keep_from} + the rest from frame {keep_to}")
+
+    if frame_source == "pipe":
+        previous_np = get_cached_frames(frames_dir)
+        size = probe_video_size(video_path)
+        with ThreadPoolExecutor(max_workers=max(len(plan), 1)) as executor:
+            parts = list(executor.map(lambda item: decode_segment(video_path, fps, item[1], size), plan))
+        _reuse_frames(frames_dir, keep_from, keep_to, shift)
+        indexed = [(first + i, frame) for (first, _), part in zip(plan, parts) for i, frame in enumerate(part)]
+        with ThreadPoolExecutor(max_workers=WRITER_WORKERS) as executor:
+            list(executor.map(lambda item: save_frame_jpeg(item[1], os.path.join(frames_dir, f"{item[0]:05d}.jpg"), quality), indexed))
+        kept_np = previous_np[keep_from + shift:keep_to + shift] if previous_np is not None else []
+        extracted = {first: part for (first, _), part in zip(plan, parts)}
+        frames_np = extracted.get(0, []) + kept_np + extracted.get(keep_to, []) if len(kept_np) == keep_to - keep_from else None
+        return sorted(glob.glob(os.path.join(frames_dir, "*.jpg"))), frames_np
+
+    parts = extract_jpeg_segments(video_path, frames_dir, quality, [segment for _, segment in plan])
+    _reuse_frames(frames_dir, keep_from, keep_to, shift)
+    for (first, _), part in zip(plan, parts):
+        for i, path in enumerate(part, start=first):
+            os.replace(path, os.path.join(frames_dir, f"{i:05d}.jpg"))
+    remove_segment_dirs(frames_dir)
+    return sorted(glob.glob(os.path.join(frames_dir, "*.jpg"))), None
+
+def run_ffmpeg_cutting(username, video_path, tracking_object, fps=1.0, start_time=None, end_time=None, quality=2,
+                       frame_source=FRAME_SOURCE, write_jpegs=WRITE_FRAME_JPEGS):
     """
     Runs FFmpeg to cut frames. Assumes project folder might need to be created or already exists.
     Re-uses create_project_folder logic to ensure path consistency.
+
+    With frame_source="pipe" the tracker works from decoded frames and the JPEGs are only
+    written for the gallery (when write_jpegs is set). Clips that fit in memory (see
+    fits_in_memory) are decoded here and picked up by the tracker, their JPEGs written in
+    the background; longer clips are decoded by the tracker window by window (see
+    project_frame_decoder), so here FFmpeg only writes their JPEGs (or, without write_jpegs,
+    the clip is decoded once to count its frames).
+    Frame 0 is always written since the Tracking tab needs it for point selection.
+
+    With FRAME_CACHE, a frame set already extracted with the same video content and
+    parameters (by any project or user) is hardlinked instead of extracted again.
+    Otherwise, when only the time range changed, the project's previous frames that still
+    apply are kept and renumbered, and only the missing frames are extracted.
+    In both cases "pipe" mode may leave the decoding to the tracker's session preparation.
+    The run is recorded as the "cut" stage in metadata/runs.jsonl (see StageTimer); the
+    background JPEG writes of "pipe" mode are not part of it.
     """
     # Ensure folder exists (idempotent)
     user_project_dir, _ = create_project_folder(username, video_path, tracking_object)
     frames_dir = os.path.join(user_project_dir, "frames")
     metadata_dir = os.path.join(user_project_dir, "metadata")
+
+    # Finish any background writes from a previous run; its frame set is released below if unused
+    wait_for_frames(frames_dir)
+    previous = _load_metadata(user_project_dir)
+    previous_key = previous.get("frame_cache_key")
+    in_memory = frame_source == "pipe" and clip_fits_in_memory(video_path, fps, start_time, end_time)
+    if frame_source == "pipe" and not in_memory:
+        print("[INFO] Clip too long to hold in memory, the tracker decodes it window by window")
     
-    # Save Metadata
-    metadata = {
-        "original_video": os.path.basename(video_path),
-        "fps": fps,
-        "quality": quality,
-        "start_time": start_time,
-        "end_time": end_time,
-        "tracking_object": tracking_object
-    }
-    with open(os.path.join(metadata_dir, "metadata.json"), "w") as f:
-        json.dump(metadata, f, indent=4)
-    
-    # Clean up old frames
-    for f in glob.glob(os.path.join(frames_dir, "*.jpg")):
-        os.remove(f)
-        
-    # Build FFmpeg command
-    cmd = ["ffmpeg", "-i", video_path]
-    
-    if start_time:
-        cmd.extend(["-ss", str(start_time)])
-    if end_time:
-        cmd.extend(["-to", str(end_time)])
-        
-    cmd.extend([
-        "-q:v", str(quality),
-        "-r", str(fps),
-        "-start_number", "0",
-        os.path.join(frames_dir, "%05d.jpg")
-    ])
-    
-    print(f"[INFO] Running FFmpeg command: {' '.join(cmd)}")
-    subprocess.run(cmd, check=True)
-    
-    frames = sorted(glob.glob(os.path.join(frames_dir, "*.jpg")))
-    
-    return frames, frames_dir, user_project_dir
+    # Cutting stage from here (the wait above belongs to the previous run)
+    with StageTimer(user_project_dir, "cut", frame_source=frame_source) as stage:
+        # Save Metadata
+        metadata = {
+            "original_video": os.path.basename(video_path),
+            "video_digest": file_digest(video_path),
+            "fps": fps,
+            "quality": quality,
+            "start_time": start_time,
+            "end_time": end_time,
+            "tracking_object": tracking_object,
+            "frame_source": frame_source,
+            "frame_grid": FRAME_GRID_VERSION
+        }
+        def save_metadata():
+            with open(os.path.join(metadata_dir, "metadata.json"), "w") as f:
+                json.dump(metadata, f, indent=4)
+        # Written without num_frames first, so an interrupted run is never taken as complete
+        save_metadata()
+
+        cache_key = frame_cache.key(video_path, fps, start_time, end_time, quality, frame_source) if FRAME_CACHE else None
+        if previous_key and previous_key != cache_key:
+            frame_cache.release(user_project_dir, previous_key)
+
+        def finish(frames, num_frames, share, mode):
+            stage.frames = num_frames
+            stage.extra["mode"] = mode
+            metadata["num_frames"] = num_frames
+            if share:
+                metadata["frame_cache_key"] = cache_key
+            save_metadata()
+            catalog.refresh_project(user_project_dir)
+            return frames, frames_dir, user_project_dir
+
+        def adopt():
+            frame_cache.adopt(cache_key, frames_dir, user_project_dir, params=metadata)
+
+        cached = frame_cache.lookup(cache_key) if cache_key else None
+        if cached is not None:
+            remove_frames(frames_dir)
+            drop_cached_frames(frames_dir)
+            frame_cache.link_into(cache_key, frames_dir, user_project_dir)
+            return finish(sorted(glob.glob(os.path.join(frames_dir, "*.jpg"))), cached["num_frames"], True, "cache")
+
+        # Incremental re-cut: same video, quality and frame source, previous JPEGs complete
+        same_source = all(previous.get(k) == metadata[k] for k in ["video_digest", "quality", "frame_source"])
+        complete = previous.get("num_frames") and len(glob.glob(os.path.join(frames_dir, "*.jpg"))) == previous["num_frames"]
+        if same_source and complete and (write_jpegs or frame_source != "pipe"):
+            keep = plan_incremental(previous, fps, start_time, end_time)
+            if keep is not None:
+                # Long "pipe" clips only need their (gallery) JPEGs here, which FFmpeg writes fastest
+                frames, frames_np = reextract_incrementally(video_path, frames_dir, keep, fps, start_time, end_time, quality,
+                                                            frame_source if in_memory else "jpeg")
+                if frames_np is not None:
+                    cache_frames(frames_dir, frames_np)
+                else:
+                    drop_cached_frames(frames_dir)
+                if cache_key is not None:
+                    adopt()
+                return finish(frames, len(frames), cache_key is not None, "incremental")
+
+        remove_frames(frames_dir)
+
+        if frame_source == "pipe" and not in_memory and not write_jpegs:
+            drop_cached_frames(frames_dir)
+            num_frames = write_first_frame(read_frames_ffmpeg(video_path, fps, start_time, end_time), frames_dir, quality)
+            return finish(sorted(glob.glob(os.path.join(frames_dir, "*.jpg"))), num_frames, False, "full")
+
+        if in_memory:
+            frames_np = decode_frames(video_path, fps, start_time, end_time)
+            cache_frames(frames_dir, frames_np)
+            # Only a complete set of JPEGs is shared; it is added once the background writes finish
+            share = cache_key is not None and write_jpegs
+            frames = write_frames_async(frames_np if write_jpegs else frames_np[:1], frames_dir, quality,
+                                        on_complete=adopt if share else None)
+            return finish(frames, len(frames_np), share, "full")
+
+        drop_cached_frames(frames_dir)
+        frames = extract_jpegs(video_path, frames_dir, fps, start_time, end_time, quality)
+        if cache_key is not None:
+            adopt()
+        return finish(frames, len(frames), cache_key is not None, "full")
 
 # Backward compatibility alias if needed, or just use run_ffmpeg_cutting
 process_video = run_ffmpeg_cutting
\ No newline at end of file
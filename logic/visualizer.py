@@ -5,10 +5,23 @@ import matplotlib
 matplotlib.use('Agg') 
 import matplotlib.pyplot as plt
 import numpy as np
-from PIL import Image, ImageDraw
+from PIL import Image, ImageDraw, ImageColor
 import pandas as pd
 import subprocess
+import threading
 from scipy.interpolate import make_interp_spline
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from config import GAP_FILL_MODE, GAP_FILL_MAX_GAP, RERENDER_WORKERS, TRAJECTORY_PLOTS, PLOT_WORKERS
+from logic.mask_store import open_mask_store
+from logic.artifact_cache import ArtifactCache, temp_artifact_path
+from logic.thumbnails import save_thumbnail
+from logic.run_metrics import StageTimer
+from logic.frame_source import project_frame_decoder
 
 # --- Helper Functions (Integrated from your provided script) ---
 
@@ -43,43 +56,87 @@ def show_points(coords, labels, ax, marker_size=200):
         if len(neg_points) > 0:
             ax.scatter(neg_points[:, 0], neg_points[:, 1], color='red', marker='*', s=marker_size, edgecolor='white', linewidth=1.25)
 
-def replace_zero_coordinates(df):
+def _previous_valid_index(valid):
+    """For each position, index of the last valid entry at or before it (-1 if none)."""
+    idx = np.where(valid, np.arange(len(valid)), -1)
+    return np.maximum.accumulate(idx)
+
+def _next_valid_index(valid):
+    """For each position, index of the first valid entry at or after it (len if none)."""
+    n = len(valid)
+    idx = np.where(valid, np.arange(n), n)
+    return np.minimum.accumulate(idx[::-1])[::-1]
+
+def fill_trajectory_gaps(x, y, missing, mode="linear", max_gap=None):
     """
-    Interpolates (fills) zero coordinates (0,0) in the trajectory data to smooth the path.
-    Typically used when the object is lost or occluded for a few frames.
+    Fills missing trajectory points (object lost or occluded) in O(n), fully vectorized.
+    
+    mode:
+      "linear"  - linear interpolation across the gap
+      "nearest" - copy the closest valid point (ties go to the previous one)
+      "hold"    - hold the last valid point
+    Gaps at the start/end of the clip take the nearest valid point in every mode.
+    Gaps longer than max_gap frames are not filled and stay NaN.
+    
+    Returns float arrays (x, y).
     """
-    x = df['x'].values
-    y = df['y'].values
-    zero_indices = np.where((x == 0) & (y == 0))[0]
+    x = np.asarray(x, dtype=np.float64).copy()
+    y = np.asarray(y, dtype=np.float64).copy()
+    missing = np.asarray(missing, dtype=bool)
+    valid = ~missing
+    n = len(x)
+    
+    if n == 0 or not missing.any():
+        return x, y
+    if not valid.any():
+        return np.full(n, np.nan), np.full(n, np.nan)
+    
+    positions = np.arange(n)
+    if mode == "linear":
+        # np.interp clamps outside the valid range, i.e. holds the edge points
+        x[missing] = np.interp(positions[missing], positions[valid], x[valid])
+        y[missing] = np.interp(positions[missing], positions[valid], y[valid])
+    elif mode in ("nearest", "hold"):
+        prev_idx = _previous_valid_index(valid)
+        next_idx = _next_valid_index(valid)
+        if mode == "nearest":
+            use_next = (prev_idx < 0) | ((next_idx < n) & (next_idx - positions < positions - prev_idx))
+        else:
+            use_next = prev_idx < 0
+        source = np.where(use_next, next_idx, prev_idx)
+        x[missing] = x[source[missing]]
+        y[missing] = y[source[missing]]
+    else:
+        raise ValueError(f"Unknown gap fill mode: {mode}")
+    
+    # Leave gaps longer than max_gap unfilled (run-length of each missing stretch)
+    if max_gap is not None:
+        starts = missing & ~np.concatenate(([False], missing[:-1]))
+        run_id = np.cumsum(starts) - 1
+        run_lengths = np.bincount(run_id[missing])
+        too_long = np.zeros(n, dtype=bool)
+        too_long[missing] = run_lengths[run_id[missing]] > max_gap
+        x[too_long] = np.nan
+        y[too_long] = np.nan
+    
+    return x, y
 
-    for idx in zero_indices:
-        prev_idx = idx - 1
-        while prev_idx >= 0 and (x[prev_idx] == 0 and y[prev_idx] == 0):
-            prev_idx -= 1
-        next_idx = idx + 1
-        while next_idx < len(x) and (x[next_idx] == 0 and y[next_idx] == 0):
-            next_idx += 1
-        
-        # Linear interpolation
-        if prev_idx >= 0 and next_idx < len(x):
-            x[idx] = (x[prev_idx] + x[next_idx]) / 2
-            y[idx] = (y[prev_idx] + y[next_idx]) / 2
-        elif prev_idx >= 0:  
-            x[idx] = x[prev_idx]
-            y[idx] = y[prev_idx]
-        elif next_idx < len(x):  
-            x[idx] = x[next_idx]
-            y[idx] = y[next_idx]
-            
-    df['x'] = x
-    df['y'] = y
+def replace_zero_coordinates(df, mode="linear", max_gap=None):
+    """
+    Legacy helper for trajectories that mark lost frames with the (0,0) sentinel.
+    New trajectories carry an explicit 'missing' flag; see fill_trajectory_gaps.
+    """
+    missing = (df['x'].values == 0) & (df['y'].values == 0)
+    df['x'], df['y'] = fill_trajectory_gaps(df['x'].values, df['y'].values, missing, mode=mode, max_gap=max_gap)
     return df
 
 # --- Main Visualization Functions ---
 
-def render_preview(image_path, mask, points=None, labels=None):
+def render_preview(image_path, mask, points=None, labels=None, obj_ids=None):
     """
     Generates a preview image for Frame 0 with the mask and points overlaid.
+    `mask` is a single mask, or a dict {obj_id: mask} to show several objects in their colors.
+    `obj_ids` (one per point) labels each point with its object id.
     Returns a PIL Image object.
     """
     if not os.path.exists(image_path):
@@ -88,6 +145,15 @@ def render_preview(image_path, mask, points=None, labels=None):
     image = Image.open(image_path).convert("RGB")
     w, h = image.size
     
+    # Several objects: composite in per-object colors
+    if isinstance(mask, dict):
+        if mask:
+            ids = sorted(mask)
+            image = blend_tracking_frame(
+                np.asarray(image), [np.asarray(mask[i]) > 0 for i in ids], color=[object_color(i) for i in ids]
+            )
+        mask = None
+    
     # Overlay mask if exists
     if mask is not None:
         # Ensure mask is in correct shape (H, W)
@@ -124,114 +190,357 @@ def render_preview(image_path, mask, points=None, labels=None):
         draw = ImageDraw.Draw(image)
         # Marker size
         r = 5 # radius
-        for point, label in zip(points, labels):
+        for i, (point, label) in enumerate(zip(points, labels)):
             x, y = point
             color = "green" if label == 1 else "red"
             # Draw circle
             draw.ellipse((x-r, y-r, x+r, y+r), fill=color, outline="white")
+            if obj_ids:
+                draw.text((x + r + 2, y - r - 2), str(obj_ids[i]), fill="white")
             
     return image
 
-def save_tracking_frame(image_path, mask, save_path):
+# Distinct overlay colors per object id (object 1 keeps the original cyan)
+OBJECT_COLORS = [
+    (0.0, 1.0, 1.0),  # Cyan
+    (1.0, 0.0, 1.0),  # Magenta
+    (1.0, 1.0, 0.0),  # Yellow
+    (0.0, 1.0, 0.0),  # Lime Green
+    (1.0, 0.5, 0.0),  # Orange
+    (0.3, 0.5, 1.0),  # Light Blue
+    (1.0, 0.3, 0.3),  # Salmon
+    (0.6, 1.0, 0.6),  # Mint
+]
+
+def object_color(obj_id):
+    """Returns the RGB overlay color (in [0, 1]) for an object id (1-based)."""
+    return OBJECT_COLORS[(int(obj_id) - 1) % len(OBJECT_COLORS)]
+
+def blend_tracking_frame(image, mask, color=None, alpha=0.5):
     """
-    Saves a single frame with the segmentation mask blended.
-    Used during the propagation loop to generate frames for the video.
+    Returns the frame with the segmentation mask blended, as a PIL Image.
+    `image` is either a path to the frame JPEG or an RGB NumPy array.
+    `color` is an RGB tuple in [0, 1] (default: cyan), `alpha` the blend factor.
+    For several objects, pass lists of masks and colors; they are composited
+    into one overlay (later objects on top) and blended once.
     """
-    image = Image.open(image_path).convert("RGB")
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    else:
+        image = Image.open(image).convert("RGB")
     w, h = image.size
     
     # Prepare Mask Image
     # Use a high-contrast color (e.g., Lime Green or Cyan) instead of Tab10[0] (Blue)
     # Lime Green: (0, 1, 0), Cyan: (0, 1, 1), Magenta: (1, 0, 1)
     # Let's use a bright Cyan/Aqua for high visibility
-    color = np.array([0.0, 1.0, 1.0, 0.6]) 
-    
-    # Handle mask dimensions
-    if mask.ndim == 2:
-        h_m, w_m = mask.shape
-        mask_image = mask.reshape(h_m, w_m, 1) * color.reshape(1, 1, -1)
+    masks = list(mask) if isinstance(mask, (list, tuple)) else [mask]
+    if color is None:
+        colors = [object_color(i + 1) for i in range(len(masks))]
+    elif isinstance(color, list):
+        colors = color
     else:
-        # Compatible with (1, H, W)
-        h_m, w_m = mask.shape[-2:]
-        mask_image = mask.reshape(h_m, w_m, 1) * color.reshape(1, 1, -1)
+        colors = [color] * len(masks)
+    
+    # Handle mask dimensions (compatible with (1, H, W))
+    h_m, w_m = masks[0].shape[-2:]
+    mask_image_rgb = np.zeros((h_m, w_m, 3), dtype=np.float64)
+    for m, c in zip(masks, colors):
+        mask_image_rgb[m.reshape(h_m, w_m).astype(bool)] = c[:3]
         
-    mask_image_rgb = mask_image[..., :3]
     mask_image_pil = Image.fromarray((mask_image_rgb * 255).astype(np.uint8), mode='RGB')
     mask_image_pil = mask_image_pil.resize((w, h)) 
     
     # Blend original image and mask
-    combined_image = Image.blend(image, mask_image_pil, alpha=0.5)
-    combined_image.save(save_path)
+    return Image.blend(image, mask_image_pil, alpha=alpha)
 
-def create_trajectory_plot(project_dir, csv_path, output_path, smoothing=False, transparent=False):
+def save_tracking_frame(image, mask, save_path):
+    """
+    Saves a single frame with the segmentation mask blended.
+    Used during the propagation loop to generate frames for the video.
+    """
+    blend_tracking_frame(image, mask).save(save_path)
+
+class StreamingVideoEncoder:
     """
-    Generates the trajectory plot.
+    Long-lived `ffmpeg -f rawvideo` process that encodes blended frames as they are rendered,
+    so the MP4 is ready the moment tracking ends (no masks/ JPEG round-trip).
+    Frames may arrive out of order from the writer pool; they are buffered and
+    piped in frame order.
     """
-    if not os.path.exists(csv_path): return
+    def __init__(self, output_path, width, height, fps=30, start_index=0):
+        self.output_path = output_path
+        self.width = width
+        self.height = height
+        self.next_index = start_index
+        self.pending = {}
+        self.lock = threading.Lock()
+        
+        cmd = [
+            "ffmpeg", "-y", "-v", "error",
+            "-f", "rawvideo",
+            "-pix_fmt", "rgb24",
+            "-s", f"{width}x{height}",
+            "-framerate", str(fps),
+            "-i", "pipe:0",
+            # yuv420p needs even dimensions
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-c:v", "libx264",
+            "-pix_fmt", "yuv420p",
+            output_path
+        ]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
 
-    df = pd.read_csv(csv_path)
-    x = df['x'].values
-    y = df['y'].values
-    
-    # Get dimensions from first mask if available
-    w, h = 1920, 1080
+    def write(self, frame_idx, frame):
+        """Queues an (H, W, 3) uint8 RGB frame (NumPy array or PIL Image). Thread-safe."""
+        frame = np.asarray(frame, dtype=np.uint8)
+        if frame.shape != (self.height, self.width, 3):
+            raise ValueError(f"Frame {frame_idx} has shape {frame.shape}, expected {(self.height, self.width, 3)}")
+        with self.lock:
+            self.pending[frame_idx] = frame
+            while self.next_index in self.pending:
+                self.proc.stdin.write(self.pending.pop(self.next_index).tobytes())
+                self.next_index += 1
+
+    def close(self):
+        """Flushes the encoder and waits for FFmpeg to finish writing the MP4."""
+        with self.lock:
+            # Frames after a gap (should not happen) are still written in order
+            for idx in sorted(self.pending):
+                self.proc.stdin.write(self.pending.pop(idx).tobytes())
+        self.proc.stdin.close()
+        returncode = self.proc.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self.proc.args)
+        return self.output_path
+
+    def abort(self):
+        """Stops FFmpeg and removes the partial output."""
+        self.proc.kill()
+        self.proc.wait()
+        if os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+def list_object_trajectories(trajectories_dir):
+    """Returns {obj_id: csv_path} of the per-object trajectories of a multi-object project."""
+    if not os.path.exists(trajectories_dir):
+        return {}
+    found = {}
+    for f in os.listdir(trajectories_dir):
+        name, ext = os.path.splitext(f)
+        if ext == ".csv" and name.startswith("trajectory_obj") and name[len("trajectory_obj"):].isdigit():
+            found[int(name[len("trajectory_obj"):])] = os.path.join(trajectories_dir, f)
+    return found
+
+# Bump when a change to the plot / re-render code should invalidate the cached artifacts
+PLOT_RENDER_VERSION = 1
+RERENDER_VERSION = 1
+
+# Trajectory plot variants: name (file trajectory_<name>.png) -> (smoothing, transparent)
+TRAJECTORY_PLOT_VARIANTS = {
+    "white_bg": (False, False),
+    "transparent_bg": (False, True),
+    "white_bg_smoothed": (True, False),
+    "transparent_bg_smoothed": (True, True),
+}
+
+def trajectory_plot_path(trajectories_dir, variant):
+    return os.path.join(trajectories_dir, f"trajectory_{variant}.png")
+
+def _plot_dimensions(project_dir):
+    """Video size for the plot axes: frame 0, else the first mask (masks/ may be skipped when streaming)."""
+    frame0 = os.path.join(project_dir, "frames", "00000.jpg")
     masks_dir = os.path.join(project_dir, "masks")
-    if os.path.exists(masks_dir):
-        files = sorted([f for f in os.listdir(masks_dir) if f.endswith('.jpg')])
-        if files:
-            with Image.open(os.path.join(masks_dir, files[0])) as img:
-                w, h = img.size
+    path = frame0 if os.path.exists(frame0) else None
+    if path is None and os.path.exists(masks_dir):
+        files = sorted(f for f in os.listdir(masks_dir) if f.endswith('.jpg'))
+        path = os.path.join(masks_dir, files[0]) if files else None
+    if path is None:
+        return 1920, 1080
+    with Image.open(path) as img:
+        return img.size
+
+def smooth_trajectory(x, y):
+    """
+    Cubic spline through the valid points (unfilled gaps are NaN), sampled 5x denser.
+    Returns None when there are too few points to smooth.
+    """
+    valid = np.isfinite(x) & np.isfinite(y)
+    if valid.sum() <= 3:
+        return None
+    try:
+        frame_idx = np.flatnonzero(valid)
+        t = np.linspace(frame_idx[0], frame_idx[-1], len(frame_idx) * 5)
+        spl_x = make_interp_spline(frame_idx, x[valid], k=3)
+        spl_y = make_interp_spline(frame_idx, y[valid], k=3)
+        return spl_x(t), spl_y(t)
+    except Exception as e:
+        print(f"Smoothing error: {e}")
+        return None
+
+def load_trajectory_plot_data(project_dir, csv_path, smoothing=True):
+    """
+    Reads everything the trajectory plots need once: the video size and, per object,
+    its coordinates, color and (if `smoothing`) the smoothed path.
+    Multi-object projects (trajectory_obj<N>.csv next to csv_path) get one series per object.
+    """
+    per_object = list_object_trajectories(os.path.dirname(csv_path))
+    if per_object:
+        sources = [(path, object_color(obj_id)) for obj_id, path in sorted(per_object.items())]
+    else:
+        sources = [(csv_path, "yellow")]
+    series = []
+    for path, color in sources:
+        df = pd.read_csv(path, usecols=['x', 'y'])
+        x, y = df['x'].values, df['y'].values
+        series.append({"x": x, "y": y, "color": color, "smooth": smooth_trajectory(x, y) if smoothing else None})
+    return {"size": _plot_dimensions(project_dir), "series": series}
 
-    # Setup Figure
+def _render_trajectory_plot(data, output_path, smoothing=False, transparent=False):
+    """
+    Draws one plot variant on its own Figure (no pyplot state, so it also runs
+    in a worker process).
+    """
+    w, h = data["size"]
     # Use 19.2 x 10.8 for 1920x1080 at 100dpi
-    fig, ax = plt.subplots(figsize=(19.2, 10.8))
+    fig = Figure(figsize=(19.2, 10.8))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
     ax.set_xlim(0, w)
     ax.set_ylim(0, h)
     ax.invert_yaxis()
-    
+
     if transparent:
         fig.patch.set_alpha(0.0)
         ax.patch.set_alpha(0.0)
         ax.axis('off')
     else:
-        plt.title(f"Object Trajectory ({w}x{h})")
-    
-    # Smoothing
-    if smoothing and len(x) > 3:
-        try:
-            t = np.linspace(0, len(x) - 1, len(x) * 5)  
-            spl_x = make_interp_spline(range(len(x)), x, k=3)  
-            spl_y = make_interp_spline(range(len(y)), y, k=3)  
-            smooth_x = spl_x(t)
-            smooth_y = spl_y(t)
-            ax.plot(smooth_x, smooth_y, color="yellow", alpha=0.8, linewidth=3)
-        except Exception as e:
-            print(f"Smoothing error: {e}")
-            ax.plot(x, y, color="yellow", alpha=0.5, linewidth=3)
-    else:
-        ax.plot(x, y, color="yellow", alpha=0.5, linewidth=3)
+        ax.set_title(f"Object Trajectory ({w}x{h})")
 
-    # Scatter points
-    ax.scatter(x, y, color="yellow", alpha=0.6, s=150)
-    
-    plt.savefig(output_path, format="png", bbox_inches="tight", pad_inches=0.1, transparent=transparent)
-    plt.close()
+    for s in data["series"]:
+        if smoothing and s["smooth"] is not None:
+            ax.plot(*s["smooth"], color=s["color"], alpha=0.8, linewidth=3)
+        else:
+            ax.plot(s["x"], s["y"], color=s["color"], alpha=0.5, linewidth=3)
+        # Scatter points
+        ax.scatter(s["x"], s["y"], color=s["color"], alpha=0.6, s=150)
+
+    fig.savefig(output_path, format="png", bbox_inches="tight", pad_inches=0.1, transparent=transparent)
+
+# Worker processes of plot rendering and re-rendering, started with "spawn" like batch.py's
+# pool: forking the app would copy the locks other threads (jobs, UI callbacks, the artifact
+# builder) hold at that moment, and its CUDA context. Spawned workers import the modules
+# again, so each pool is kept for later renders.
+_process_pools = {}  # name -> (workers, ProcessPoolExecutor)
+_process_pools_lock = threading.Lock()
+
+def _get_process_pool(name, workers):
+    with _process_pools_lock:
+        entry = _process_pools.get(name)
+        if entry is None or entry[0] != workers:
+            if entry is not None:
+                entry[1].shutdown(wait=False)
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            entry = _process_pools[name] = (workers, pool)
+        return entry[1]
 
-def generate_video_and_trajectory(project_dir, trajectory_data, fps=30):
+def _drop_process_pool(name, pool):
+    """Forgets a pool whose worker died, so the next render starts a new one."""
+    with _process_pools_lock:
+        entry = _process_pools.get(name)
+        if entry is not None and entry[1] is pool:
+            del _process_pools[name]
+    pool.shutdown(wait=False)
+
+def render_trajectory_plots(project_dir, csv_path, outputs, workers=PLOT_WORKERS):
     """
-    Saves the trajectory CSV (smoothed), generates the trajectory plot,
-    and uses FFmpeg to compile the masked frames into a video.
+    Renders several trajectory plot variants from one read of the CSVs.
+    `outputs` maps output paths to (smoothing, transparent); with more than one worker,
+    the variants are drawn in parallel on a process pool (rendering is CPU-bound).
     """
+    if not os.path.exists(csv_path) or not outputs:
+        return
+    data = load_trajectory_plot_data(project_dir, csv_path, smoothing=any(smooth for smooth, _ in outputs.values()))
+    if len(outputs) == 1 or workers <= 1:
+        for path, (smoothing, transparent) in outputs.items():
+            _render_trajectory_plot(data, path, smoothing, transparent)
+        return
+    pool = _get_process_pool("plots", workers)
+    try:
+        futures = [pool.submit(_render_trajectory_plot, data, path, smoothing, transparent)
+                   for path, (smoothing, transparent) in outputs.items()]
+        for future in futures:
+            future.result()
+    except BrokenProcessPool:
+        _drop_process_pool("plots", pool)
+        raise
+
+def _trajectory_plot_keys(project_dir, variants):
+    """ArtifactCache inputs and {variant: key} of the trajectory plots of a project."""
     trajectories_dir = os.path.join(project_dir, "trajectories")
-    videos_dir = os.path.join(project_dir, "videos")
-    masks_dir = os.path.join(project_dir, "masks")
-    
-    os.makedirs(trajectories_dir, exist_ok=True)
-    os.makedirs(videos_dir, exist_ok=True)
-    
-    # 1. Process CSV (Apply smoothing/filling zeros)
-    df = pd.DataFrame(trajectory_data, columns=["x", "y"])
-    df = replace_zero_coordinates(df)
+    inputs = [os.path.join(trajectories_dir, "trajectory.csv")] + list(list_object_trajectories(trajectories_dir).values())
+    size = _plot_dimensions(project_dir)
+    cache = ArtifactCache(project_dir)
+    return inputs, {variant: cache.key(inputs, {"variant": variant, "size": size}, PLOT_RENDER_VERSION) for variant in variants}
+
+def stale_trajectory_plots(project_dir, variants):
+    """The variants that are missing or were built from other CSVs / render code (no rendering)."""
+    if not os.path.exists(os.path.join(project_dir, "trajectories", "trajectory.csv")):
+        return []
+    cache = ArtifactCache(project_dir)
+    _, keys = _trajectory_plot_keys(project_dir, variants)
+    return [variant for variant in variants if not cache.is_fresh(f"plot_{variant}", keys[variant])]
+
+def update_trajectory_plots(project_dir, variants):
+    """
+    Renders the plot variants whose CSVs, video size or render code changed since they
+    were last built (see ArtifactCache) in one batch; unchanged ones are kept.
+    Returns {variant: path} of the requested variants.
+    """
+    trajectories_dir = os.path.join(project_dir, "trajectories")
+    csv_path = os.path.join(trajectories_dir, "trajectory.csv")
+    paths = {variant: trajectory_plot_path(trajectories_dir, variant) for variant in variants}
+    if not os.path.exists(csv_path):
+        return paths
+
+    cache = ArtifactCache(project_dir)
+    inputs, keys = _trajectory_plot_keys(project_dir, variants)
+    stale = [variant for variant in variants if not cache.is_fresh(f"plot_{variant}", keys[variant])]
+    if stale:
+        temp_paths = {variant: temp_artifact_path(paths[variant]) for variant in stale}
+        try:
+            render_trajectory_plots(project_dir, csv_path, {
+                temp_paths[variant]: TRAJECTORY_PLOT_VARIANTS[variant] for variant in stale
+            })
+        except BaseException:
+            for temp_path in temp_paths.values():
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            raise
+        for variant in stale:
+            os.replace(temp_paths[variant], paths[variant])
+            cache.record(f"plot_{variant}", paths[variant], keys[variant], inputs)
+    return paths
+
+def create_trajectory_plot(project_dir, csv_path, output_path, smoothing=False, transparent=False):
+    """
+    Generates one trajectory plot.
+    Multi-object projects (trajectory_obj<N>.csv next to csv_path) get one path per object, in its overlay color.
+    """
+    render_trajectory_plots(project_dir, csv_path, {output_path: (smoothing, transparent)})
+
+def trajectory_to_dataframe(trajectory_data, fps=30, gap_fill_mode=GAP_FILL_MODE, max_gap=GAP_FILL_MAX_GAP):
+    """
+    Builds the trajectory table of one object: timestamp, filled x/y, 'missing' flag
+    and any extra per-frame mask statistics.
+    """
+    if trajectory_data and isinstance(trajectory_data[0], dict):
+        df = pd.DataFrame(trajectory_data, dtype=float)
+    else:
+        df = pd.DataFrame(trajectory_data, columns=["x", "y"], dtype=float)
+    df['missing'] = df['x'].isna() | df['y'].isna()
+    df['x'], df['y'] = fill_trajectory_gaps(df['x'].values, df['y'].values, df['missing'].values,
+                                            mode=gap_fill_mode, max_gap=max_gap)
 
     # Add timestamp column
     def frames_to_time(frame_idx):
@@ -243,28 +552,59 @@ def generate_video_and_trajectory(project_dir, trajectory_data, fps=30):
         return f"{hours:02}:{minutes:02}:{seconds:02}.{millis:03}"
     
     df['timestamp'] = [frames_to_time(i) for i in range(len(df))]
-    df = df[['timestamp', 'x', 'y']] # Reorder columns
+    base_columns = ['timestamp', 'x', 'y', 'missing']
+    return df[base_columns + [c for c in df.columns if c not in base_columns]] # Reorder columns
 
+def generate_video_and_trajectory(project_dir, trajectory_data, fps=30, compile_video=True,
+                                  gap_fill_mode=GAP_FILL_MODE, max_gap=GAP_FILL_MAX_GAP, plot_variants=TRAJECTORY_PLOTS):
+    """
+    Saves the trajectory CSV (smoothed), generates the trajectory plot,
+    and uses FFmpeg to compile the masked frames into a video.
+    Set compile_video=False when the video was already streamed during propagation.
+    trajectory_data is a list of (x, y) tuples or of per-frame dicts (x, y plus extra
+    mask statistics, which are written as additional CSV columns), or a dict
+    {obj_id: trajectory} for multi-object projects. Each object then gets its own
+    trajectory_obj<N>.csv; trajectory.csv always holds the first object.
+    Frames without a detection are NaN in trajectory_data; they are kept as a
+    'missing' column in the CSV and filled according to gap_fill_mode / max_gap.
+    Only the `plot_variants` (see TRAJECTORY_PLOT_VARIANTS) are rendered; the Results
+    tab renders the others when they are first viewed.
+    The steps are recorded as the "trajectory_csv", "plots" and "encode" stages (see StageTimer).
+    """
+    trajectories_dir = os.path.join(project_dir, "trajectories")
+    videos_dir = os.path.join(project_dir, "videos")
+    masks_dir = os.path.join(project_dir, "masks")
+    
+    os.makedirs(trajectories_dir, exist_ok=True)
+    os.makedirs(videos_dir, exist_ok=True)
+    
+    # 1. Process CSV (Fill frames where the object was lost)
+    per_object = trajectory_data if isinstance(trajectory_data, dict) else {1: trajectory_data}
+    obj_ids = sorted(per_object)
     csv_path = os.path.join(trajectories_dir, "trajectory.csv")
-    df.to_csv(csv_path, index=False)
     
-    # 2. Plot Trajectory (Standard)
-    traj_img_path = os.path.join(trajectories_dir, "trajectory_white_bg.png")
-    create_trajectory_plot(project_dir, csv_path, traj_img_path, smoothing=False, transparent=False)
+    # Drop per-object files from a previous run with different objects
+    for old_csv in list_object_trajectories(trajectories_dir).values():
+        os.remove(old_csv)
     
-    # 3. Plot Trajectory (Transparent)
-    traj_trans_path = os.path.join(trajectories_dir, "trajectory_transparent_bg.png")
-    create_trajectory_plot(project_dir, csv_path, traj_trans_path, smoothing=False, transparent=True)
+    with StageTimer(project_dir, "trajectory_csv", frames=len(per_object[obj_ids[0]]), objects=len(obj_ids)):
+        for obj_id in obj_ids:
+            df = trajectory_to_dataframe(per_object[obj_id], fps=fps, gap_fill_mode=gap_fill_mode, max_gap=max_gap)
+            if len(obj_ids) > 1:
+                df.to_csv(os.path.join(trajectories_dir, f"trajectory_obj{obj_id}.csv"), index=False)
+            if obj_id == obj_ids[0]:
+                df.to_csv(csv_path, index=False)
     
-    # 4. Plot Trajectory (Smoothed versions)
-    traj_img_smoothed_path = os.path.join(trajectories_dir, "trajectory_white_bg_smoothed.png")
-    create_trajectory_plot(project_dir, csv_path, traj_img_smoothed_path, smoothing=True, transparent=False)
-
-    traj_trans_smoothed_path = os.path.join(trajectories_dir, "trajectory_transparent_bg_smoothed.png")
-    create_trajectory_plot(project_dir, csv_path, traj_trans_smoothed_path, smoothing=True, transparent=True)
+    # 2. Plot Trajectory (requested variants, rendered together)
+    with StageTimer(project_dir, "plots", variants=len(plot_variants)):
+        update_trajectory_plots(project_dir, plot_variants)
+        ArtifactCache(project_dir).cleanup()
+    traj_img_path = trajectory_plot_path(trajectories_dir, "white_bg")
     
     # 5. Compile Video using FFmpeg
     output_video_path = os.path.join(videos_dir, "output_tracked.mp4")
+    if not compile_video:
+        return traj_img_path, output_video_path, csv_path
     if os.path.exists(output_video_path):
         os.remove(output_video_path)
         
@@ -276,6 +616,185 @@ def generate_video_and_trajectory(project_dir, trajectory_data, fps=30):
         "-pix_fmt", "yuv420p",
         output_video_path
     ]
-    subprocess.run(cmd, check=True)
+    with StageTimer(project_dir, "encode", frames=len(per_object[obj_ids[0]])):
+        subprocess.run(cmd, check=True)
+    
+    return traj_img_path, output_video_path, csv_path
+
+# --- Re-rendering from stored masks (no inference) ---
+
+def parse_color(value):
+    """Converts '#rrggbb' / 'rgb(...)' / 'rgba(...)' (e.g. from gr.ColorPicker) into an RGB tuple in [0, 1]."""
+    if isinstance(value, str) and value.startswith("rgba("):
+        value = "rgb(" + ",".join(value[5:-1].split(",")[:3]) + ")"
+    rgb = ImageColor.getrgb(value)
+    return tuple(c / 255.0 for c in rgb[:3])
+
+def draw_overlay_extras(image, mask, draw_bbox=False, trail=None, color=(0.0, 1.0, 1.0)):
+    """
+    Draws the optional extras on a blended frame (PIL Image, in place):
+    the mask bounding box and a trail through the given (x, y) centroids.
+    """
+    draw = ImageDraw.Draw(image)
+    outline = tuple(int(c * 255) for c in color[:3])
+    
+    if draw_bbox and mask.any():
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        draw.rectangle((cols[0], rows[0], cols[-1], rows[-1]), outline=outline, width=3)
+    
+    if trail is not None and len(trail) > 1:
+        points = [(float(x), float(y)) for x, y in trail if np.isfinite(x) and np.isfinite(y)]
+        if len(points) > 1:
+            draw.line(points, fill="yellow", width=3)
+    return image
+
+# Per-process cache of opened mask stores (each keeps its last decompressed chunk per object),
+# {store_dir: (version, store)}; re-tracking rewrites the store, which changes its version
+_open_stores = {}
+
+# Frames decoded per FFmpeg call when re-rendering a project without frame JPEGs
+RERENDER_DECODE_FRAMES = 32
+
+def _mask_store_version(store_files):
+    return tuple((path, os.stat(path).st_mtime_ns, os.path.getsize(path)) for path in store_files)
+
+def _rerender_frame(frame_idx, store_dir, store_version, obj_ids, frame, save_path, colors, alpha, draw_bbox, trails):
+    """
+    Process-pool task: renders one frame (JPEG path or RGB array) from the stored mask
+    of each object. Returns the RGB array.
+    """
+    cached = _open_stores.get(store_dir)
+    if cached is None or cached[0] != store_version:
+        if cached is not None:
+            cached[1].close()
+        cached = _open_stores[store_dir] = (store_version, open_mask_store(store_dir))
+    store = cached[1]
+    masks = []
+    for obj_id in obj_ids:
+        if store.has_frame(obj_id, frame_idx):
+            masks.append(store.read(obj_id, frame_idx))
+        else:
+            masks.append(np.zeros((store.height, store.width), dtype=bool))
+    
+    blended = blend_tracking_frame(frame, masks, color=colors, alpha=alpha)
+    for mask, color, trail in zip(masks, colors, trails):
+        draw_overlay_extras(blended, mask, draw_bbox=draw_bbox, trail=trail, color=color)
+    if save_path:
+        blended.save(save_path)
+        save_thumbnail(blended, save_path)
+    return np.asarray(blended)
+
+def _rerender_frames(project_dir, frame_paths):
+    """
+    The frame of each path: the paths themselves when the frame JPEGs are all on disk,
+    else (projects cut with write_jpegs=False) the frames decoded from the original video.
+    """
+    if all(os.path.exists(path) for path in frame_paths):
+        return iter(frame_paths)
+    load_frames = project_frame_decoder(project_dir)
+    if load_frames is None:
+        raise FileNotFoundError("The frame JPEGs of this project were not written and its original video is missing. "
+                                "Please cut the video again to re-render.")
+
+    def decoded():
+        start, chunk = 0, []
+        for path in frame_paths:
+            frame_idx = int(os.path.splitext(os.path.basename(path))[0])
+            if not start <= frame_idx < start + len(chunk):
+                start, chunk = frame_idx, load_frames(frame_idx, frame_idx + RERENDER_DECODE_FRAMES)
+                if not chunk:
+                    raise RuntimeError(f"Frame {frame_idx} could not be decoded from the original video")
+            yield chunk[frame_idx - start]
+    return decoded()
+
+def rerender_project(project_dir, color=(0.0, 1.0, 1.0), alpha=0.5, draw_bbox=False, trail_length=0,
+                     fps=30, write_jpegs=True, workers=RERENDER_WORKERS, use_cache=True):
+    """
+    Rebuilds masks/ and videos/output_tracked.mp4 from the stored raw masks and the frames
+    (frames/ JPEGs, or the original video when they were not written), without running SAM2.
+    Frames are rendered on a process pool and streamed into FFmpeg in order; at most
+    2 * workers frames are in flight.
+    `color` applies to the first object; further objects keep their palette color.
+    With `use_cache`, nothing is rendered if the video was last rendered from the same
+    masks, frames and parameters (see ArtifactCache).
+    Renders are recorded as the "rerender" stage (see StageTimer).
+    Returns (output video path, True if it was served from the cache).
+    """
+    store_dir = os.path.join(project_dir, "mask_store")
+    store = open_mask_store(store_dir)
+    if store is None:
+        raise FileNotFoundError("No stored masks for this project. Please run tracking inference once.")
+    obj_ids = store.obj_ids
+    frame_indices = store.frame_indices()
+    width, height, store_files = store.width, store.height, store.files
+    store.close()
+    store_version = _mask_store_version(store_files)
+    if not frame_indices:
+        raise RuntimeError("The mask store is empty.")
+    colors = [color] + [object_color(obj_id) for obj_id in obj_ids[1:]]
+    
+    frames_dir = os.path.join(project_dir, "frames")
+    masks_dir = os.path.join(project_dir, "masks")
+    videos_dir = os.path.join(project_dir, "videos")
+    trajectories_dir = os.path.join(project_dir, "trajectories")
+    os.makedirs(masks_dir, exist_ok=True)
+    os.makedirs(videos_dir, exist_ok=True)
+    
+    # Trajectory trails (filled centroids from the CSVs)
+    xy = [None] * len(obj_ids)
+    if trail_length > 0:
+        csv_paths = list_object_trajectories(trajectories_dir) or {obj_ids[0]: os.path.join(trajectories_dir, "trajectory.csv")}
+        for i, obj_id in enumerate(obj_ids):
+            if obj_id in csv_paths and os.path.exists(csv_paths[obj_id]):
+                xy[i] = pd.read_csv(csv_paths[obj_id])[['x', 'y']].values
+    
+    output_video_path = os.path.join(videos_dir, "output_tracked.mp4")
+    cache = ArtifactCache(project_dir)
+    frame_paths = [os.path.join(frames_dir, f"{frame_idx:05d}.jpg") for frame_idx in frame_indices]
+    # metadata.json identifies the frames decoded when the JPEGs are missing
+    inputs = frame_paths + store_files + [os.path.join(project_dir, "metadata", "metadata.json")]
+    if trail_length > 0:
+        inputs += [os.path.join(trajectories_dir, "trajectory.csv")] + list(list_object_trajectories(trajectories_dir).values())
+    params = {"color": list(color), "alpha": alpha, "draw_bbox": draw_bbox, "trail_length": trail_length,
+              "fps": fps, "write_jpegs": write_jpegs}
+    key = cache.key(inputs, params, RERENDER_VERSION)
+    if use_cache and cache.is_fresh("rerender_video", key):
+        return output_video_path, True
+
+    frames = _rerender_frames(project_dir, frame_paths)
+    temp_video_path = temp_artifact_path(output_video_path)
+    encoder = StreamingVideoEncoder(temp_video_path, width, height, fps=fps, start_index=frame_indices[0])
+    
+    with StageTimer(project_dir, "rerender", frames=len(frame_indices), workers=workers, objects=len(obj_ids)):
+        executor = _get_process_pool("rerender", workers)
+        in_flight = deque()
+        try:
+            for frame_idx, frame in zip(frame_indices, frames):
+                trails = [
+                    None if points is None else points[max(0, frame_idx - trail_length + 1):frame_idx + 1]
+                    for points in xy
+                ]
+                save_path = os.path.join(masks_dir, f"{frame_idx:05d}.jpg") if write_jpegs else None
+                in_flight.append((frame_idx, executor.submit(
+                    _rerender_frame, frame_idx, store_dir, store_version, obj_ids, frame, save_path, colors, alpha,
+                    draw_bbox, trails
+                )))
+                # Bounded window: encode the oldest frame before queueing more
+                if len(in_flight) >= 2 * workers:
+                    idx, future = in_flight.popleft()
+                    encoder.write(idx, future.result())
+            while in_flight:
+                idx, future = in_flight.popleft()
+                encoder.write(idx, future.result())
+        except BaseException as e:
+            for _, future in in_flight:
+                future.cancel()
+            encoder.abort()
+            if isinstance(e, BrokenProcessPool):
+                _drop_process_pool("rerender", executor)
+            raise
+        os.replace(encoder.close(), output_video_path)
     
-    return traj_img_path, output_video_path, csv_path
\ No newline at end of file
+    cache.record("rerender_video", output_video_path, key, inputs)
+    return output_video_path, False
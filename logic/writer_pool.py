@@ -0,0 +1,61 @@
+# logic/writer_pool.py
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from config import WRITER_WORKERS, WRITER_QUEUE_DEPTH, WRITER_USE_PROCESSES
+
+class WriterPool:
+    """
+    Bounded producer/consumer pool for per-frame rendering and disk writes.
+
+    The producer (e.g. the SAM2 propagation loop) calls submit() and only blocks
+    when `queue_depth` tasks are already in flight, so memory stays bounded while
+    the workers overlap Pillow/disk work with model inference.
+    """
+    def __init__(self, num_workers=WRITER_WORKERS, queue_depth=WRITER_QUEUE_DEPTH, use_processes=WRITER_USE_PROCESSES):
+        executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self.executor = executor_cls(max_workers=num_workers)
+        self.slots = threading.BoundedSemaphore(max(1, queue_depth))
+        self.futures = []
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queues fn(*args, **kwargs). Blocks while the queue is full.
+        Re-raises the exception of a task that has failed since, so the producer
+        stops at the first failed write instead of at close().
+        """
+        self._collect()
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        self.futures.append(future)
+        return future
+
+    def _collect(self):
+        """Forgets the finished tasks (at most `queue_depth` stay in flight). Re-raises the first failure."""
+        pending = []
+        for future in self.futures:
+            if not future.done():
+                pending.append(future)
+            elif future.exception() is not None:
+                raise future.exception()
+        self.futures = pending
+
+    def close(self):
+        """Waits for all queued tasks. Re-raises the first worker exception, if any."""
+        try:
+            for future in self.futures:
+                future.result()
+        finally:
+            self.executor.shutdown(wait=True)
+            self.futures = []
+
+    def cancel(self):
+        """Drops tasks that have not started yet and waits for the running ones."""
+        for future in self.futures:
+            future.cancel()
+        self.executor.shutdown(wait=True)
+        self.futures = []
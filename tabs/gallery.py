@@ -0,0 +1,67 @@
+# tabs/gallery.py
+import gradio as gr
+import os
+from logic.thumbnails import ensure_thumbnails
+from logic.frame_source import wait_for_frames
+from config import GALLERY_PAGE_SIZE
+
+def list_jpegs(folder):
+    """Sorted full-resolution frames of a folder (frames/ or masks/)."""
+    if not folder or not os.path.exists(folder):
+        return []
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(".jpg"))
+
+class PagedGallery:
+    """
+    Gallery that sends one page of thumbnails at a time instead of every
+    full-resolution frame; the full-resolution frame is loaded when a thumbnail is clicked.
+
+    Callbacks that fill it list `outputs` among their outputs and return `*gallery.show(paths)`.
+    """
+    def __init__(self, label, columns=6, page_size=GALLERY_PAGE_SIZE):
+        self.page_size = page_size
+        self.paths_state = gr.State([])
+        self.page_state = gr.State(0)
+        self.gallery = gr.Gallery(label=label, columns=columns, height="auto", object_fit="contain", allow_preview=False)
+        with gr.Row():
+            self.prev_btn = gr.Button("◀ Previous", size="sm")
+            self.page_info = gr.Markdown("")
+            self.next_btn = gr.Button("Next ▶", size="sm")
+        self.full_image = gr.Image(label="Full Resolution", interactive=False, visible=False)
+        self.outputs = [self.paths_state, self.page_state, self.gallery, self.page_info, self.full_image]
+
+        page_outputs = [self.page_state, self.gallery, self.page_info]
+        self.prev_btn.click(lambda paths, page: self._page(paths, page - 1), inputs=[self.paths_state, self.page_state], outputs=page_outputs)
+        self.next_btn.click(lambda paths, page: self._page(paths, page + 1), inputs=[self.paths_state, self.page_state], outputs=page_outputs)
+        self.gallery.select(self._open_frame, inputs=[self.paths_state, self.page_state], outputs=self.full_image)
+
+    def _num_pages(self, paths):
+        return max(1, (len(paths) + self.page_size - 1) // self.page_size)
+
+    def _page(self, paths, page):
+        page = min(max(page, 0), self._num_pages(paths) - 1)
+        start = page * self.page_size
+        page_paths = paths[start:start + self.page_size]
+        if page_paths:
+            # Frames may still be written in the background ("pipe" mode): only this page is waited for
+            wait_for_frames(os.path.dirname(page_paths[0]), start + len(page_paths))
+        thumbs = ensure_thumbnails(page_paths)
+        items = [(thumb, f"Frame {start + i}") for i, thumb in enumerate(thumbs)]
+        info = f"Page {page + 1} / {self._num_pages(paths)} ({len(paths)} frames)" if paths else ""
+        return page, items, info
+
+    def _open_frame(self, paths, page, evt: gr.SelectData):
+        idx = page * self.page_size + evt.index
+        if idx >= len(paths):
+            return gr.update(visible=False)
+        return gr.update(value=paths[idx], label=f"Frame {idx} (full resolution)", visible=True)
+
+    def show(self, paths):
+        """Output values showing the first page of `paths` (full-resolution image paths)."""
+        paths = list(paths or [])
+        page, items, info = self._page(paths, 0)
+        return paths, page, items, info, gr.update(value=None, visible=False)
+
+    def unchanged(self):
+        """Output values that leave the gallery as it is."""
+        return tuple(gr.update() for _ in self.outputs)
@@ -1,11 +1,16 @@
 import gradio as gr
 import os
 import shutil
-import json
+import time
 from PIL import Image
 from config import RESULTS_ROOT, VIDEO_UPLOAD_DIR
 from tabs.tracking_ui import get_user_projects
+from tabs.gallery import PagedGallery, list_jpegs
 from logic.visualizer import render_preview
+from logic.session_manager import tracking_sessions
+from logic.catalog import catalog, SORT_COLUMNS
+from logic.frame_cache import frame_cache
+from logic.run_metrics import load_runs, summarize_runs
 
 def create_management_tab(username_state):
     with gr.Tab("4. Project Management") as tab:
@@ -26,6 +31,37 @@ def create_management_tab(username_state):
 
         status_msg = gr.Markdown("")
         
+        # Project catalog: all projects, filtered and sorted without scanning the results folder
+        with gr.Accordion("📚 Project Catalog", open=False):
+            with gr.Row():
+                catalog_all_users = gr.Checkbox(label="All users", value=False)
+                catalog_status = gr.Dropdown(label="Status", choices=["", "created", "extracted", "tracking", "tracked", "failed", "cancelled"], value="")
+                catalog_search = gr.Textbox(label="Search name", placeholder="e.g. table_tennis")
+                catalog_sort = gr.Dropdown(label="Sort by", choices=list(SORT_COLUMNS), value="updated")
+            with gr.Row():
+                catalog_refresh_btn = gr.Button("🔍 Apply")
+                catalog_rebuild_btn = gr.Button("♻️ Rebuild Catalog from Disk")
+            catalog_table = gr.Dataframe(
+                headers=["User", "Project", "Status", "Frames", "Masks", "FPS", "Disk (MB)", "Updated"],
+                interactive=False
+            )
+        
+        # Run statistics: per-stage timings and peak memory from the projects' metadata/runs.jsonl
+        with gr.Accordion("⏱️ Run Statistics", open=False):
+            with gr.Row():
+                stats_all_users = gr.Checkbox(label="All users", value=False)
+                stats_project_only = gr.Checkbox(label="Selected project only", value=False)
+                stats_refresh_btn = gr.Button("📊 Load Statistics")
+            stats_table = gr.Dataframe(
+                headers=["Stage", "Runs", "Failed", "Cancelled", "Median (s)", "Mean (s)", "Max (s)", "Median frames/s", "Max RAM (MB)", "Max GPU (MB)"],
+                interactive=False
+            )
+            gr.Markdown("Slowest recent runs")
+            slow_runs_table = gr.Dataframe(
+                headers=["Time", "Project", "Stage", "Status", "Wall (s)", "Frames", "Frames/s", "RAM (MB)", "GPU (MB)"],
+                interactive=False
+            )
+
         with gr.Accordion("Project Details", open=True):
             metadata_display = gr.JSON(label="Project Metadata")
             
@@ -37,7 +73,7 @@ def create_management_tab(username_state):
                 traj_plot = gr.Image(label="Trajectory Plot")
                 res_video = gr.Video(label="Synthesized Video")
                 
-            gallery = gr.Gallery(label="Masked Frames", columns=6, height="auto")
+            gallery = PagedGallery(label="Masked Frames")
 
         # --- Logic ---
         
@@ -47,20 +83,68 @@ def create_management_tab(username_state):
         refresh_btn.click(refresh_list, inputs=username_state, outputs=project_dropdown)
         tab.select(refresh_list, inputs=username_state, outputs=project_dropdown)
         
+        def list_catalog(user, all_users, status, search, sort):
+            filters = {"user": None if all_users else user, "status": status or None, "search": search or None}
+            projects = catalog.list_projects(sort=sort, **filters)
+            # Sizes are measured here, only for the listed projects that changed since (see measure_disk_usage)
+            if catalog.measure_disk_usage([p["project_dir"] for p in projects if p["disk_bytes"] < 0]):
+                projects = catalog.list_projects(sort=sort, **filters)
+            return [
+                [p["user"], p["name"], p["status"], p["num_frames"], p["num_masks"], p["fps"],
+                 round(p["disk_bytes"] / 2**20, 1), time.strftime("%Y-%m-%d %H:%M", time.localtime(p["updated"]))]
+                for p in projects
+            ]
+
+        def rebuild_catalog(user, all_users, status, search, sort):
+            count = catalog.rebuild()
+            return list_catalog(user, all_users, status, search, sort), f"✅ Catalog rebuilt: {count} projects.", gr.Dropdown(choices=get_user_projects(user))
+
+        catalog_inputs = [username_state, catalog_all_users, catalog_status, catalog_search, catalog_sort]
+        catalog_refresh_btn.click(list_catalog, inputs=catalog_inputs, outputs=catalog_table)
+        catalog_sort.change(list_catalog, inputs=catalog_inputs, outputs=catalog_table)
+        catalog_rebuild_btn.click(rebuild_catalog, inputs=catalog_inputs, outputs=[catalog_table, status_msg, project_dropdown])
+        tab.select(list_catalog, inputs=catalog_inputs, outputs=catalog_table)
+
+        def load_statistics(user, all_users, project_only, proj_name, recent=200, slowest=20):
+            if project_only:
+                proj_dirs = [os.path.join(RESULTS_ROOT, user, proj_name)] if user and proj_name else []
+            else:
+                proj_dirs = [p["project_dir"] for p in catalog.list_projects(user=None if all_users else user)]
+            records = []
+            for proj_dir in proj_dirs:
+                for record in load_runs(proj_dir):
+                    record["project"] = os.path.basename(proj_dir)
+                    records.append(record)
+            stats = [
+                [s["stage"], s["runs"], s["failed"], s["cancelled"], s["median_s"], s["mean_s"], s["max_s"], s["median_fps"],
+                 s["max_rss_mb"], s["max_cuda_mb"]]
+                for s in summarize_runs(records)
+            ]
+            # Slowest of the most recent records: where the time of a reported slow run went
+            latest = sorted(records, key=lambda r: r.get("time", 0), reverse=True)[:recent]
+            slow = [
+                [time.strftime("%Y-%m-%d %H:%M", time.localtime(r.get("time", 0))), r["project"], r.get("stage"),
+                 r.get("status"), r.get("wall_s"), r.get("frames"), r.get("fps"), r.get("peak_rss_mb"), r.get("peak_cuda_mb")]
+                for r in sorted(latest, key=lambda r: r.get("wall_s", 0), reverse=True)[:slowest]
+            ]
+            return stats, slow
+
+        stats_refresh_btn.click(
+            load_statistics,
+            inputs=[username_state, stats_all_users, stats_project_only, project_dropdown],
+            outputs=[stats_table, slow_runs_table]
+        )
+
         def load_details(user, proj_name):
             if not user or not proj_name:
-                return None, None, None, None, None, None
+                return None, None, None, None, None, *gallery.show([])
             
             proj_dir = os.path.join(RESULTS_ROOT, user, proj_name)
-            metadata_path = os.path.join(proj_dir, "metadata", "metadata.json")
-            
-            # 1. Metadata
-            metadata = {}
-            if os.path.exists(metadata_path):
-                try:
-                    with open(metadata_path, "r") as f:
-                        metadata = json.load(f)
-                except: pass
+            # 1. Metadata (from the catalog; projects it does not know yet are scanned once)
+            project = catalog.get(proj_dir) or catalog.refresh_project(proj_dir)
+            if project is None:
+                return None, None, None, None, None, *gallery.show([])
+            metadata = project["metadata"]
             
             # 2. Original Video
             vid_path = None
@@ -77,43 +161,39 @@ def create_management_tab(username_state):
                 raw_points = metadata.get("points", [])
                 points = []
                 labels = []
+                obj_ids = []
                 
                 # Handle new format (list of dicts)
                 if raw_points and len(raw_points) > 0 and isinstance(raw_points[0], dict):
                      for p in raw_points:
                          points.append([p['x'], p['y']])
                          labels.append(1 if p.get('type') == 'positive' else 0)
+                         obj_ids.append(p.get('obj_id', 1))
                 
                 try:
                     # render_preview expects points as list of lists
-                    preview_img = render_preview(frame0, mask=None, points=points, labels=labels)
+                    preview_img = render_preview(frame0, mask=None, points=points, labels=labels, obj_ids=obj_ids)
                 except Exception as e:
                     print(f"Preview error: {e}")
                     preview_img = Image.open(frame0)
 
-            # 4. Trajectory
-            traj_path = os.path.join(proj_dir, "trajectories", "trajectory_white_bg.png")
-            if not os.path.exists(traj_path):
-                traj_path = os.path.join(proj_dir, "trajectories", "trajectory.png") # Fallback
-            if not os.path.exists(traj_path): traj_path = None
-            
-            # 5. Result Video
-            res_vid_path = os.path.join(proj_dir, "videos", "output_tracked.mp4")
-            if not os.path.exists(res_vid_path): res_vid_path = None
+            # 4. Trajectory / 5. Result Video
+            traj_path = project["trajectory_plot"]
+            res_vid_path = project["result_video"]
+            if (traj_path and not os.path.exists(traj_path)) or (res_vid_path and not os.path.exists(res_vid_path)):
+                # Changed outside the app since it was cataloged
+                project = catalog.refresh_project(proj_dir)
+                traj_path, res_vid_path = project["trajectory_plot"], project["result_video"]
             
-            # 6. Gallery
-            masks_dir = os.path.join(proj_dir, "masks")
-            frames = []
-            if os.path.exists(masks_dir):
-                frame_files = sorted([os.path.join(masks_dir, f) for f in os.listdir(masks_dir) if f.endswith(".jpg")])
-                frames = [(f, f"Frame {i}") for i, f in enumerate(frame_files)]
+            # 6. Gallery (thumbnails, one page at a time)
+            frames = list_jpegs(os.path.join(proj_dir, "masks"))
                 
-            return metadata, vid_path, preview_img, traj_path, res_vid_path, frames
+            return metadata, vid_path, preview_img, traj_path, res_vid_path, *gallery.show(frames)
 
         project_dropdown.change(
             load_details,
             inputs=[username_state, project_dropdown],
-            outputs=[metadata_display, orig_video, point_preview, traj_plot, res_video, gallery]
+            outputs=[metadata_display, orig_video, point_preview, traj_plot, res_video, *gallery.outputs]
         )
         
         # Delete Logic
@@ -126,7 +206,11 @@ def create_management_tab(username_state):
             
             proj_dir = os.path.join(RESULTS_ROOT, user, proj_name)
             try:
+                # The project's frames are hardlinks, so the shared set stays intact for other projects
+                frame_cache.release_project(proj_dir)
                 shutil.rmtree(proj_dir)
+                tracking_sessions.close_project(proj_dir)
+                catalog.remove_project(proj_dir)
                 msg = f"✅ Project '{proj_name}' deleted successfully."
                 # Refresh list
                 new_list = get_user_projects(user)
@@ -141,6 +225,6 @@ def create_management_tab(username_state):
             outputs=[delete_confirm_row, status_msg, project_dropdown]
         ).then(
             # Clear details after delete
-            lambda: (None, None, None, None, None, None),
-            outputs=[metadata_display, orig_video, point_preview, traj_plot, res_video, gallery]
+            lambda: (None, None, None, None, None, *gallery.show([])),
+            outputs=[metadata_display, orig_video, point_preview, traj_plot, res_video, *gallery.outputs]
         )
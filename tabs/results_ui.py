@@ -1,9 +1,11 @@
 # tabs/results_ui.py
 import gradio as gr
 import os
-import json
-from logic.visualizer import create_trajectory_plot
+from logic.visualizer import update_trajectory_plots, stale_trajectory_plots, TRAJECTORY_PLOT_VARIANTS, rerender_project, parse_color
+from logic.artifact_cache import artifact_builder
+from logic.catalog import catalog
 from tabs.tracking_ui import get_user_projects
+from tabs.gallery import PagedGallery, list_jpegs
 from config import RESULTS_ROOT
 
 def create_results_tab(username_state, project_dir_state):
@@ -16,11 +18,12 @@ def create_results_tab(username_state, project_dir_state):
         with gr.Row():
             project_dropdown = gr.Dropdown(label="Select Project to View", choices=[], interactive=True, scale=4)
             refresh_proj_btn = gr.Button("🔄 Refresh List", scale=1)
-            
-        refresh_btn = gr.Button("Refresh Results", visible=False) # Hidden, triggered by dropdown
+            refresh_btn = gr.Button("Refresh Results", scale=1)
         
         # Status Message
         status_msg = gr.Markdown("", visible=False)
+        # Polls for plots rendered in the background (only active while a build is pending)
+        plot_timer = gr.Timer(2.0, active=False)
         
         # Metadata Display
         metadata_display = gr.JSON(label="Project Metadata")
@@ -38,10 +41,21 @@ def create_results_tab(username_state, project_dir_state):
             # Right: Video
             with gr.Column():
                 result_video = gr.Video(label="Mask Synthesized Video")
+                
+                # Re-render overlays from the stored masks (no SAM2 inference)
+                with gr.Accordion("🎨 Re-render Overlay", open=False):
+                    with gr.Row():
+                        color_picker = gr.ColorPicker(value="#00ffff", label="Mask Color")
+                        alpha_slider = gr.Slider(minimum=0.1, maximum=1.0, value=0.5, step=0.05, label="Opacity")
+                    with gr.Row():
+                        bbox_chk = gr.Checkbox(label="Draw Bounding Box", value=False)
+                        trail_slider = gr.Slider(minimum=0, maximum=300, value=0, step=1, label="Trajectory Trail (frames, 0=off)")
+                    rerender_btn = gr.Button("Re-render", variant="secondary")
+                    rerender_status = gr.Markdown("")
         
         # Bottom: Gallery
         gr.Markdown("### Masked Frames Gallery")
-        gallery = gr.Gallery(label="Masked Frames", columns=6, height="auto")
+        gallery = PagedGallery(label="Masked Frames")
         
         # --- Logic ---
         
@@ -61,10 +75,20 @@ def create_results_tab(username_state, project_dir_state):
                 return None
             return os.path.join(RESULTS_ROOT, user, proj_name)
 
+        def list_mask_frames(proj_dir):
+            return list_jpegs(os.path.join(proj_dir, "masks"))
+
+        def request_plots(proj_dir):
+            """Rebuilds missing or outdated plots in the background; returns True if a build is pending."""
+            tag = (proj_dir, "plots")
+            if stale_trajectory_plots(proj_dir, list(TRAJECTORY_PLOT_VARIANTS)):
+                artifact_builder.submit(tag, update_trajectory_plots, proj_dir, list(TRAJECTORY_PLOT_VARIANTS))
+            return artifact_builder.is_pending(tag)
+
         # 3. Load Results Logic
         def load_results(proj_dir):
             if not proj_dir:
-                return None, None, None, [], False, gr.update(visible=False), None
+                return None, None, None, *gallery.show([]), False, gr.update(visible=False), None, gr.Timer(active=False)
             
             # Updated filenames
             traj_path = os.path.join(proj_dir, "trajectories", "trajectory_white_bg.png")
@@ -78,30 +102,19 @@ def create_results_tab(username_state, project_dir_state):
 
             vid_path = os.path.join(proj_dir, "videos", "output_tracked.mp4")
             csv_path = os.path.join(proj_dir, "trajectories", "trajectory.csv")
-            metadata_path = os.path.join(proj_dir, "metadata", "metadata.json")
             
-            # Load Metadata
-            metadata = {}
-            if os.path.exists(metadata_path):
-                try:
-                    with open(metadata_path, "r") as f:
-                        metadata = json.load(f)
-                except:
-                    pass
+            # Load Metadata (from the project catalog; unknown projects are scanned once)
+            project = catalog.get(proj_dir) or catalog.refresh_project(proj_dir)
+            metadata = project["metadata"] if project else {}
             
             # Check if results exist
             has_results = os.path.exists(traj_path) or os.path.exists(vid_path)
             
             if not has_results:
-                 return None, None, None, [], False, gr.update(value="### ⚠️ No results found.\nPlease go to the **Object Tracking** tab and run inference first.", visible=True), metadata
+                 return None, None, None, *gallery.show([]), False, gr.update(value="### ⚠️ No results found.\nPlease go to the **Object Tracking** tab and run inference first.", visible=True), metadata, gr.Timer(active=False)
 
             # Load frames
-            masks_dir = os.path.join(proj_dir, "masks")
-            frames = []
-            if os.path.exists(masks_dir):
-                frame_files = sorted([os.path.join(masks_dir, f) for f in os.listdir(masks_dir) if f.endswith(".jpg")])
-                # Convert to (image, caption) tuples
-                frames = [(f, f"Frame {i}") for i, f in enumerate(frame_files)]
+            frames = list_mask_frames(proj_dir)
             
             # Prepare download list
             downloads = []
@@ -112,19 +125,8 @@ def create_results_tab(username_state, project_dir_state):
             traj_smooth_path = os.path.join(proj_dir, "trajectories", "trajectory_white_bg_smoothed.png")
             traj_trans_smooth_path = os.path.join(proj_dir, "trajectories", "trajectory_transparent_bg_smoothed.png")
             
-            # Auto-generate smoothed plots if missing but CSV exists
-            if os.path.exists(csv_path):
-                if not os.path.exists(traj_smooth_path):
-                    try:
-                        create_trajectory_plot(proj_dir, csv_path, traj_smooth_path, smoothing=True, transparent=False)
-                    except Exception as e:
-                        print(f"Error generating smoothed white bg plot: {e}")
-
-                if not os.path.exists(traj_trans_smooth_path):
-                    try:
-                        create_trajectory_plot(proj_dir, csv_path, traj_trans_smooth_path, smoothing=True, transparent=True)
-                    except Exception as e:
-                         print(f"Error generating smoothed transparent bg plot: {e}")
+            # Missing/outdated plots are rendered in the background (never blocks opening a project)
+            rendering = request_plots(proj_dir)
             
             if os.path.exists(traj_smooth_path): downloads.append(traj_smooth_path)
             if os.path.exists(traj_trans_smooth_path): downloads.append(traj_trans_smooth_path)
@@ -133,10 +135,11 @@ def create_results_tab(username_state, project_dir_state):
                 traj_path if os.path.exists(traj_path) else None,
                 vid_path if os.path.exists(vid_path) else None,
                 downloads,
-                frames,
+                *gallery.show(frames),
                 False, # Reset smoothing checkbox
-                gr.update(visible=False), # Hide warning
-                metadata
+                gr.update(value="⏳ Rendering plots in the background, they appear here when done.", visible=True) if rendering else gr.update(visible=False),
+                metadata,
+                gr.Timer(active=rendering)
             )
 
         # 4. Event Wiring
@@ -151,21 +154,21 @@ def create_results_tab(username_state, project_dir_state):
         ).then(
             load_results,
             inputs=[project_dir_state],
-            outputs=[traj_image, result_video, download_files, gallery, smoothing_chk, status_msg, metadata_display]
+            outputs=[traj_image, result_video, download_files, *gallery.outputs, smoothing_chk, status_msg, metadata_display, plot_timer]
         )
         
         # Also trigger load when project_dir_state changes from other tabs
         project_dir_state.change(
             load_results,
             inputs=[project_dir_state],
-            outputs=[traj_image, result_video, download_files, gallery, smoothing_chk, status_msg, metadata_display]
+            outputs=[traj_image, result_video, download_files, *gallery.outputs, smoothing_chk, status_msg, metadata_display, plot_timer]
         )
         
         # Manual refresh button
         refresh_btn.click(
             load_results,
             inputs=[project_dir_state],
-            outputs=[traj_image, result_video, download_files, gallery, smoothing_chk, status_msg, metadata_display]
+            outputs=[traj_image, result_video, download_files, *gallery.outputs, smoothing_chk, status_msg, metadata_display, plot_timer]
         )
         
         def change_plot_view(proj_dir, plot_type, smoothing):
@@ -179,6 +182,10 @@ def create_results_tab(username_state, project_dir_state):
             filename = f"trajectory_{bg}{suffix}"
             path = os.path.join(proj_dir, "trajectories", filename)
             
+            # Variants not rendered after tracking (see TRAJECTORY_PLOTS) are rendered in the background
+            if not os.path.exists(path):
+                request_plots(proj_dir)
+
             # Fallback logic for legacy or missing smoothed files
             if not os.path.exists(path):
                 # Try unsmoothed if smoothed missing
@@ -192,6 +199,28 @@ def create_results_tab(username_state, project_dir_state):
 
             return path if os.path.exists(path) else None
 
+        def list_downloads(proj_dir):
+            """trajectory.csv and the rendered plots of a project."""
+            names = ["trajectory.csv", "trajectory_white_bg.png", "trajectory_transparent_bg.png",
+                     "trajectory_white_bg_smoothed.png", "trajectory_transparent_bg_smoothed.png"]
+            paths = [os.path.join(proj_dir, "trajectories", name) for name in names]
+            return [p for p in paths if os.path.exists(p)]
+
+        def poll_plots(proj_dir, plot_type, smoothing):
+            """Timer tick while plots render in the background: shows them once the build has finished."""
+            if proj_dir and artifact_builder.is_pending((proj_dir, "plots")):
+                return gr.update(), gr.update(), gr.update(), gr.Timer(active=True)
+            if not proj_dir:
+                return None, None, gr.update(visible=False), gr.Timer(active=False)
+            return (change_plot_view(proj_dir, plot_type, smoothing), list_downloads(proj_dir),
+                    gr.update(visible=False), gr.Timer(active=False))
+
+        plot_timer.tick(
+            poll_plots,
+            inputs=[project_dir_state, plot_type_radio, smoothing_chk],
+            outputs=[traj_image, download_files, status_msg, plot_timer]
+        )
+
         plot_type_radio.change(
             change_plot_view,
             inputs=[project_dir_state, plot_type_radio, smoothing_chk],
@@ -219,13 +248,11 @@ def create_results_tab(username_state, project_dir_state):
             }
             
             if os.path.exists(csv_path):
-                # Re-generate the specific requested one to ensure it reflects current smoothing setting
-                # We interpret "Update Plot" as "Force Re-generate requested plot"
+                # Re-renders the requested plot only if it is missing or outdated
                 target_key = (smoothing, "Transparent" if "Transparent" in plot_type else "Standard")
                 target_path = paths[target_key]
-                
-                is_transparent = "Transparent" in plot_type
-                create_trajectory_plot(proj_dir, csv_path, target_path, smoothing=smoothing, transparent=is_transparent)
+                variant = os.path.basename(target_path)[len("trajectory_"):-len(".png")]
+                update_trajectory_plots(proj_dir, [variant])
                 
                 # Recalculate component lists
                 downloads = []
@@ -243,4 +270,33 @@ def create_results_tab(username_state, project_dir_state):
             update_plot,
             inputs=[project_dir_state, smoothing_chk, plot_type_radio],
             outputs=[traj_image, download_files]
-        )
\ No newline at end of file
+        )
+
+        # 5. Re-render from stored masks
+        def run_rerender(proj_dir, color, alpha, draw_bbox, trail_length):
+            if not proj_dir:
+                return gr.update(), *gallery.unchanged(), "Please select a project first."
+            
+            project = catalog.get(proj_dir)
+            fps = (project and project["fps"]) or 30
+            
+            try:
+                video_path, cached = rerender_project(
+                    proj_dir, color=parse_color(color), alpha=alpha,
+                    draw_bbox=draw_bbox, trail_length=int(trail_length), fps=fps
+                )
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                return gr.update(), *gallery.unchanged(), f"❌ Re-render failed: {e}"
+            
+            if cached:
+                return video_path, *gallery.show(list_mask_frames(proj_dir)), "✅ Unchanged since the last re-render (served from cache)."
+            catalog.refresh_project(proj_dir)
+            return video_path, *gallery.show(list_mask_frames(proj_dir)), "✅ Re-render complete."
+
+        rerender_btn.click(
+            run_rerender,
+            inputs=[project_dir_state, color_picker, alpha_slider, bbox_chk, trail_slider],
+            outputs=[result_video, *gallery.outputs, rerender_status]
+        )
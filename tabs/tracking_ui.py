@@ -1,24 +1,31 @@
 # tabs/tracking_ui.py
 import gradio as gr
 import os
-import json
 from PIL import Image
-from logic.tracker import SAM2Tracker
-from logic.visualizer import generate_video_and_trajectory, render_preview
-from config import RESULTS_ROOT
+from logic.tracker import tracker_status, MEMORY_PROFILES
+from logic.session_manager import tracking_sessions, prepare_session
+from logic.visualizer import render_preview
+from logic.job_queue import job_queue, load_saved_points
+from logic.catalog import catalog
+from config import RESULTS_ROOT, MAX_TRACKED_OBJECTS, MEMORY_PROFILE
 
-# Initialize global model instance
-tracker_model = SAM2Tracker()
+def format_model_status():
+    """Readiness indicator text for the shared SAM2 model."""
+    status = tracker_status()
+    if status == "ready":
+        return "🟢 **SAM2 model ready**"
+    if status == "loading":
+        return "🟡 **Loading SAM2 model...** (Video Processing and Results can be used meanwhile)"
+    if status.startswith("error"):
+        return f"🔴 **SAM2 model failed to load:** {status[len('error: '):]}"
+    return "⚪ **SAM2 model not loaded** (it loads when a project is opened)"
 
 def get_user_projects(username):
     """
-    Scans the 'results/username/' directory and returns a list of available project folders.
+    Returns the names of the user's projects (from the project catalog, see logic/catalog.py).
     """
     if not username: return []
-    user_path = os.path.join(RESULTS_ROOT, username)
-    if not os.path.exists(user_path): return []
-    # Return only directories
-    return sorted([d for d in os.listdir(user_path) if os.path.isdir(os.path.join(user_path, d))])
+    return [p["name"] for p in catalog.list_projects(user=username)]
 
 def create_tracking_tab(username_state, project_dir_state):
     """
@@ -28,17 +35,26 @@ def create_tracking_tab(username_state, project_dir_state):
     # UI State Variables
     points_state = gr.State([])
     labels_state = gr.State([])
+    obj_ids_state = gr.State([])
     current_frame0_path = gr.State(None)
     
     with gr.Tab("2. Object Tracking") as tab:
+        model_status = gr.Markdown(format_model_status())
+        # Polls the readiness indicator until the model has loaded
+        model_status_timer = gr.Timer(2.0)
+        
         gr.Markdown("### 1. Select Existing Project")
         
         # --- Section 1: Project Selection ---
         with gr.Column():
             project_dropdown = gr.Dropdown(label="Available Projects", choices=[], interactive=True)
             refresh_proj_btn = gr.Button("🔄 Refresh", size="sm")
+            memory_profile_input = gr.Dropdown(
+                label="Memory Profile", choices=list(MEMORY_PROFILES), value=MEMORY_PROFILE, interactive=True,
+                info="resident = fastest; offload_video / offload_state = less GPU memory; async = lazy frame loading"
+            )
 
-        gr.Markdown("### 2. Select Object (Max 2 Points)")
+        gr.Markdown("### 2. Select Objects (Max 2 Points per Object)")
         
         # --- Section 2: Image Interaction ---
         with gr.Row():
@@ -49,6 +65,7 @@ def create_tracking_tab(username_state, project_dir_state):
             
             # Right Column: Controls
             with gr.Column(scale=1):
+                object_id_input = gr.Number(value=1, precision=0, minimum=1, maximum=MAX_TRACKED_OBJECTS, label="Object ID")
                 point_type = gr.Radio(["Positive (+)", "Negative (-)"], value="Positive (+)", label="Click Type")
                 undo_btn = gr.Button("Undo Last Point")
                 clear_btn = gr.Button("Clear All Points")
@@ -71,9 +88,32 @@ def create_tracking_tab(username_state, project_dir_state):
         gr.Markdown("### 4. Start Tracking")
         run_btn = gr.Button("🚀 Start Tracking Inference", variant="primary")
         status_output = gr.Textbox(label="Status Log")
+        
+        # --- Section 6: Background Jobs ---
+        gr.Markdown("### 5. Tracking Jobs")
+        jobs_table = gr.Dataframe(
+            headers=["Job", "Project", "Status", "Frames", "FPS", "ETA", "Message"],
+            interactive=False, wrap=True
+        )
+        # Polls job progress (jobs run in the background and survive page refreshes)
+        jobs_timer = gr.Timer(1.0)
+        with gr.Row():
+            cancel_job_input = gr.Textbox(label="Job ID", placeholder="e.g. 1a2b3c4d", scale=2)
+            cancel_job_btn = gr.Button("⏹️ Cancel Job", variant="stop", scale=1)
+        with gr.Row():
+            batch_projects = gr.Dropdown(label="Queue Projects (uses their saved points)", choices=[], multiselect=True, scale=2)
+            batch_btn = gr.Button("📋 Queue Selected Projects", scale=1)
+        jobs_status = gr.Markdown("")
 
         # ====== Logic Implementation ======
 
+        # 0. Model Readiness
+        def refresh_model_status():
+            status = tracker_status()
+            return format_model_status(), gr.Timer(active=status != "ready" and not status.startswith("error"))
+        
+        model_status_timer.tick(refresh_model_status, outputs=[model_status, model_status_timer])
+
         # 1. Refresh Projects List
         def refresh_list(user):
             projs = get_user_projects(user)
@@ -85,45 +125,48 @@ def create_tracking_tab(username_state, project_dir_state):
         tab.select(refresh_list, inputs=username_state, outputs=project_dropdown)
 
         # 2. Load Project & Display Frame 0 (Clean Image)
-        def load_project(user, proj_name):
+        def load_project(user, proj_name, memory_profile):
             if not user or not proj_name:
-                return None, None, "Please select a project.", None
+                return None, None, "Please select a project.", None, [], [], []
             
             proj_dir = os.path.join(RESULTS_ROOT, user, proj_name)
             frames_dir = os.path.join(proj_dir, "frames")
             frame0 = os.path.join(frames_dir, "00000.jpg")
             
             if not os.path.exists(frame0):
-                return None, None, "Error: Frame 0 not found.", proj_dir
+                return None, None, "Error: Frame 0 not found.", proj_dir, [], [], []
             
-            # Initialize Tracker Session
+            # Initialize (or reuse) this user's Tracker Session
             try:
-                tracker_model.init_session(frames_dir)
-                status = f"Loaded: {proj_name}. Tracker Ready."
+                with tracking_sessions.session(user, proj_dir) as tracker:
+                    reused = not prepare_session(tracker, proj_dir, memory_profile)
+                status = f"Loaded: {proj_name}. Tracker Ready." + (" (session reused)" if reused else "")
             except Exception as e:
                 status = f"Tracker Init Error: {e}"
             
             # Reset states
-            return Image.open(frame0), frame0, status, proj_dir, [], []
+            return Image.open(frame0), frame0, status, proj_dir, [], [], []
 
         project_dropdown.change(
             load_project, 
-            inputs=[username_state, project_dropdown], 
-            outputs=[input_image, current_frame0_path, status_output, project_dir_state, points_state, labels_state]
+            inputs=[username_state, project_dropdown, memory_profile_input], 
+            outputs=[input_image, current_frame0_path, status_output, project_dir_state, points_state, labels_state, obj_ids_state]
         )
 
         # --- Helper to format points text ---
-        def format_points_text(points, labels):
+        def format_points_text(points, labels, obj_ids):
             if not points: return "**Selected Points:**\nNone"
-            return "**Selected Points:**\n" + "\n".join([f"P{i+1}: {p} ({'Pos' if l==1 else 'Neg'})" for i, (p, l) in enumerate(zip(points, labels))])
+            return "**Selected Points:**\n" + "\n".join([f"P{i+1}: {p} ({'Pos' if l==1 else 'Neg'}, Object {o})" for i, (p, l, o) in enumerate(zip(points, labels, obj_ids))])
 
-        # 3. Handle Image Clicks (Visual Feedback + Max 2 Limit)
-        def on_select(frame0_path, p_type, points, labels, evt: gr.SelectData):
+        # 3. Handle Image Clicks (Visual Feedback + Max 2 Points per Object)
+        def on_select(frame0_path, p_type, obj_id, points, labels, obj_ids, evt: gr.SelectData):
+            obj_id = int(obj_id or 1)
+            
             # A. Check Limit
-            if len(points) >= 2:
+            if obj_ids.count(obj_id) >= 2:
                 # Re-render existing points (just in case)
-                marked_img = render_preview(frame0_path, mask=None, points=points, labels=labels)
-                return points, labels, format_points_text(points, labels), gr.update(value="⚠️ Limit Reached: Max 2 Points!", visible=True), marked_img
+                marked_img = render_preview(frame0_path, mask=None, points=points, labels=labels, obj_ids=obj_ids)
+                return points, labels, obj_ids, format_points_text(points, labels, obj_ids), gr.update(value=f"⚠️ Limit Reached: Max 2 Points for Object {obj_id}!", visible=True), marked_img
             
             # B. Add Point
             x, y = evt.index[0], evt.index[1]
@@ -131,60 +174,64 @@ def create_tracking_tab(username_state, project_dir_state):
             
             points.append([x, y])
             labels.append(label)
+            obj_ids.append(obj_id)
             
             # C. Render Visual Feedback (Draw points on the image)
             # We pass mask=None so it only draws the points
-            marked_img = render_preview(frame0_path, mask=None, points=points, labels=labels)
+            marked_img = render_preview(frame0_path, mask=None, points=points, labels=labels, obj_ids=obj_ids)
             
-            return points, labels, format_points_text(points, labels), gr.update(visible=False), marked_img
+            return points, labels, obj_ids, format_points_text(points, labels, obj_ids), gr.update(visible=False), marked_img
 
         input_image.select(
             on_select,
-            inputs=[current_frame0_path, point_type, points_state, labels_state],
-            outputs=[points_state, labels_state, points_info, warning_msg, input_image] # Updates input_image
+            inputs=[current_frame0_path, point_type, object_id_input, points_state, labels_state, obj_ids_state],
+            outputs=[points_state, labels_state, obj_ids_state, points_info, warning_msg, input_image] # Updates input_image
         )
 
         # 4. Undo Logic
-        def undo(frame0_path, points, labels):
+        def undo(frame0_path, points, labels, obj_ids):
             if points: points.pop()
             if labels: labels.pop()
+            if obj_ids: obj_ids.pop()
             
             # Re-render image with remaining points
             if not points:
                 # If no points left, just load the clean original image
                 marked_img = Image.open(frame0_path) if frame0_path else None
             else:
-                marked_img = render_preview(frame0_path, mask=None, points=points, labels=labels)
+                marked_img = render_preview(frame0_path, mask=None, points=points, labels=labels, obj_ids=obj_ids)
                 
-            return points, labels, format_points_text(points, labels), gr.update(visible=False), marked_img
+            return points, labels, obj_ids, format_points_text(points, labels, obj_ids), gr.update(visible=False), marked_img
 
         undo_btn.click(
             undo, 
-            inputs=[current_frame0_path, points_state, labels_state], 
-            outputs=[points_state, labels_state, points_info, warning_msg, input_image]
+            inputs=[current_frame0_path, points_state, labels_state, obj_ids_state], 
+            outputs=[points_state, labels_state, obj_ids_state, points_info, warning_msg, input_image]
         )
         
         # 5. Clear Logic
         def clear(frame0_path):
             # Load clean original image
             clean_img = Image.open(frame0_path) if frame0_path else None
-            return [], [], format_points_text([], []), gr.update(visible=False), clean_img
+            return [], [], [], format_points_text([], [], []), gr.update(visible=False), clean_img
             
         clear_btn.click(
             clear, 
             inputs=[current_frame0_path],
-            outputs=[points_state, labels_state, points_info, warning_msg, input_image]
+            outputs=[points_state, labels_state, obj_ids_state, points_info, warning_msg, input_image]
         )
 
         # 6. Preview Mask Logic
-        def run_preview(frame0, points, labels):
+        def run_preview(user, proj_dir, frame0, points, labels, obj_ids, memory_profile):
             if not frame0 or not points:
                 return None, "Please select points first."
             
             try:
-                mask = tracker_model.get_first_frame_mask(points, labels)
-                # Render Preview: Image + Mask + Points
-                preview_img = render_preview(frame0, mask, points, labels)
+                with tracking_sessions.session(user, proj_dir) as tracker:
+                    prepare_session(tracker, proj_dir, memory_profile)
+                    masks = tracker.get_first_frame_mask(points, labels, obj_ids)
+                # Render Preview: Image + Masks (one color per object) + Points
+                preview_img = render_preview(frame0, masks, points, labels, obj_ids=obj_ids)
                 return preview_img, "Preview generated successfully."
             except Exception as e:
                 import traceback
@@ -193,74 +240,78 @@ def create_tracking_tab(username_state, project_dir_state):
 
         preview_btn.click(
             run_preview,
-            inputs=[current_frame0_path, points_state, labels_state],
+            inputs=[username_state, project_dir_state, current_frame0_path, points_state, labels_state, obj_ids_state, memory_profile_input],
             outputs=[preview_output, status_output]
         )
 
-        # 7. Full Inference Logic
-        def run_full_inference(proj_dir, points, labels):
+        # 7. Full Inference: queued as a background job
+        def run_full_inference(user, proj_dir, points, labels, obj_ids, memory_profile):
             if not proj_dir or not points:
                 return "Error: Missing project or points."
             
-            frames_dir = os.path.join(proj_dir, "frames")
-            masks_dir = os.path.join(proj_dir, "masks")
-            metadata_path = os.path.join(proj_dir, "metadata", "metadata.json")
-            
-            fps = 30
-            # Update Metadata with points
-            if os.path.exists(metadata_path):
-                try:
-                    with open(metadata_path, "r") as f:
-                        meta = json.load(f)
-                        fps = meta.get("fps", 30)
-                    
-                    # Save structured points for better readability
-                    # e.g. [{"x": 100, "y": 200, "type": "positive"}, ...]
-                    structured_points = []
-                    for p, l in zip(points, labels):
-                        structured_points.append({
-                            "x": p[0],
-                            "y": p[1],
-                            "type": "positive" if l == 1 else "negative"
-                        })
-                    meta["points"] = structured_points
-                    
-                    # Remove legacy fields if they exist
-                    if "labels" in meta:
-                        del meta["labels"]
-                    if "points_details" in meta:
-                        del meta["points_details"]
-                    
-                    with open(metadata_path, "w") as f:
-                        json.dump(meta, f, indent=4)
-                except Exception as e:
-                    print(f"Error updating metadata: {e}")
-            
-            try:
-                trajectory = tracker_model.propagate(frames_dir, masks_dir, points, labels)
-                generate_video_and_trajectory(proj_dir, trajectory, fps=fps)
-                return "Inference & Video Generation Complete! Check 'Results' tab."
-            except RuntimeError as e:
-                # Catch CUDA OOM or other runtime errors
-                err_msg = str(e)
-                if "out of memory" in err_msg.lower():
-                    return (
-                        f"❌ CUDA Out of Memory Error!\n\n"
-                        f"Details: {err_msg}\n\n"
-                        f"Suggestion: The video resolution or frame count might be too high for your GPU.\n"
-                        f"Please go back to the 'Video Processing' tab and try:\n"
-                        f"1. Reducing the FPS (e.g., to 0.5 or lower).\n"
-                        f"2. Reducing the Quality (e.g., to 5 or higher q-scale).\n"
-                        f"3. Re-process the video to generate fewer/smaller frames."
-                    )
-                return f"Runtime Error: {err_msg}"
-            except Exception as e:
-                import traceback
-                traceback.print_exc()
-                return f"Inference Failed: {str(e)}"
+            job_id = job_queue.submit(user, proj_dir, points, labels, obj_ids, memory_profile)
+            position = job_queue.queue_position(job_id)
+            return (
+                f"Job {job_id} queued (position {position}).\n"
+                f"Follow its progress below; it keeps running if you close or refresh the page."
+            )
 
         run_btn.click(
             run_full_inference,
-            inputs=[project_dir_state, points_state, labels_state],
+            inputs=[username_state, project_dir_state, points_state, labels_state, obj_ids_state, memory_profile_input],
             outputs=[status_output]
-        )
\ No newline at end of file
+        )
+
+        # 8. Jobs Panel
+        def refresh_jobs(user):
+            rows = []
+            for job in job_queue.list_jobs(user):
+                progress = job["progress"]
+                running = job["status"] == "running"
+                rows.append([
+                    job["id"],
+                    job["project"],
+                    job["status"],
+                    f"{progress['done']}/{progress['total']}" if progress["total"] else "-",
+                    progress["fps"] if running and progress["fps"] else "-",
+                    f"{progress['eta']:.0f}s" if running and progress["eta"] is not None else "-",
+                    job["message"].splitlines()[0] if job["message"] else ""
+                ])
+            return rows
+        
+        jobs_timer.tick(refresh_jobs, inputs=username_state, outputs=jobs_table)
+        tab.select(refresh_jobs, inputs=username_state, outputs=jobs_table)
+        
+        def cancel_job(user, job_id):
+            job_id = (job_id or "").strip()
+            if not any(job["id"] == job_id for job in job_queue.list_jobs(user)):
+                return f"Error: No job '{job_id}' for this user.", refresh_jobs(user)
+            if job_queue.cancel(job_id):
+                return f"Cancelling job {job_id}...", refresh_jobs(user)
+            return f"Job {job_id} has already finished.", refresh_jobs(user)
+        
+        cancel_job_btn.click(cancel_job, inputs=[username_state, cancel_job_input], outputs=[jobs_status, jobs_table])
+        
+        def queue_batch(user, proj_names, memory_profile):
+            if not user or not proj_names:
+                return "Please select projects to queue.", refresh_jobs(user)
+            queued, skipped = [], []
+            for proj_name in proj_names:
+                proj_dir = os.path.join(RESULTS_ROOT, user, proj_name)
+                points, labels, obj_ids = load_saved_points(proj_dir)
+                if not points:
+                    skipped.append(proj_name)
+                    continue
+                queued.append(job_queue.submit(user, proj_dir, points, labels, obj_ids, memory_profile))
+            msg = f"Queued {len(queued)} job(s)."
+            if skipped:
+                msg += f" Skipped (no saved points): {', '.join(skipped)}"
+            return msg, refresh_jobs(user)
+        
+        batch_btn.click(queue_batch, inputs=[username_state, batch_projects, memory_profile_input], outputs=[jobs_status, jobs_table])
+        
+        def refresh_batch_list(user):
+            return gr.Dropdown(choices=get_user_projects(user))
+        
+        refresh_proj_btn.click(refresh_batch_list, inputs=username_state, outputs=batch_projects)
+        tab.select(refresh_batch_list, inputs=username_state, outputs=batch_projects)
\ No newline at end of file
@@ -2,6 +2,8 @@
 import gradio as gr
 import os
 from logic.video_processor import create_project_folder, run_ffmpeg_cutting
+from logic.session_manager import tracking_sessions
+from tabs.gallery import PagedGallery
 from config import VIDEO_UPLOAD_DIR
 
 def get_video_files():
@@ -92,7 +94,7 @@ def create_video_tab(username_state, project_dir_state):
         # --- UI Section 5: Results Display ---
         with gr.Accordion("Video Preview & Extracted Frames", open=True):
             video_preview = gr.Video(label="Original Video Preview", interactive=False)
-            frames_gallery = gr.Gallery(label="Extracted Frames", columns=6, height="auto", object_fit="contain")
+            frames_gallery = PagedGallery(label="Extracted Frames")
             
         msg_output = gr.Textbox(label="Status Message", lines=3, interactive=False)
 
@@ -167,11 +169,11 @@ def create_video_tab(username_state, project_dir_state):
             try:
                 frames, frames_path, proj_path = run_ffmpeg_cutting(user, full_video_path, track_obj, fps, start, end, q)
                 proj_name = os.path.basename(proj_path)
+                # Tracking sessions on the old frames of this project are stale now
+                tracking_sessions.close_project(proj_path)
                 
-                # Convert frames list to (image, caption) tuples for Gallery
-                gallery_data = [(f, f"Frame {i}") for i, f in enumerate(frames)]
-                
-                return gallery_data, f"✅ Processing Complete!\nProject: `{proj_name}`\nFrames saved at: {frames_path}", proj_path
+                # The gallery only waits for the background JPEG writes of the page it shows
+                return *frames_gallery.show(frames), f"✅ Processing Complete!\nProject: `{proj_name}`\nFrames saved at: {frames_path}", proj_path
             except Exception as e:
                 import traceback
                 traceback.print_exc()
@@ -206,5 +208,5 @@ def create_video_tab(username_state, project_dir_state):
         ).then(
             run_processing,
             inputs=[username_state, video_dropdown, object_dropdown, fps_slider, quality_input, start_time, end_time],
-            outputs=[frames_gallery, msg_output, project_dir_state]
+            outputs=[*frames_gallery.outputs, msg_output, project_dir_state]
         )
\ No newline at end of file
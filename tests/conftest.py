@@ -0,0 +1,58 @@
+# tests/conftest.py
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+from fractions import Fraction
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+# Every output location of the pipeline points into a scratch folder (before logic/ is imported)
+_work_dir = tempfile.mkdtemp(prefix="sam2vis_tests_")
+config.RESULTS_ROOT = os.path.join(_work_dir, "results")
+config.VIDEO_UPLOAD_DIR = os.path.join(_work_dir, "videos")
+config.JOBS_DIR = os.path.join(_work_dir, "jobs")
+config.CATALOG_PATH = os.path.join(_work_dir, "catalog.sqlite3")
+config.FRAME_CACHE_DIR = os.path.join(_work_dir, "frame_cache")
+for path in [config.RESULTS_ROOT, config.VIDEO_UPLOAD_DIR, config.JOBS_DIR]:
+    os.makedirs(path, exist_ok=True)
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_work_dir, ignore_errors=True)
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None,
+                                     reason="FFmpeg is not installed")
+
+SOURCE_RATE = Fraction(30000, 1001)  # NTSC: none of the tested output rates divides it evenly
+SOURCE_SECONDS = 45
+
+def frame_numbers(frames):
+    """The source frame number drawn by write_numbered_video into each RGB frame."""
+    return [sum(1 << b for b in range(16) if frame[(b // 4) * 16 + 8, (b % 4) * 16 + 8, 0] > 127) for frame in frames]
+
+def write_numbered_video(path, rate=SOURCE_RATE, seconds=SOURCE_SECONDS):
+    """64x64 H.264 clip whose frame i shows the bits of i as a 4x4 grid of black/white blocks."""
+    cmd = ["ffmpeg", "-v", "error", "-y", "-f", "rawvideo", "-pix_fmt", "gray", "-s", "64x64",
+           "-framerate", f"{rate.numerator}/{rate.denominator}", "-i", "pipe:0",
+           "-c:v", "libx264", "-g", "50", "-crf", "12", "-pix_fmt", "yuv420p", path]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    for i in range(int(rate * seconds)):
+        frame = np.zeros((64, 64), dtype=np.uint8)
+        for b in range(16):
+            if i >> b & 1:
+                frame[(b // 4) * 16:(b // 4) * 16 + 16, (b % 4) * 16:(b % 4) * 16 + 16] = 255
+        proc.stdin.write(frame.tobytes())
+    proc.stdin.close()
+    assert proc.wait() == 0
+
+@pytest.fixture(scope="session")
+def numbered_video():
+    """write_numbered_video() in the uploads folder, so projects can be cut from it."""
+    path = os.path.join(config.VIDEO_UPLOAD_DIR, "numbered.mp4")
+    write_numbered_video(path)
+    return path
@@ -0,0 +1,37 @@
+# tests/test_artifact_cache.py
+import os
+import time
+from logic.artifact_cache import ArtifactCache, temp_artifact_path, TEMP_FILE_MAX_AGE
+
+def make_project(tmp_path):
+    project_dir = tmp_path / "project"
+    (project_dir / "metadata").mkdir(parents=True)
+    (project_dir / "trajectories").mkdir()
+    csv_path = project_dir / "trajectories" / "trajectory.csv"
+    csv_path.write_text("frame,x,y\n")
+    plot_path = project_dir / "trajectories" / "trajectory_white_bg.png"
+    plot_path.write_bytes(b"png")
+    cache = ArtifactCache(str(project_dir))
+    cache.record("plot_white_bg", str(plot_path), "key", [str(csv_path)])
+    return cache, str(plot_path)
+
+def test_temp_paths_are_unique(tmp_path):
+    cache, plot_path = make_project(tmp_path)
+    first, second = temp_artifact_path(plot_path), temp_artifact_path(plot_path)
+    assert first != second
+    for path in [first, second]:
+        assert os.path.exists(path)
+        assert os.path.dirname(path) == os.path.dirname(plot_path)
+        assert os.path.basename(path).startswith(".tmp_") and path.endswith(".png")
+
+def test_cleanup_keeps_temp_files_of_running_builds(tmp_path):
+    cache, plot_path = make_project(tmp_path)
+    running = temp_artifact_path(plot_path)
+    interrupted = temp_artifact_path(plot_path)
+    old = time.time() - TEMP_FILE_MAX_AGE - 60
+    os.utime(interrupted, (old, old))
+
+    cache.cleanup()
+    assert os.path.exists(running)
+    assert not os.path.exists(interrupted)
+    assert os.path.exists(plot_path)
@@ -0,0 +1,43 @@
+# tests/test_catalog.py
+import os
+import logic.catalog as catalog_module
+from logic.catalog import ProjectCatalog, DISK_USAGE_UNKNOWN
+
+def make_project(results_root, name, size):
+    project_dir = os.path.join(results_root, "user", name)
+    os.makedirs(os.path.join(project_dir, "frames"))
+    with open(os.path.join(project_dir, "frames", "00000.jpg"), "wb") as f:
+        f.write(b"\0" * size)
+    return project_dir
+
+def test_disk_usage_is_measured_lazily(tmp_path, monkeypatch):
+    results_root = str(tmp_path / "results")
+    catalog = ProjectCatalog(db_path=str(tmp_path / "catalog.sqlite3"), results_root=results_root)
+    small, large = make_project(results_root, "small", 1000), make_project(results_root, "large", 5000)
+
+    walked = []
+    disk_usage = catalog_module._disk_usage
+    monkeypatch.setattr(catalog_module, "_disk_usage", lambda folder: walked.append(folder) or disk_usage(folder))
+
+    # Cutting / tracking refresh the row without walking the folder
+    catalog.refresh_project(small)
+    catalog.refresh_project(large)
+    assert walked == []
+    assert catalog.get(small)["disk_bytes"] == DISK_USAGE_UNKNOWN
+
+    # Listing measures the requested unknown sizes once
+    assert catalog.measure_disk_usage([small]) == 1
+    assert catalog.get(small)["disk_bytes"] == 1000
+    assert catalog.get(large)["disk_bytes"] == DISK_USAGE_UNKNOWN
+    assert catalog.measure_disk_usage([small, large]) == 1
+    assert walked == [small, large]
+    assert [p["name"] for p in catalog.list_projects(sort="disk usage")] == ["large", "small"]
+
+    # A change makes the size unknown again
+    with open(os.path.join(small, "frames", "00001.jpg"), "wb") as f:
+        f.write(b"\0" * 9000)
+    catalog.refresh_project(small)
+    assert catalog.get(small)["disk_bytes"] == DISK_USAGE_UNKNOWN
+    catalog.measure_disk_usage([small, large])
+    assert catalog.get(small)["disk_bytes"] == 10000
+    assert walked == [small, large, small]
@@ -0,0 +1,60 @@
+# tests/test_feature_cache.py
+import os
+import numpy as np
+import torch
+from logic.feature_cache import FeatureCache, install_feature_cache
+from logic.tracker import SAM2Tracker
+from benchmarks.fake_predictor import FakeVideoPredictor
+
+def levels(value):
+    """FPN levels of one frame: 3 * 4 * 4 + 3 * 2 * 2 = 60 values, 120 bytes in float16."""
+    return [torch.full((1, 3, 4, 4), float(value)), torch.full((1, 3, 2, 2), float(value))]
+
+def test_entries_are_read_back_by_frame_index(tmp_path):
+    cache = FeatureCache(str(tmp_path), "model", "cut")
+    assert cache.get(0, "cpu") is None
+    for frame_idx in range(3):
+        cache.put(frame_idx, levels(frame_idx), num_frames=3)
+
+    cache = FeatureCache(str(tmp_path), "model", "cut")
+    fpn = cache.get(2, "cpu")
+    assert [tuple(level.shape) for level in fpn] == [(1, 3, 4, 4), (1, 3, 2, 2)]
+    assert fpn[0].dtype == torch.float32 and (fpn[1] == 2).all()
+    assert cache.get(3, "cpu") is None
+
+def test_cache_is_cleared_for_another_cut_or_model(tmp_path):
+    FeatureCache(str(tmp_path), "model", "cut").put(0, levels(1), num_frames=1)
+    assert FeatureCache(str(tmp_path), "model", "cut").get(0, "cpu") is not None
+    assert FeatureCache(str(tmp_path), "model", "re-cut").get(0, "cpu") is None
+    assert os.listdir(str(tmp_path)) == []
+    FeatureCache(str(tmp_path), "model", "cut").put(0, levels(1), num_frames=1)
+    assert FeatureCache(str(tmp_path), "other model", "cut").get(0, "cpu") is None
+
+def test_clips_larger_than_the_budget_are_not_cached(tmp_path):
+    cache = FeatureCache(str(tmp_path), "model", "cut", max_bytes=120 * 10)
+    cache.put(0, levels(0), num_frames=11)
+    assert cache.skipped and cache.get(0, "cpu") is None
+    cache = FeatureCache(str(tmp_path), "model", "cut", max_bytes=120 * 10)
+    cache.put(0, levels(0), num_frames=10)
+    assert cache.get(0, "cpu") is not None
+
+def test_second_session_reads_every_frame_from_the_cache(tmp_path):
+    project_dir = tmp_path / "project"
+    (project_dir / "metadata").mkdir(parents=True)
+    (project_dir / "metadata" / "metadata.json").write_text('{"fps": 5}')
+    frames_dir, masks_dir = str(project_dir / "frames"), str(project_dir / "masks")
+    frames = [np.full((16, 16, 3), i, dtype=np.uint8) for i in range(6)]
+
+    predictor = FakeVideoPredictor(image_size=32)
+    install_feature_cache(predictor)
+    encoded = []
+    forward_image = predictor.forward_image
+    predictor.forward_image = lambda image: encoded.append(image) or forward_image(image)
+
+    tracker = SAM2Tracker(predictor=predictor)
+    for _ in range(2):
+        tracker.init_session(frames_dir, frames=frames, feature_cache_dir=str(project_dir / "feature_cache"))
+        tracker.propagate(frames_dir, masks_dir, [[8, 8]], [1], write_jpegs=False)
+    tracker.close()
+    assert len(encoded) == len(frames)
+    assert len(os.listdir(project_dir / "feature_cache")) == len(frames) + 1  # Entries and layout.json
@@ -0,0 +1,90 @@
+# tests/test_frame_cache.py
+import os
+import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from logic.frame_cache import FrameSetCache
+
+def make_project(root, name, num_frames=0):
+    """A project folder with num_frames frame JPEGs (and their thumbnails) and no cached set."""
+    project_dir = os.path.join(root, name)
+    frames_dir = os.path.join(project_dir, "frames")
+    os.makedirs(os.path.join(frames_dir, "thumbs"))
+    for i in range(num_frames):
+        for path in [os.path.join(frames_dir, f"{i:05d}.jpg"), os.path.join(frames_dir, "thumbs", f"{i:05d}.webp")]:
+            with open(path, "wb") as f:
+                f.write(bytes([i]) * 100)
+    return project_dir, frames_dir
+
+def test_key_follows_the_parameters(tmp_path):
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"video")
+    cache = FrameSetCache(str(tmp_path / "cache"))
+    key = cache.key(str(video), 5, "1", "10")
+    assert cache.key(str(video), 5.0, "0:01", "10") == key
+    assert cache.key(str(video), 5, "1", None) != key
+    assert cache.key(str(video), 5, "1", "10", frame_source="jpeg") != key
+    video.write_bytes(b"other video")
+    assert cache.key(str(video), 5, "1", "10") != key
+
+def test_set_lives_while_a_project_uses_it(tmp_path):
+    cache = FrameSetCache(str(tmp_path / "cache"))
+    first, first_frames = make_project(str(tmp_path), "first", num_frames=3)
+    second, second_frames = make_project(str(tmp_path), "second")
+    third, third_frames = make_project(str(tmp_path), "third")
+
+    assert cache.lookup("k") is None
+    cache.adopt("k", first_frames, first, params={"fps": 5})
+    assert cache.lookup("k")["num_frames"] == 3
+    assert cache.link_into("k", second_frames, second) == 3
+    cache.link_into("k", third_frames, third)
+    cache.link_into("k", third_frames, third)  # Linked again (e.g. re-cut): still one reference
+    assert cache.lookup("k")["refs"] == [first, second, third]
+
+    # Hardlinks: the project's JPEGs and thumbnails are the cached files
+    cached = os.path.join(str(tmp_path / "cache"), "k", "frames")
+    assert os.path.samefile(os.path.join(second_frames, "00002.jpg"), os.path.join(cached, "00002.jpg"))
+    assert os.path.samefile(os.path.join(second_frames, "thumbs", "00002.webp"), os.path.join(cached, "thumbs", "00002.webp"))
+
+    # Deleting a project folder leaves the set intact
+    shutil.rmtree(first)
+    assert os.path.exists(os.path.join(cached, "00000.jpg"))
+
+    cache.release(second, "k")
+    # The deleted project's reference is dropped along the way
+    assert cache.lookup("k")["refs"] == [third]
+    cache.release(second, "k")  # Releasing twice changes nothing
+    assert cache.lookup("k")["refs"] == [third]
+
+    cache.release(third, "k")
+    assert cache.lookup("k") is None
+    assert not os.path.exists(os.path.join(str(tmp_path / "cache"), "k"))
+    # The last project keeps its frames
+    assert len(os.listdir(third_frames)) == 4
+    cache.release(third, "k")  # Unknown set: nothing to do
+
+def test_release_project_reads_the_key_from_metadata(tmp_path):
+    cache = FrameSetCache(str(tmp_path / "cache"))
+    project, frames_dir = make_project(str(tmp_path), "project", num_frames=2)
+    cache.adopt("k", frames_dir, project)
+    os.makedirs(os.path.join(project, "metadata"))
+    with open(os.path.join(project, "metadata", "metadata.json"), "w") as f:
+        f.write('{"frame_cache_key": "k"}')
+    assert cache.project_key(project) == "k"
+    cache.release_project(project)
+    assert cache.lookup("k") is None
+
+def adopt_in_process(cache_dir, root, name):
+    project, frames_dir = make_project(root, name, num_frames=20)
+    FrameSetCache(cache_dir).adopt("k", frames_dir, project)
+    return project
+
+def test_processes_adopting_the_same_set_keep_every_reference(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    with ProcessPoolExecutor(max_workers=4, mp_context=multiprocessing.get_context("spawn")) as executor:
+        projects = list(executor.map(adopt_in_process, [cache_dir] * 8, [str(tmp_path)] * 8, [f"p{i}" for i in range(8)]))
+    cache = FrameSetCache(cache_dir)
+    assert sorted(cache.lookup("k")["refs"]) == sorted(projects)
+    assert len(os.listdir(os.path.join(cache_dir, "k", "frames"))) == 21  # 20 frames and thumbs/
+    # No staging folders left behind
+    assert sorted(os.listdir(cache_dir)) == ["k", "k.lock"]
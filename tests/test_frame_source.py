@@ -0,0 +1,98 @@
+# tests/test_frame_source.py
+import os
+import math
+from fractions import Fraction
+import numpy as np
+import pytest
+from PIL import Image
+from conftest import requires_ffmpeg, frame_numbers, SOURCE_RATE
+import logic.frame_source as frame_source
+from logic.frame_source import (parse_timestamp, plan_segments, read_frames_ffmpeg, decode_segment, fits_in_memory,
+                                cache_frames, get_cached_frames, drop_cached_frames, write_frames_async,
+                                wait_for_frames, GRID_TOLERANCE)
+from logic.video_processor import extract_jpeg_segments, remove_segment_dirs
+
+START, END = "1.37", "44"
+
+@pytest.mark.parametrize("value, seconds", [
+    (None, None), ("", None), ("  ", None), (0, 0.0), ("12", 12.0), (" 7.5 ", 7.5),
+    ("01:02", 62.0), ("1:02:03.5", 3723.5), ("0:00.25", 0.25), (3.2, 3.2),
+])
+def test_parse_timestamp(value, seconds):
+    assert parse_timestamp(value) == seconds
+
+def test_parse_timestamp_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_timestamp("1:xx")
+
+def test_plan_segments_single_process_for_short_ranges():
+    assert len(plan_segments("unused.mp4", 30, "10", "20", segments=8, min_segment_seconds=30)) == 1
+    assert len(plan_segments("unused.mp4", 30, "10", "100", segments=1)) == 1
+
+def test_plan_segments_splits_long_ranges():
+    plan = plan_segments("unused.mp4", 30, "0", "120", segments=8, min_segment_seconds=30)
+    assert len(plan) == 4
+    # Every segment but the last is capped at a quarter of the 3600 frames (plus its dropped lead-in)
+    for input_args, output_args, skip in plan[:-1]:
+        assert output_args[output_args.index("-frames:v") + 1] == str(900 + skip)
+
+def test_fits_in_memory(monkeypatch):
+    monkeypatch.setattr(frame_source, "PROPAGATION_WINDOW", 120)
+    monkeypatch.setattr(frame_source, "FRAME_MEMORY_BUDGET_MB", 100)
+    assert fits_in_memory(120, (320, 240))
+    assert not fits_in_memory(121, (320, 240))   # Longer than one propagation window
+    assert not fits_in_memory(20, (1920, 1080))  # 20 * 6 MB over the budget
+    monkeypatch.setattr(frame_source, "PROPAGATION_WINDOW", None)
+    assert fits_in_memory(1000, (64, 64))
+
+def test_frame_memory_cache_stays_within_budget(monkeypatch):
+    monkeypatch.setattr(frame_source, "FRAME_MEMORY_BUDGET_MB", 1)
+    def frame_set(side):
+        return [np.zeros((side, side, 3), dtype=np.uint8)]
+    cache_frames("a", frame_set(362))  # 384 KB each
+    cache_frames("b", frame_set(362))
+    assert get_cached_frames("a") is not None  # Now the most recently used
+    cache_frames("c", frame_set(362))
+    assert get_cached_frames("b") is None
+    assert get_cached_frames("a") is not None and get_cached_frames("c") is not None
+    # A set over the budget on its own is still kept (the tracker is about to use it)
+    cache_frames("d", frame_set(1024))
+    assert [get_cached_frames(name) is None for name in "acd"] == [True, True, False]
+    drop_cached_frames("d")
+    assert get_cached_frames("d") is None
+
+def test_wait_for_first_frames(tmp_path):
+    frames = [np.full((32, 32, 3), i, dtype=np.uint8) for i in range(40)]
+    paths = write_frames_async(frames, str(tmp_path))
+    assert os.path.exists(paths[0])  # Written before returning
+    wait_for_frames(str(tmp_path), 10)
+    assert all(os.path.exists(path) for path in paths[:10])
+    wait_for_frames(str(tmp_path))
+    assert all(os.path.exists(path) for path in paths)
+
+@requires_ffmpeg
+def test_frames_follow_the_time_grid(numbered_video):
+    """Frame i is the source frame on screen at start + i / fps."""
+    fps = Fraction("4.3")
+    numbers = frame_numbers(read_frames_ffmpeg(numbered_video, 4.3, START, END))
+    start = Fraction(START)
+    assert len(numbers) == math.ceil((Fraction(END) - start) * fps)
+    assert numbers == [math.floor((start + (i + GRID_TOLERANCE) / fps) * SOURCE_RATE) for i in range(len(numbers))]
+
+@requires_ffmpeg
+@pytest.mark.parametrize("fps", [0.3, 0.7, 4.3, 10, 29.9, 29.97, 60])
+def test_segmented_decode_matches_single_pass(numbered_video, fps):
+    single = frame_numbers(read_frames_ffmpeg(numbered_video, fps, START, END))
+    plan = plan_segments(numbered_video, fps, START, END, segments=4, min_segment_seconds=1)
+    assert len(plan) > 1
+    segmented = [n for segment in plan for n in frame_numbers(decode_segment(numbered_video, fps, segment))]
+    assert segmented == single
+
+@requires_ffmpeg
+def test_segmented_jpegs_match_single_pass(numbered_video, tmp_path):
+    single = frame_numbers(read_frames_ffmpeg(numbered_video, 29.97, START))
+    plan = plan_segments(numbered_video, 29.97, START, None, segments=3, min_segment_seconds=1)
+    parts = extract_jpeg_segments(numbered_video, str(tmp_path), 2, plan)
+    segmented = [n for part in parts for n in frame_numbers(np.asarray(Image.open(path).convert("RGB")) for path in part)]
+    remove_segment_dirs(str(tmp_path))
+    assert segmented == single
@@ -0,0 +1,73 @@
+# tests/test_mask_store.py
+import os
+import json
+import numpy as np
+import pytest
+from logic.mask_store import MaskStore, LegacyMaskStore, open_mask_store, pack_mask
+
+HEIGHT, WIDTH = 36, 50  # Width not a multiple of 8
+
+def disk(frame_idx, obj_id):
+    ys, xs = np.mgrid[:HEIGHT, :WIDTH]
+    return (xs - 10 - frame_idx % 30) ** 2 + (ys - 8 * obj_id) ** 2 < 49
+
+def test_round_trip(tmp_path):
+    store_dir = str(tmp_path / "mask_store")
+    store = MaskStore.create(store_dir, [1, 3], 40, HEIGHT, WIDTH, chunk_frames=16)
+    for frame_idx in range(40):
+        store.write(1, frame_idx, disk(frame_idx, 1))
+        if frame_idx % 3 == 0:
+            store.write(3, frame_idx, disk(frame_idx, 3))
+    store.close()
+    assert sorted(os.listdir(store_dir)) == ["masks.bin", "masks.json"]
+
+    store = open_mask_store(store_dir)
+    assert isinstance(store, MaskStore)
+    assert store.obj_ids == [1, 3]
+    assert store.frame_indices(1) == list(range(40))
+    assert store.frame_indices(3) == list(range(0, 40, 3))
+    assert store.frame_indices() == list(range(40))
+    for frame_idx in [39, 0, 17, 16, 5]:  # Random access, including the short last chunk
+        assert np.array_equal(store.read(1, frame_idx), disk(frame_idx, 1))
+    assert np.array_equal(store.read(3, 33), disk(33, 3))
+    assert not store.has_frame(3, 34)
+    with pytest.raises(KeyError):
+        store.read(3, 34)
+    store.close()
+
+def test_chunk_written_again(tmp_path):
+    store_dir = str(tmp_path / "mask_store")
+    store = MaskStore.create(store_dir, [1], 20, HEIGHT, WIDTH, chunk_frames=8)
+    for frame_idx in [0, 1, 9, 2]:  # Back to the first chunk after it was written out
+        store.write(1, frame_idx, disk(frame_idx, 1))
+    store.close()
+    store = MaskStore(store_dir)
+    assert store.frame_indices(1) == [0, 1, 2, 9]
+    for frame_idx in [0, 1, 2, 9]:
+        assert np.array_equal(store.read(1, frame_idx), disk(frame_idx, 1))
+
+def test_create_replaces_previous_stores(tmp_path):
+    store_dir = tmp_path / "mask_store"
+    store_dir.mkdir()
+    np.save(store_dir / "obj_2.npy", np.zeros((1, HEIGHT, 7), dtype=np.uint8))
+    (store_dir / "obj_2.json").write_text(json.dumps({"num_frames": 1, "height": HEIGHT, "width": WIDTH, "frames": [0]}))
+    MaskStore.create(str(store_dir), [1], 4, HEIGHT, WIDTH).close()
+    assert sorted(os.listdir(store_dir)) == ["masks.bin", "masks.json"]
+    assert MaskStore(str(store_dir)).obj_ids == [1]
+
+def test_reads_version_1_stores(tmp_path):
+    store_dir = tmp_path / "mask_store"
+    store_dir.mkdir()
+    packed = np.stack([pack_mask(disk(i, 2)) for i in range(3)])
+    np.save(store_dir / "obj_2.npy", packed)
+    (store_dir / "obj_2.json").write_text(json.dumps({"num_frames": 3, "height": HEIGHT, "width": WIDTH, "frames": [0, 2]}))
+
+    store = open_mask_store(str(store_dir))
+    assert isinstance(store, LegacyMaskStore)
+    assert store.obj_ids == [2]
+    assert store.frame_indices() == [0, 2]
+    assert np.array_equal(store.read(2, 2), disk(2, 2))
+    assert not store.has_frame(2, 1)
+
+def test_no_store(tmp_path):
+    assert open_mask_store(str(tmp_path / "mask_store")) is None
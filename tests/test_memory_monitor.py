@@ -0,0 +1,33 @@
+# tests/test_memory_monitor.py
+import time
+import numpy as np
+import torch
+from logic.memory_monitor import PeakMemoryMonitor
+
+def test_rss_peak_covers_the_block():
+    with PeakMemoryMonitor(interval=0.01) as monitor:
+        block = np.ones(64 * 2**20, dtype=np.uint8)  # 64 MB, touched
+        time.sleep(0.05)
+        del block
+    summary = monitor.summary()
+    assert summary["peak_rss_mb"] >= 64
+    assert summary["peak_cuda_mb"] is None
+
+def test_cuda_peak_is_sampled_per_monitor(monkeypatch):
+    allocated = {"bytes": 100 * 2**20}
+
+    def reset_peak_memory_stats(device=None):
+        raise AssertionError("the global peak counters must not be reset")
+
+    monkeypatch.setattr(torch.cuda, "memory_allocated", lambda device=None: allocated["bytes"])
+    monkeypatch.setattr(torch.cuda, "reset_peak_memory_stats", reset_peak_memory_stats)
+
+    outer = PeakMemoryMonitor(torch.device("cuda"), interval=0.01).start()
+    allocated["bytes"] = 300 * 2**20
+    time.sleep(0.05)
+    allocated["bytes"] = 150 * 2**20
+    # A stage starting later (e.g. another job's) only sees what is allocated from then on
+    inner = PeakMemoryMonitor(torch.device("cuda"), interval=0.01).start()
+    time.sleep(0.05)
+    assert inner.stop()["peak_cuda_mb"] == 150
+    assert outer.stop()["peak_cuda_mb"] == 300
@@ -0,0 +1,32 @@
+# tests/test_session_manager.py
+import json
+import os
+from PIL import Image
+from logic.session_manager import prepare_session
+from logic.tracker import SAM2Tracker
+from benchmarks.fake_predictor import FakeVideoPredictor
+
+def cut_project(project_dir, num_frames):
+    """Stands in for run_ffmpeg_cutting: num_frames JPEGs and a rewritten metadata.json."""
+    frames_dir = os.path.join(project_dir, "frames")
+    os.makedirs(frames_dir, exist_ok=True)
+    os.makedirs(os.path.join(project_dir, "metadata"), exist_ok=True)
+    for name in os.listdir(frames_dir):
+        os.remove(os.path.join(frames_dir, name))
+    for i in range(num_frames):
+        Image.new("RGB", (16, 16)).save(os.path.join(frames_dir, f"{i:05d}.jpg"))
+    with open(os.path.join(project_dir, "metadata", "metadata.json"), "w") as f:
+        json.dump({"num_frames": num_frames}, f)
+
+def test_session_is_reinitialized_after_a_recut(tmp_path):
+    project_dir = str(tmp_path / "project")
+    cut_project(project_dir, 3)
+    tracker = SAM2Tracker(predictor=FakeVideoPredictor(image_size=32))
+    assert prepare_session(tracker, project_dir, "resident")
+    assert not prepare_session(tracker, project_dir, "resident")
+
+    # Re-cut while the session was held (close_project skips sessions in use)
+    cut_project(project_dir, 12)
+    assert prepare_session(tracker, project_dir, "resident")
+    assert tracker.inference_state["num_frames"] == 12
+    assert not prepare_session(tracker, project_dir, "resident")
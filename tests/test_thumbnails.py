@@ -0,0 +1,17 @@
+# tests/test_thumbnails.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from logic.thumbnails import save_thumbnail, thumbnail_path
+
+def test_concurrent_writers_of_one_thumbnail(tmp_path):
+    image_path = str(tmp_path / "00000.jpg")
+    frames = [np.full((240, 320, 3), value, dtype=np.uint8) for value in range(0, 256, 16)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        paths = list(executor.map(lambda frame: save_thumbnail(frame, image_path), frames * 4))
+    assert set(paths) == {thumbnail_path(image_path)}
+    with Image.open(paths[0]) as thumb:
+        assert max(thumb.size) <= 320
+    # Every writer replaced its own temporary file
+    assert os.listdir(os.path.dirname(paths[0])) == [os.path.basename(paths[0])]
@@ -0,0 +1,160 @@
+# tests/test_tracker.py
+import threading
+import numpy as np
+import torch
+import pytest
+from PIL import Image
+from conftest import requires_ffmpeg, frame_numbers
+import logic.frame_source as frame_source_module
+import logic.video_processor as video_processor
+from logic.frame_source import wait_for_frames, get_cached_frames, drop_cached_frames, project_frame_decoder
+from logic.tracker import (SAM2Tracker, FrameWindow, frames_to_tensor, list_frame_paths, jpeg_frame_loader, _read_rgb,
+                           compute_mask_stats, pack_mask_tensor, MASK_STAT_COLUMNS, MASK_MOMENT_COLUMNS)
+from benchmarks.fake_predictor import FakeVideoPredictor
+
+IMAGE_SIZE = 32
+
+class IndexCountingList(list):
+    """Frame list that counts the frames read from it."""
+    reads = 0
+
+    def __getitem__(self, idx):
+        self.reads += 1
+        return super().__getitem__(idx)
+
+def cut(numbered_video, monkeypatch, tracking_object, write_jpegs):
+    """Cuts 81 frames (1.37-20 s at 4.3 fps) through the pipe, with or without the frame JPEGs. Returns the decoded frames."""
+    monkeypatch.setattr(video_processor, "FRAME_CACHE", False)
+    monkeypatch.setattr(frame_source_module, "PROPAGATION_WINDOW", None)  # Keep "pipe" in memory
+    _, frames_dir, project_dir = video_processor.run_ffmpeg_cutting(
+        "tests", numbered_video, tracking_object, fps=4.3, start_time="1.37", end_time="20",
+        frame_source="pipe", write_jpegs=write_jpegs)
+    wait_for_frames(frames_dir)
+    frames = get_cached_frames(frames_dir)
+    drop_cached_frames(frames_dir)
+    return frames, frames_dir, project_dir
+
+def window_frames(images):
+    return torch.stack([images[i] for i in range(len(images))])
+
+@requires_ffmpeg
+def test_decoder_window_matches_the_cut(numbered_video, monkeypatch):
+    frames, _, project_dir = cut(numbered_video, monkeypatch, "window decoder", write_jpegs=False)
+    load_frames = project_frame_decoder(project_dir)
+    assert frame_numbers(load_frames(30, 45)) == frame_numbers(frames[30:45])
+
+    window = FrameWindow(load_frames, len(frames), IMAGE_SIZE, window_size=32)
+    assert len(window) == 81
+    assert torch.equal(window_frames(window), frames_to_tensor(frames, IMAGE_SIZE))
+
+@requires_ffmpeg
+@pytest.mark.parametrize("write_jpegs", [True, False])
+@pytest.mark.parametrize("memory_profile", ["resident", "async"])
+def test_windowed_session_never_reads_the_frame_list(numbered_video, monkeypatch, write_jpegs, memory_profile):
+    frames, frames_dir, _ = cut(numbered_video, monkeypatch, f"windowed {memory_profile} {write_jpegs}", write_jpegs)
+    frames = IndexCountingList(frames)
+    tracker = SAM2Tracker(predictor=FakeVideoPredictor(image_size=IMAGE_SIZE))
+    tracker.init_session(frames_dir, frames=frames, window_size=32, memory_profile=memory_profile)
+
+    images = tracker.inference_state["images"]
+    assert isinstance(images, FrameWindow)
+    if write_jpegs:
+        expected = [_read_rgb(path) for path in list_frame_paths(frames_dir)]
+    else:
+        expected = list(frames)
+    assert torch.equal(window_frames(images), frames_to_tensor(expected, IMAGE_SIZE))
+    assert frames.reads == 0
+
+def test_frame_window_holds_one_window():
+    loads = []
+
+    def load_frames(start, end):
+        loads.append((start, end))
+        return [torch.full((8, 8, 3), i, dtype=torch.uint8).numpy() for i in range(start, end)]
+
+    window = FrameWindow(load_frames, 10, IMAGE_SIZE, window_size=4)
+    for i in range(10):
+        window[i]
+        window[0]  # Frame 0 is kept aside
+    assert loads == [(0, 1), (0, 4), (4, 8), (8, 10)]
+    assert window.images.shape[0] == 2
+
+def test_frame_window_rejects_short_reads():
+    window = FrameWindow(lambda start, end: [torch.zeros(8, 8, 3, dtype=torch.uint8).numpy()], 10, IMAGE_SIZE, 4)
+    with pytest.raises(RuntimeError):
+        window[5]
+
+def test_jpeg_frame_loader_reads_a_range(tmp_path):
+    paths = []
+    for i in range(5):
+        path = tmp_path / f"{i:05d}.jpg"
+        Image.new("RGB", (16, 16), (i * 50, 0, 0)).save(path, quality=95)
+        paths.append(str(path))
+    frames = jpeg_frame_loader(paths)(1, 3)
+    assert len(frames) == 2
+    assert [int(frame[..., 0].mean() / 50 + 0.5) for frame in frames] == [1, 2]
+
+def reference_stats(mask):
+    """compute_mask_stats of one boolean mask, from the pixel coordinates."""
+    ys, xs = np.nonzero(mask)
+    if len(xs) == 0:
+        return [np.nan, np.nan, 0.0] + [np.nan] * 7
+    cx, cy = xs.mean(), ys.mean()
+    return [cx, cy, len(xs), xs.min(), ys.min(), xs.max(), ys.max(),
+            ((xs - cx) ** 2).mean(), ((ys - cy) ** 2).mean(), ((xs - cx) * (ys - cy)).mean()]
+
+def test_compute_mask_stats():
+    rng = np.random.default_rng(0)
+    masks = np.zeros((4, 37, 53), dtype=bool)
+    masks[0, 5:20, 10:31] = True                     # Rectangle
+    masks[1] = rng.random((37, 53)) < 0.2            # Scattered pixels
+    masks[2, 36, 52] = True                          # Single corner pixel
+    # masks[3] stays empty (object lost)
+    logits = torch.from_numpy(np.where(masks, 4.0, -4.0)).float()[:, None]
+
+    stats = compute_mask_stats(logits, moments=True)
+    assert stats.shape == (4, len(MASK_STAT_COLUMNS) + len(MASK_MOMENT_COLUMNS))
+    assert stats.dtype == torch.float64
+    expected = np.array([reference_stats(mask) for mask in masks])
+    np.testing.assert_allclose(stats.numpy(), expected, rtol=1e-9, atol=1e-9)
+    assert compute_mask_stats(logits[:, 0]).shape == (4, len(MASK_STAT_COLUMNS))
+
+@pytest.mark.parametrize("width", [1, 8, 13, 64, 1920])
+def test_pack_mask_tensor_matches_packbits(width):
+    mask = np.random.default_rng(width).random((3, 5, width)) < 0.5
+    packed = pack_mask_tensor(torch.from_numpy(mask))
+    assert packed.dtype == torch.uint8
+    np.testing.assert_array_equal(packed.numpy(), np.packbits(mask, axis=-1))
+
+def test_concurrent_sessions_keep_their_own_frames(tmp_path):
+    """A JPEG-folder session started while an in-memory one initializes still reads its own frames."""
+    frames_dir = tmp_path / "frames"
+    frames_dir.mkdir()
+    for i in range(3):
+        Image.new("RGB", (16, 16), (255, 255, 255)).save(frames_dir / f"{i:05d}.jpg", quality=95)
+    barrier = threading.Barrier(2, timeout=10)
+
+    class MeetingPredictor(FakeVideoPredictor):
+        def init_state(self, video_path, **options):
+            barrier.wait()  # Both sessions are inside init_state together
+            return super().init_state(video_path, **options)
+
+    predictor = MeetingPredictor(image_size=IMAGE_SIZE)
+    memory, jpeg = SAM2Tracker(predictor=predictor), SAM2Tracker(predictor=predictor)
+    black = [np.zeros((16, 16, 3), dtype=np.uint8)] * 3
+    thread = threading.Thread(target=memory.init_session, args=(str(frames_dir),), kwargs={"frames": black})
+    thread.start()
+    jpeg.init_session(str(frames_dir))
+    thread.join()
+    assert torch.equal(memory.inference_state["images"], frames_to_tensor(black, IMAGE_SIZE))
+    # SAM2's JPEG loader normalizes the same way (up to JPEG rounding)
+    assert jpeg.inference_state["images"].mean() > 2
+
+def test_propagate_tracks_the_whole_clip_by_default(tmp_path):
+    frames = [np.zeros((16, 16, 3), dtype=np.uint8)] * 130  # Longer than one PROPAGATION_WINDOW
+    tracker = SAM2Tracker(predictor=FakeVideoPredictor(image_size=IMAGE_SIZE))
+    tracker.init_session(str(tmp_path / "frames"), frames=frames, window_size=None)
+    trajectory = tracker.propagate(str(tmp_path / "frames"), str(tmp_path / "masks"), [[8, 8]], [1], write_jpegs=False)
+    assert len(trajectory) == 130
+    assert len(tracker.propagate(str(tmp_path / "frames"), str(tmp_path / "masks"), [[8, 8]], [1],
+                                 max_frames=50, write_jpegs=False)) == 50
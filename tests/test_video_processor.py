@@ -0,0 +1,90 @@
+# tests/test_video_processor.py
+import os
+import glob
+import numpy as np
+import pytest
+from PIL import Image
+from conftest import requires_ffmpeg, frame_numbers
+import logic.frame_source as frame_source_module
+import logic.video_processor as video_processor
+from logic.frame_source import plan_incremental, read_frames_ffmpeg, get_cached_frames, wait_for_frames, project_metadata, FRAME_GRID_VERSION
+from logic.run_metrics import load_runs
+from logic.session_manager import prepare_session
+from logic.tracker import SAM2Tracker, FrameWindow
+from benchmarks.fake_predictor import FakeVideoPredictor
+
+def previous_cut(start_time="1.37", end_time="20", num_frames=81, fps=4.3):
+    # ceil((20 - 1.37) * 4.3) = 81 frames
+    return {"fps": fps, "start_time": start_time, "end_time": end_time, "num_frames": num_frames,
+            "frame_grid": FRAME_GRID_VERSION}
+
+@pytest.mark.parametrize("previous, start_time, end_time, keep", [
+    (previous_cut(), "1.37", "30", (0, 81, 0)),                    # Longer: every previous frame kept
+    (previous_cut(), "1.37", None, (0, 81, 0)),                    # To the end of the video
+    (previous_cut(), "1.37", "10", (0, 38, 0)),                    # Shorter: ceil(8.63 * 4.3) frames
+    (previous_cut(), "0:01.37", "10", (0, 38, 0)),                 # Same start, other notation
+    (previous_cut(), "11.37", "30", (0, 38, 43)),                  # Start 10 s = 43 frames later
+    (previous_cut("11.37", "30"), "1.37", "30", (43, 124, -43)),   # Start 43 frames earlier
+])
+def test_plan_incremental_keeps_aligned_frames(previous, start_time, end_time, keep):
+    assert plan_incremental(previous, 4.3, start_time, end_time) == keep
+
+@pytest.mark.parametrize("previous, fps, start_time", [
+    (previous_cut(), 4.3, "2"),                                     # Start between two frames of the old grid
+    (previous_cut(), 4.3, "1.6"),                                   # 0.23 s = 0.989 frames
+    (previous_cut(), 5, "1.37"),                                    # Other frame rate
+    ({**previous_cut(), "frame_grid": None}, 4.3, "1.37"),          # Cut by an older version
+    (previous_cut("1.37", "2", 0), 4.3, "1.37"),                    # Nothing to keep
+    (previous_cut(), 4.3, "30"),                                    # No overlap
+])
+def test_plan_incremental_refuses_unaligned_grids(previous, fps, start_time):
+    assert plan_incremental(previous, fps, start_time, "40") is None
+
+def cut(numbered_video, frame_source, start_time, end_time):
+    frames, frames_dir, project_dir = video_processor.run_ffmpeg_cutting(
+        "tests", numbered_video, f"incremental {frame_source}", fps=4.3,
+        start_time=start_time, end_time=end_time, frame_source=frame_source)
+    wait_for_frames(frames_dir)
+    return frames, frames_dir, load_runs(project_dir)[-1]["mode"]
+
+@requires_ffmpeg
+@pytest.mark.parametrize("frame_source", ["jpeg", "pipe"])
+@pytest.mark.parametrize("first, second, mode", [
+    (("1.37", "20"), ("1.37", "30"), "incremental"),
+    (("1.37", "30"), ("1.37", "20"), "incremental"),
+    (("1.37", "20"), ("1.37", None), "incremental"),
+    (("1.37", "30"), ("11.37", "40"), "incremental"),
+    (("11.37", "30"), ("1.37", "20"), "incremental"),
+    (("1.37", "30"), ("2", "30"), "full"),
+])
+def test_incremental_recut_matches_fresh_cut(numbered_video, monkeypatch, frame_source, first, second, mode):
+    monkeypatch.setattr(video_processor, "FRAME_CACHE", False)
+    monkeypatch.setattr(frame_source_module, "PROPAGATION_WINDOW", None)  # Keep "pipe" in memory
+    cut(numbered_video, frame_source, *first)
+    frames, frames_dir, used = cut(numbered_video, frame_source, *second)
+    assert used == mode
+
+    fresh = frame_numbers(read_frames_ffmpeg(numbered_video, 4.3, *second))
+    assert sorted(glob.glob(os.path.join(frames_dir, "*.jpg"))) == frames
+    assert frame_numbers(np.asarray(Image.open(path).convert("RGB")) for path in frames) == fresh
+    if frame_source == "pipe":
+        assert frame_numbers(get_cached_frames(frames_dir)) == fresh
+
+@requires_ffmpeg
+@pytest.mark.parametrize("write_jpegs", [True, False])
+def test_pipe_leaves_long_clips_to_the_decoder(numbered_video, monkeypatch, write_jpegs):
+    monkeypatch.setattr(video_processor, "FRAME_CACHE", False)
+    monkeypatch.setattr(frame_source_module, "PROPAGATION_WINDOW", 50)
+    frames, frames_dir, project_dir = video_processor.run_ffmpeg_cutting(
+        "tests", numbered_video, f"long pipe {write_jpegs}", fps=4.3, start_time="1.37", end_time="20",
+        frame_source="pipe", write_jpegs=write_jpegs)
+    assert len(frames) == (81 if write_jpegs else 1)
+    assert get_cached_frames(frames_dir) is None
+    assert load_runs(project_dir)[-1]["frame_source"] == "pipe"
+    assert project_metadata(project_dir)["num_frames"] == 81
+    # The session decodes the clip window by window, whether or not the JPEGs were written
+    tracker = SAM2Tracker(predictor=FakeVideoPredictor(image_size=32))
+    assert prepare_session(tracker, project_dir, "resident")
+    images = tracker.inference_state["images"]
+    assert isinstance(images, FrameWindow) and len(images) == 81
+    assert frame_numbers(images.load_frames(75, 81)) == frame_numbers(read_frames_ffmpeg(numbered_video, 4.3, "1.37", "20"))[75:]
@@ -0,0 +1,101 @@
+# tests/test_visualizer.py
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from PIL import Image
+from conftest import requires_ffmpeg, frame_numbers
+import logic.frame_source as frame_source_module
+import logic.video_processor as video_processor
+import logic.visualizer as visualizer
+from logic.frame_source import wait_for_frames, get_cached_frames, drop_cached_frames
+from logic.mask_store import MaskStore
+from logic.visualizer import render_trajectory_plots, fill_trajectory_gaps
+
+NAN = np.nan
+# Lost on frames 0, 3-4 and 7 of 8
+X = [NAN, 10.0, 20.0, NAN, NAN, 50.0, 60.0, NAN]
+MISSING = [True, False, False, True, True, False, False, True]
+
+@pytest.mark.parametrize("mode, expected", [
+    ("linear", [10, 10, 20, 30, 40, 50, 60, 60]),
+    ("nearest", [10, 10, 20, 20, 50, 50, 60, 60]),
+    ("hold", [10, 10, 20, 20, 20, 50, 60, 60]),
+])
+def test_fill_trajectory_gaps(mode, expected):
+    x, y = fill_trajectory_gaps(X, [2 * v for v in X], MISSING, mode=mode)
+    np.testing.assert_array_equal(x, expected)
+    np.testing.assert_array_equal(y, [2 * v for v in expected])
+
+def test_fill_trajectory_gaps_nearest_tie_takes_previous():
+    x, _ = fill_trajectory_gaps([0.0, NAN, 10.0], [0.0, NAN, 10.0], [False, True, False], mode="nearest")
+    np.testing.assert_array_equal(x, [0, 0, 10])
+
+def test_fill_trajectory_gaps_leaves_long_gaps_empty():
+    x, _ = fill_trajectory_gaps(X, X, MISSING, mode="linear", max_gap=1)
+    np.testing.assert_array_equal(x, [10, 10, 20, NAN, NAN, 50, 60, 60])
+
+def test_fill_trajectory_gaps_edge_cases():
+    x, y = fill_trajectory_gaps([NAN, NAN], [NAN, NAN], [True, True])
+    assert np.isnan(x).all() and np.isnan(y).all()
+    x, _ = fill_trajectory_gaps([1.0, 2.0], [1.0, 2.0], [False, False])
+    np.testing.assert_array_equal(x, [1, 2])
+    assert len(fill_trajectory_gaps([], [], [])[0]) == 0
+    # The inputs are not modified
+    values = np.array(X)
+    fill_trajectory_gaps(values, values, MISSING)
+    assert np.isnan(values[0])
+    with pytest.raises(ValueError):
+        fill_trajectory_gaps(X, X, MISSING, mode="cubic")
+
+def write_trajectory(project_dir, n=40):
+    trajectories_dir = os.path.join(project_dir, "trajectories")
+    os.makedirs(trajectories_dir)
+    t = np.linspace(0, 2 * np.pi, n)
+    pd.DataFrame({"x": 320 + 100 * np.cos(t), "y": 240 + 100 * np.sin(t)}).to_csv(
+        os.path.join(trajectories_dir, "trajectory.csv"), index=False)
+    return os.path.join(trajectories_dir, "trajectory.csv")
+
+def test_plot_variants_render_on_a_spawned_pool(tmp_path):
+    csv_path = write_trajectory(str(tmp_path))
+    outputs = {str(tmp_path / f"plot_{i}.png"): (bool(i & 1), bool(i & 2)) for i in range(4)}
+    render_trajectory_plots(str(tmp_path), csv_path, outputs, workers=2)
+    pool = visualizer._process_pools["plots"][1]
+    try:
+        assert pool._mp_context.get_start_method() == "spawn"
+        for path in outputs:
+            with Image.open(path) as img:
+                assert img.format == "PNG"
+        # The pool is kept for the next render
+        render_trajectory_plots(str(tmp_path), csv_path, outputs, workers=2)
+        assert visualizer._process_pools["plots"][1] is pool
+    finally:
+        visualizer._drop_process_pool("plots", pool)
+
+@requires_ffmpeg
+def test_rerender_decodes_frames_that_were_not_written(numbered_video, monkeypatch):
+    monkeypatch.setattr(video_processor, "FRAME_CACHE", False)
+    monkeypatch.setattr(frame_source_module, "PROPAGATION_WINDOW", None)  # Keep "pipe" in memory
+    _, frames_dir, project_dir = video_processor.run_ffmpeg_cutting(
+        "tests", numbered_video, "rerender without jpegs", fps=4.3, start_time="1.37", end_time="20",
+        frame_source="pipe", write_jpegs=False)
+    wait_for_frames(frames_dir)
+    frames = get_cached_frames(frames_dir)
+    drop_cached_frames(frames_dir)
+    assert not os.path.exists(os.path.join(frames_dir, "00001.jpg"))
+
+    store = MaskStore.create(os.path.join(project_dir, "mask_store"), [1], len(frames), 64, 64)
+    for frame_idx in range(len(frames)):
+        store.write(1, frame_idx, np.zeros((64, 64), dtype=bool))
+    store.close()
+
+    monkeypatch.setattr(visualizer, "RERENDER_DECODE_FRAMES", 16)
+    try:
+        _, cached = visualizer.rerender_project(project_dir, alpha=0.0, workers=1)
+        pool = visualizer._process_pools["rerender"][1]
+        assert pool._mp_context.get_start_method() == "spawn"
+    finally:
+        visualizer._drop_process_pool("rerender", visualizer._process_pools["rerender"][1])
+    assert not cached
+    rendered = [np.asarray(Image.open(os.path.join(project_dir, "masks", f"{i:05d}.jpg"))) for i in range(len(frames))]
+    assert frame_numbers(rendered) == frame_numbers(frames)
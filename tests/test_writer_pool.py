@@ -0,0 +1,23 @@
+# tests/test_writer_pool.py
+import pytest
+from logic.writer_pool import WriterPool
+
+def test_finished_tasks_are_not_kept():
+    pool = WriterPool(num_workers=2, queue_depth=4, use_processes=False)
+    done = []
+    for i in range(100):
+        pool.submit(done.append, i)
+        assert len(pool.futures) <= 5
+    pool.close()
+    assert sorted(done) == list(range(100))
+
+def test_failure_surfaces_on_the_next_submit():
+    pool = WriterPool(num_workers=1, queue_depth=4, use_processes=False)
+
+    def fail():
+        raise OSError("disk full")
+
+    pool.submit(fail).exception()  # Wait for the task to finish
+    with pytest.raises(OSError, match="disk full"):
+        pool.submit(print)
+    pool.cancel()